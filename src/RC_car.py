@@ -1,6 +1,11 @@
+from argparse import ArgumentParser
 from PyQt5.QtWidgets import QApplication
 from main_window_qt import MainWindow
-from sys import argv, exit
+from fleet_view_qt import FleetView
+from keymap import Keymap, parse_arguments as parse_keyboard_arguments
+from channel_manager import ChannelManager
+from recorder import parse_arguments, open_session
+from sys import argv, exit, stderr
 
 
 if __name__ == "__main__":
@@ -27,48 +32,50 @@ if __name__ == "__main__":
             font-size: 18px;
         }
 
-        QPushButton[active="true"] {
-            background-color: yellow;
-        }
-
-        QPushButton#lights[active="true"] {
-            background-color: #fdff82;
-        }
-
-        QLabel#linefollower {
-            border: none;
-        }
-
         QLabel[dial="true"] {
             font-size: 14px;
             border: none;
             background-color: #b8e5ff;
         }
 
-        QLabel[active="true"] {
-            border: 2px solid red;
+        CarStatus {
+            font-size: 14px;
         }
 
-        QLabel[warning="true"] {
-            background-color: yellow;
+        CarStatus[focused="true"] {
+            border: 2px solid blue;
         }
 
         QLabel[collide="true"] {
             background-color: red;
         }
 
-        QLabel#linefollower[active="true"] {
-            background-color: black;
-        }
-
         QLineEdit {
             background-color: #b8e5ff;
             border: none;
         }
     ''')
 
-    window = MainWindow()
-    window.resize(500, 500)
+    fleet_parser = ArgumentParser(add_help=False)
+    fleet_parser.add_argument('--fleet', type=int, default=0, metavar='CARS',
+                              help='control this many cars, listening on consecutive ports')
+    fleet_options = fleet_parser.parse_known_args(argv[1:])[0]
+    keyboard = parse_keyboard_arguments(argv[1:])
+    keymap = Keymap.load(keyboard.keymap) if keyboard.keymap else None
+
+    if fleet_options.fleet:
+        manager = ChannelManager()
+        addresses = [('192.168.1.11', 8000 + index) for index in range(fleet_options.fleet)]
+        for (host, port), connected in zip(addresses, manager.connect_all(addresses, '69420')):
+            if isinstance(connected, OSError):
+                # The rest of the fleet is controlled without this car
+                print('Could not connect to %s:%d: %s' % (host, port, connected), file=stderr)
+        window = FleetView(manager, keymap, keyboard.macro)
+        window.resize(700, 950)
+    else:
+        channel, recorder = open_session(parse_arguments(argv[1:]))
+        window = MainWindow(channel, recorder, keymap, keyboard.macro)
+        window.resize(500, 750)
     window.show()
 
     exit(app.exec_())
@@ -0,0 +1,198 @@
+from asyncio import open_connection, create_task, wait_for, Queue, QueueEmpty, QueueFull, TimeoutError
+from socket import timeout
+from protocol import Keys, Protocol
+from subscriptions import Subscriptions
+
+
+class AsyncChannel(Keys):
+    """
+    Class handling the communication with the controller of the car, on an asyncio event loop.
+    | It speaks the same protocol as Channel, but needs no thread, nor lock, so a single event loop can drive
+    | any number of cars. Instances are created with the connect coroutine.
+
+    .. attribute:: granted
+        Whether the controller accepted the password
+
+    :var: QUEUE_SIZE
+    :var: HANDSHAKE_TIMEOUT
+    """
+
+    QUEUE_SIZE = 256
+    HANDSHAKE_TIMEOUT = 5.0
+
+    def __init__(self, protocol, sending, receiving):
+        self.__protocol = protocol
+        self.__sending = sending
+        self.__receiving_reader, self.__receiving_writer = receiving
+        self.__queues = []
+        self.__subscriptions = Subscriptions()
+        self.__receiver = None
+        self.granted = False
+
+    @classmethod
+    async def connect(cls, host, port, password, delta=None, binary=True, handshake_timeout=HANDSHAKE_TIMEOUT):
+        """
+        Connects to the controller, and starts receiving its telemetry if the password was accepted
+
+        :param host: IP address of the controller
+        :param port: port of the controller
+        :param password: password of the controller
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param handshake_timeout: seconds to wait for the answer of the controller, None waits as long as it takes
+
+        :return: the connected AsyncChannel
+
+        :raises OSError: if the controller can not be reached, or does not answer in time
+        """
+        protocol = Protocol(delta, binary)
+        _, sending = await open_connection(host, int(port))
+        receiving = None
+        channel = None
+        try:
+            receiving = await open_connection(host, int(port))
+            sending.write(protocol.authentication(password))
+            await sending.drain()
+            try:
+                answer = await wait_for(receiving[0].read(1024), handshake_timeout)
+            except TimeoutError:
+                raise timeout('the controller did not answer in %s s' % handshake_timeout)
+            granted, initial_data = protocol.read_answer(answer)
+
+            channel = cls(protocol, sending, receiving)
+            if granted:
+                sending.write(protocol.agree())
+                await sending.drain()
+                channel.granted = True
+                channel.__receiver = create_task(channel.__handle_answer(initial_data))
+            return channel
+        finally:
+            # A rejected, or failed handshake leaves no connection behind
+            if channel is None or not channel.granted:
+                sending.close()
+                if receiving is not None:
+                    receiving[1].close()
+
+    @property
+    def codec(self):
+        return self.__protocol.codec
+
+    async def __handle_answer(self, initial_data):
+        data = initial_data
+        while True:
+            frames = self.__protocol.decode(data)
+            if frames:
+                previous = self.__protocol.snapshot
+                self.__protocol.apply(frames)
+                acknowledgement = self.__protocol.acknowledgement(frames)
+                if acknowledgement:
+                    self.__receiving_writer.write(acknowledgement)
+                for frame in frames:
+                    self.__publish(frame)
+                self.__subscriptions.notify_frames(frames, self.__protocol.received)
+                self.__subscriptions.notify(Subscriptions.diff(previous, self.__protocol.snapshot))
+
+            try:
+                data = await self.__receiving_reader.read(4096)
+            except OSError:
+                break
+            if not data:
+                break
+
+        for queue in self.__queues:
+            self.__publish(None, queue)
+
+    def __publish(self, frame, *queues):
+        for queue in queues or self.__queues:
+            if queue.full():
+                # A slow reader loses the oldest frames, not the newest
+                try:
+                    queue.get_nowait()
+                except QueueEmpty:
+                    pass
+            try:
+                queue.put_nowait(frame)
+            except QueueFull:
+                pass
+
+    def telemetry(self):
+        """
+        Iterates over the telemetry frames received from now on, until the connection is closed.
+        | The frames are queued from the call on, not from the first step of the iteration, so none of them
+        | is lost in between. An iterator that is never stepped keeps the last QUEUE_SIZE frames queued.
+
+        :return: asynchronous iterator of the frames
+        """
+        queue = Queue(self.QUEUE_SIZE)
+        self.__queues.append(queue)
+        return self.__iterate(queue)
+
+    async def __iterate(self, queue):
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.__queues.remove(queue)
+
+    async def __send_message(self):
+        frame = self.__protocol.command_frame()
+        if frame:
+            self.__sending.write(frame)
+            await self.__sending.drain()
+
+    async def set_value(self, key, value):
+        self.__protocol.set_value(key, value)
+        await self.__send_message()
+
+    async def set_values(self, keys, values):
+        for key, value in zip(keys, values):
+            self.__protocol.set_value(key, value)
+        await self.__send_message()
+
+    def subscribe(self, keys, callback, dispatch=None) -> int:
+        """
+        Subscribes a callback to the changes of the state of the car, as reported by the controller
+
+        :param keys: the keys to watch, None watches every key
+        :param callback: called with a dictionary of the changed keys, and their new values
+        :param dispatch: called with the callback, and its argument instead of calling the callback directly
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe(keys, callback, dispatch)
+
+    def subscribe_frames(self, callback) -> int:
+        """
+        Subscribes a callback to every telemetry frame, whether it changed anything or not
+
+        :param callback: called with the frames of each batch, and the time they were received at, by the clock
+                         of the latency monitor, on the event loop
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe_frames(callback)
+
+    def unsubscribe(self, token) -> None:
+        self.__subscriptions.unsubscribe(token)
+
+    def snapshot(self):
+        """
+        :return: TelemetrySnapshot of the current state of the car
+        """
+        return self.__protocol.snapshot
+
+    def get_value(self, key):
+        return self.__protocol.snapshot[key]
+
+    def get_values(self, keys):
+        return self.__protocol.snapshot.get_values(keys)
+
+    async def deactivate(self):
+        self.__sending.close()
+        await self.__sending.wait_closed()
+        if self.__receiver is not None:
+            await self.__receiver
+        self.__receiving_writer.close()
@@ -0,0 +1,217 @@
+from math import copysign
+from threading import Lock
+from time import monotonic
+from protocol import Keys
+
+
+class Axis:
+    """
+    A proportional control between -1, and 1, e.g. the throttle, which follows its target at a limited rate.
+    | Moving away from 0 ramps at rise per second, moving back towards 0, or across it ramps at fall per second,
+    | so letting go stops quicker than pressing accelerates. The position ramps linearly, and the value sent
+    | is the position raised to exponent, keeping its sign, so an exponent above 1 gives finer control
+    | around the center. A rise, and a fall of inf follow the target at once, e.g. for a joystick.
+
+    .. attribute:: target
+        Where the axis is heading to
+
+    .. attribute:: position
+        Where the axis is, on the linear ramp
+
+    :var: RISE
+    :var: FALL
+    """
+
+    RISE = 2.0
+    FALL = 4.0
+
+    def __init__(self, rise=RISE, fall=FALL, exponent=1.0):
+        """
+        :param rise: change per second, while moving away from 0
+        :param fall: change per second, while moving towards 0
+        :param exponent: the curve of the value, 1 is linear
+        """
+        self.rise = rise
+        self.fall = fall
+        self.exponent = exponent
+        self.target = 0.0
+        self.position = 0.0
+
+    @property
+    def value(self) -> float:
+        """
+        :return: the position on the curve of the axis
+        """
+        return copysign(abs(self.position) ** self.exponent, self.position) if self.position else 0.0
+
+    def advance(self, seconds) -> None:
+        """
+        Moves the position towards the target
+
+        :param seconds: time passed since the last advance
+
+        :return: None
+        """
+        if seconds <= 0 or self.position == self.target:
+            return
+        if self.target * self.position < 0:
+            # Back to 0 first, and on to the other side with what is left of the time
+            to_center = abs(self.position) / self.fall
+            if seconds < to_center:
+                self.position -= copysign(self.fall * seconds, self.position)
+                return
+            self.position = 0.0
+            seconds -= to_center
+        outwards = abs(self.target) > abs(self.position)
+        step = (self.rise if outwards else self.fall) * seconds
+        if abs(self.target - self.position) <= step:
+            self.position = self.target
+        elif self.target > self.position:
+            self.position += step
+        else:
+            self.position -= step
+
+
+class DriveAxes(Keys):
+    """
+    The THROTTLE, and the STEERING of the car, as Axes, fed by the drive keys, or by any other source of input.
+    | Held drive keys set the targets, FORWARD, and BACKWARD the throttle, LEFT, and RIGHT the steering, which is
+    | positive to the left, like the turning of the car. Other sources, e.g. a gamepad, set the targets directly,
+    | whichever came last wins. Everything is guarded by a lock, so the input, and the streaming of the values
+    | may run on different threads.
+
+    .. attribute:: throttle
+        The Axis of the throttle
+
+    .. attribute:: steering
+        The Axis of the steering
+    """
+
+    def __init__(self, throttle=None, steering=None):
+        """
+        :param throttle: Axis of the throttle, one with the default ramps if None
+        :param steering: Axis of the steering, one with the default ramps if None
+        """
+        self.throttle = throttle if throttle is not None else Axis()
+        self.steering = steering if steering is not None else Axis()
+        self.__lock = Lock()
+        self.__pressed = set()
+        self.__time = None
+
+    def __aim(self):
+        pressed = self.__pressed
+        self.throttle.target = float((self.FORWARD in pressed) - (self.BACKWARD in pressed))
+        self.steering.target = float((self.LEFT in pressed) - (self.RIGHT in pressed))
+
+    def press(self, key) -> None:
+        """
+        :param key: the drive key pressed, other keys are ignored
+
+        :return: None
+        """
+        with self.__lock:
+            self.__pressed.add(key)
+            self.__aim()
+
+    def release(self, key) -> None:
+        """
+        :param key: the drive key released, other keys are ignored
+
+        :return: None
+        """
+        with self.__lock:
+            self.__pressed.discard(key)
+            self.__aim()
+
+    def release_all(self) -> None:
+        """Releases every key, e.g. when the window loses the focus, and would miss the releases"""
+        with self.__lock:
+            self.__pressed.clear()
+            self.__aim()
+
+    def stop(self) -> None:
+        """Releases every key, and centers both axes at once, without ramping, e.g. at the end of a macro"""
+        with self.__lock:
+            self.__pressed.clear()
+            self.__aim()
+            self.throttle.position = self.steering.position = 0.0
+
+    def set(self, throttle=None, steering=None) -> None:
+        """
+        Sets the targets, for sources of input other than the keys
+
+        :param throttle: target of the throttle, between -1, and 1, None leaves it as it is
+        :param steering: target of the steering, between -1, and 1, None leaves it as it is
+
+        :return: None
+        """
+        with self.__lock:
+            if throttle is not None:
+                self.throttle.target = max(-1.0, min(1.0, float(throttle)))
+            if steering is not None:
+                self.steering.target = max(-1.0, min(1.0, float(steering)))
+
+    def advance(self, now=None) -> dict:
+        """
+        Moves both axes by the time passed since the last advance
+
+        :param now: the time, in seconds of monotonic, now if None
+
+        :return: the values of THROTTLE, and STEERING
+        """
+        now = monotonic() if now is None else now
+        with self.__lock:
+            if self.__time is not None:
+                self.throttle.advance(now - self.__time)
+                self.steering.advance(now - self.__time)
+            self.__time = now
+            return {self.THROTTLE: self.throttle.value, self.STEERING: self.steering.value}
+
+
+class AxisStreamer:
+    """
+    Turns DriveAxes into the changes to send, when polled at a fixed rate.
+    | The values are quantized to steps of quantum, and only the ones whose step differs from the last one
+    | returned are returned again, so holding, or leaving the controls costs nothing on the link, and a ramp
+    | costs at most a value per step. The polls set the rate, see Channel, and QtChannel.
+
+    :var: RATE
+    :var: QUANTUM
+    """
+
+    RATE = 50.0
+    QUANTUM = 0.02
+
+    def __init__(self, axes, quantum=QUANTUM):
+        """
+        :param axes: the DriveAxes to stream
+        :param quantum: the step of the values sent
+        """
+        self.axes = axes
+        self.quantum = quantum
+        self.__sent = dict()
+
+    def quantize(self, value) -> float:
+        """
+        :param value: value of an axis
+
+        :return: the nearest step, rounded, so it is encoded as short as it reads
+        """
+        return round(round(value / self.quantum) * self.quantum, 6) + 0.0
+
+    def poll(self, now=None) -> dict:
+        """
+        :param now: the time, in seconds of monotonic, now if None
+
+        :return: the axes, whose quantized value changed since the last poll, with their values
+        """
+        changes = dict()
+        for key, value in self.axes.advance(now).items():
+            value = self.quantize(value)
+            if self.__sent.get(key) != value:
+                changes[key] = self.__sent[key] = value
+        return changes
+
+    def reset(self) -> None:
+        """Forgets the values returned, so the next poll returns every axis"""
+        self.__sent = dict()
@@ -1,96 +1,511 @@
-from socket import socket, AF_INET, SOCK_STREAM
-from threading import Thread, Lock
-from json import dumps, loads
-from collections import defaultdict
-from hashlib import sha256
-
-
-class Channel:
-
-    FORWARD = 'forward'
-    BACKWARD = 'backward'
-    LEFT = 'turn_left'
-    RIGHT = 'turn_right'
-    R_INDICATOR = 'right_indicator'
-    L_INDICATOR = 'left_indicator'
-    HAZARD_WARNING = 'hazard_warning'
-    LIGHTS = 'lights'
-    HORN = 'horn'
-    DISTANCE = 'distance'
-    SPEED = 'speed'
-    LINE = 'line'
-    REVERSE = 'reverse'
-
-    DISTANCE_KEEPING = 'distance_keeping'
-    LINE_FOLLOWING = 'line_following'
-
-    CHANGE_DIRECTION = 'change_direction'  # TODO: constants anyway
-
-    def __init__(self, host, port, password):
+from threading import Thread, Lock, Condition, Event
+from time import sleep
+from random import uniform
+from axes import AxisStreamer
+from framing import ReceiveBuffer
+from protocol import Keys, Protocol
+from subscriptions import Subscriptions
+from transport import TcpTransport
+
+
+class Channel(Keys):
+    """
+    Class handling the communication with the controller of the car, over blocking sockets.
+    | Commands are sent by a writer thread, so setting a value never waits for the network. Every change made
+    | within a tick of the first one is sent in the same frame, and while the socket is busy, further changes keep
+    | merging into the next frame, instead of queueing up. The telemetry is received on a dedicated thread.
+    | If the controller has a drive lane, the drive keys are sent as datagrams right on the thread of the caller,
+    | and the writer thread repeats them every DRIVE_REFRESH seconds, as long as Protocol asks for it.
+    | If the connection is lost, the receiving thread reconnects with exponential backoff, resumes the session,
+    | or authenticates again, and replays the message table, so the car gets back to the commanded state.
+    | The handshake, and the format of the frames are described at Protocol. The connections are opened
+    | by a transport, TcpTransport unless another one is given, see the transport module.
+    | Given a FlightRecorder, the telemetry, and the commands are recorded as they are received, and set.
+    | Given DriveAxes, their THROTTLE, and STEERING are sent axis_rate times a second by a thread of their own,
+    | quantized, and only when they change, see AxisStreamer, so proportional control does not flood the link.
+
+    .. attribute:: answer_thread
+        The thread receiving the telemetry
+
+    .. attribute:: writer_thread
+        The thread sending the commands, None if they are sent on the thread of the caller
+
+    .. attribute:: axis_thread
+        The thread streaming the axes, None if there are none
+
+    .. attribute:: status
+        CONNECTED, RECONNECTING, or DISCONNECTED, also published to the subscribers of STATUS
+
+    .. attribute:: granted
+        Whether the controller accepted the password
+
+    :var: TICK
+    :var: DRIVE_REFRESH
+    :var: RECONNECT_DELAY
+    :var: RECONNECT_MAX_DELAY
+    :var: HANDSHAKE_TIMEOUT
+    """
+
+    TICK = 0.01
+    DRIVE_REFRESH = 0.05
+    RECONNECT_DELAY = 0.05
+    RECONNECT_MAX_DELAY = 5.0
+    HANDSHAKE_TIMEOUT = 5.0
+
+    STATUS = 'status'
+    CONNECTED = 'connected'
+    RECONNECTING = 'reconnecting'
+    DISCONNECTED = 'disconnected'
+
+    def __init__(self, host, port, password, delta=None, binary=True, tick=TICK, udp=True, reconnect=True,
+                 transport=None, recorder=None, handshake_timeout=HANDSHAKE_TIMEOUT, axes=None,
+                 axis_rate=AxisStreamer.RATE, axis_quantum=AxisStreamer.QUANTUM):
+        """
+        Connects to the controller, and starts receiving its telemetry if the password was accepted
+
+        :param host: IP address of the controller
+        :param port: port of the controller
+        :param password: password of the controller
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param tick: seconds to gather changes for, before sending them, None sends each on the thread of the caller
+        :param udp: whether to use the drive lane, if the controller has one, which needs the writer thread
+        :param reconnect: whether to reconnect, when the connection is lost
+        :param transport: opens the connections to the controller, a TcpTransport to host, and port if None
+        :param recorder: FlightRecorder to record the session with, which is closed with the channel
+        :param handshake_timeout: seconds to wait for the answer of the controller, None waits as long as it takes
+        :param axes: DriveAxes to stream, None sends only what is set
+        :param axis_rate: how many times a second the axes are sent, at most
+        :param axis_quantum: the step of the values of the axes sent
+
+        :raises OSError: if the controller can not be reached, or does not answer in time
+        """
         super().__init__()
-        self.__message_table = defaultdict(bool)
-        self.__data_table = defaultdict(bool)
+        self.__transport = transport if transport is not None else TcpTransport(host, port)
+        self.__recorder = recorder
+        self.__protocol = Protocol(delta, binary, udp and tick is not None and self.__transport.datagrams)
         self.__lock = Lock()
+        self.__subscriptions = Subscriptions()
+        self.__changed = Condition(self.__lock)
+        self.__stopped = Event()
+        self.__tick = tick
+        self.__reconnect = reconnect
+        self.__handshake_timeout = handshake_timeout
+        self.__pending = False
+        self.__in_flight = False
+        self.__active = True
+        self.__connected = False
+        self.answer_thread = None
+        self.writer_thread = None
+        self.axis_thread = None
+        self.status = self.DISCONNECTED
 
-        self.__sending_socket = socket(AF_INET, SOCK_STREAM)
-        self.__receiving_socket = socket(AF_INET, SOCK_STREAM)
-        self.__sending_socket.connect((host, int(port)))
-        self.__receiving_socket.connect((host, int(port)))
+        self.__authentication = self.__protocol.authentication(password)
+        self.__sending_socket = None
+        self.__receiving_socket = None
+        self.__drive_socket = None
 
-        self.__sending_socket.sendall(sha256(password.encode()).digest())
-        answer = self.__receiving_socket.recv(1024).decode()
+        granted, initial_data = self.__open()
+        self.granted = granted
 
-        if answer.strip() == "GRANTED":
+        if granted:
             print('Granted')
-            self.answer_thread = Thread(target=self.__handle_awnser)
+            self.__connected = True
+            self.status = self.CONNECTED
+            self.answer_thread = Thread(target=self.__handle_awnser, args=(initial_data,))
             self.answer_thread.start()
+            if tick is not None:
+                self.writer_thread = Thread(target=self.__write, daemon=True)
+                self.writer_thread.start()
+            if axes is not None:
+                streamer = AxisStreamer(axes, axis_quantum)
+                self.axis_thread = Thread(target=self.__stream, args=(streamer, 1 / axis_rate), daemon=True)
+                self.axis_thread.start()
         else:
             print('rejected')
 
-    def __handle_awnser(self):
+    @property
+    def codec(self):
+        return self.__protocol.codec
+
+    def __open(self):
+        """
+        Opens the connections to the controller, resuming the last session if there is one,
+        or authenticating with the password otherwise
+
+        :return: whether the controller accepted the client, and the bytes after its answer
+        """
+        resumption = self.__protocol.resumption()
+        if resumption:
+            granted, initial_data = self.__handshake(resumption)
+            if granted:
+                return granted, initial_data
+        return self.__handshake(self.__authentication)
+
+    def __handshake(self, credentials):
+        """
+        Opens new connections to the controller, and runs the handshake on them
+
+        :Assumptions:
+          * Nothing is sent to the controller meanwhile, as the channel is not connected
+
+        :param credentials: the digest of the password, or the resumption of the session
+
+        :return: whether the controller accepted the credentials, and the bytes after its answer
+        """
+        self.__close_sockets()
+        with self.__lock:
+            self.__protocol.reset()
+        self.__sending_socket, self.__receiving_socket = self.__transport.open()
+
+        read_timeout = self.__receiving_socket.gettimeout()
+        try:
+            self.__sending_socket.sendall(credentials)
+            self.__receiving_socket.settimeout(self.__handshake_timeout)
+            answer = self.__receiving_socket.recv(1024)
+            self.__receiving_socket.settimeout(read_timeout)
+        except OSError:
+            self.__close_sockets()
+            raise
+        granted, initial_data = self.__protocol.read_answer(answer)
+        if not granted:
+            self.__close_sockets()
+            return False, b''
+
+        self.__sending_socket.sendall(self.__protocol.agree())
+        if self.__protocol.drive_port is not None:
+            self.__drive_socket = self.__transport.datagram(self.__protocol.drive_port)
+        return True, initial_data
+
+    def __close_sockets(self):
+        for connection in (self.__sending_socket, self.__receiving_socket, self.__drive_socket):
+            if connection is not None:
+                connection.close()
+        self.__drive_socket = None
+
+    def __set_status(self, status):
+        self.status = status
+        self.__subscriptions.notify({self.STATUS: status})
+
+    def __handle_awnser(self, initial_data=b''):
+        """
+        Receives the telemetry of the controller until the connection is closed, and can not be reestablished.
+          * Every wakeup handles all the frames received so far, under a single acquisition of the lock.
+          * The frames are acknowledged outside of the lock, as the protocol requires.
+          * Subscribers are notified about the changes on this thread, unless they asked for another one.
+
+        :param initial_data: bytes that arrived together with the handshake answer
+
+        :return: None
+        """
+        buffer = ReceiveBuffer()
+        data = initial_data
         while True:
-            data = self.__receiving_socket.recv(1024).decode().strip()
+            try:
+                frames = self.__protocol.decode(data)
+            except (ValueError, TypeError):
+                # A corrupt chunk is dropped, the stream goes on
+                frames = []
+            if frames:
+                self.__handle_frames(frames)
+
+            try:
+                data = buffer.receive(self.__receiving_socket)
+            except OSError:
+                data = b''
             if not data:
-                break
-            else:
+                data = self.__reestablish()
+                if data is None:
+                    break
+
+    def __handle_frames(self, frames):
+        """
+        Applies telemetry frames, records them, acknowledges them, and notifies the subscribers about the changes
+
+        :Assumptions:
+          * This method is called on the receiving thread
+
+        :param frames: the frames, as returned by Protocol.decode
+
+        :return: None
+        """
+        previous = self.__protocol.snapshot
+        with self.__lock:
+            self.__protocol.apply(frames)
+        if self.__recorder is not None:
+            self.__recorder.telemetry(frames)
+        self.__acknowledge(frames)
+        self.__subscriptions.notify_frames(frames, self.__protocol.received)
+        self.__subscriptions.notify(Subscriptions.diff(previous, self.__protocol.snapshot))
+
+    def __acknowledge(self, frames):
+        """
+        Sends the acknowledgement of telemetry frames, if the protocol asks for one, outside of the lock
+
+        :param frames: the frames, as returned by Protocol.decode
+
+        :return: None
+        """
+        acknowledgement = self.__protocol.acknowledgement(frames)
+        try:
+            if acknowledgement:
+                self.__receiving_socket.sendall(acknowledgement)
+        except OSError:
+            # A lost connection is noticed by the next receive
+            pass
+
+    def __reestablish(self):
+        """
+        Reconnects to the controller after the connection was lost, waiting more and more between the attempts,
+        with some random jitter, so a fleet of clients does not hit the controller at once
+
+        :Assumptions:
+          * This method is called on the receiving thread
+
+        :return: the bytes received after the answer of the controller, None if the channel is closed
+        """
+        with self.__lock:
+            self.__connected = False
+            if not self.__active or not self.__reconnect:
+                return None
+        self.__set_status(self.RECONNECTING)
+
+        delay = self.RECONNECT_DELAY
+        while not self.__stopped.wait(uniform(delay / 2, delay)):
+            try:
+                granted, initial_data = self.__open()
+            except OSError:
+                granted, initial_data = False, b''
+            if granted and self.__replay():
+                self.__set_status(self.CONNECTED)
+                return initial_data
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
+        return None
+
+    def __replay(self) -> bool:
+        """
+        Sends the message table again after reconnecting, or leaves it to the writer thread if there is one.
+        | Without a writer thread, the frame is sent outside of the lock, so a lost connection only fails this attempt.
+
+        :Assumptions:
+          * This method is called on the receiving thread
+
+        :return: whether the connection is still up
+        """
+        with self.__lock:
+            self.__connected = True
+            if not self.__protocol.message_table:
+                return True
+            if self.writer_thread is not None:
+                self.__send_message()
+                return True
+            frame = self.__protocol.command_frame()
+            connection = self.__sending_socket
+        try:
+            if frame:
+                connection.sendall(frame)
+        except OSError:
+            with self.__lock:
+                self.__connected = False
+            return False
+        return True
+
+    def __write(self):
+        """
+        Sends the changes of the message table, until the channel is deactivated, and everything is sent
+
+        :Assumptions:
+          * This method is called on the writer thread
+
+        :return: None
+        """
+        while True:
+            with self.__lock:
+                while self.__active and not (self.__pending and self.__connected):
+                    if not (self.__connected and self.__protocol.drive_refresh_needed()):
+                        self.__changed.wait()
+                    elif not self.__changed.wait(self.DRIVE_REFRESH):
+                        self.__send_drive()
+                if not (self.__pending and self.__connected):
+                    break
+
+            if self.__tick:
+                sleep(self.__tick)
+
+            with self.__lock:
+                self.__pending = False
+                self.__in_flight = True
+                frame = self.__protocol.command_frame()
+                connection = self.__sending_socket
+            try:
+                if frame:
+                    connection.sendall(frame)
+            except OSError:
+                with self.__lock:
+                    # Whatever was lost is sent again with the replay, after reconnecting
+                    self.__connected = False
+            finally:
+                with self.__lock:
+                    self.__in_flight = False
+                    self.__changed.notify_all()
+
+    def __stream(self, streamer, period):
+        """
+        Sends the changes of the axes every period, until the channel is deactivated, and once more then,
+        so the last state of the axes is sent with the rest
+
+        :Assumptions:
+          * This method is called on the axis thread
+
+        :param streamer: AxisStreamer of the axes
+        :param period: seconds between two polls of the axes
+
+        :return: None
+        """
+        stopped = False
+        while not stopped:
+            stopped = self.__stopped.wait(period)
+            changes = streamer.poll()
+            if changes:
                 try:
-                    self.__lock.acquire()
-                    self.__data_table = defaultdict(bool, loads(data))
-                    for key, value in self.__data_table.items():
-                        self.__message_table[key] = value
-                    self.__receiving_socket.sendall(b'Done.')
-                    self.__lock.release()
-                except Exception as e:
-                    print('Exception happened in handleing: ', e)
+                    self.set_values(list(changes), list(changes.values()))
+                except OSError:
+                    # Without a writer thread, the changes are sent here, and replayed after reconnecting
+                    pass
+
+    def __send_drive(self):
+        """
+        Sends the state of the drive keys on the drive lane
+
+        :Assumptions:
+          * The lock is held by the caller
+
+        :return: None
+        """
+        try:
+            self.__drive_socket.send(self.__protocol.drive_datagram())
+        except (OSError, AttributeError):
+            # The next repetition, or the next change tries again
+            pass
 
     def __send_message(self):
-        self.__sending_socket.sendall(dumps(self.__message_table).encode())
+        """
+        Sends the changes of the message table, or leaves it to the writer thread if there is one
+
+        :Assumptions:
+          * The lock is held by the caller
+
+        :return: None
+        """
+        if self.writer_thread is None:
+            frame = self.__protocol.command_frame()
+            if frame:
+                self.__sending_socket.sendall(frame)
+        else:
+            self.__pending = True
+            self.__changed.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until every change set so far has been sent
+
+        :param timeout: seconds to wait at most, None waits as long as it takes
+
+        :return: whether everything has been sent
+        """
+        if self.writer_thread is None:
+            return True
+        with self.__lock:
+            return self.__changed.wait_for(
+                lambda: not (self.__pending or self.__in_flight) or not self.writer_thread.is_alive(),
+                timeout
+            ) and not self.__pending
 
     def deactivate(self):
-        self.__sending_socket.close()
-        self.answer_thread.join()
+        self.__stopped.set()
+        if self.axis_thread is not None:
+            # Before the writer thread stops, so it sends the last changes of the axes too
+            self.axis_thread.join()
+        with self.__lock:
+            self.__active = False
+            self.__changed.notify_all()
+        if self.writer_thread is not None:
+            self.writer_thread.join()
+        with self.__lock:
+            self.__sending_socket.close()
+            if self.__drive_socket is not None:
+                self.__drive_socket.close()
+        if self.answer_thread is not None:
+            self.answer_thread.join()
+        if self.__recorder is not None:
+            self.__recorder.close()
+        self.__set_status(self.DISCONNECTED)
 
     def set_value(self, key, value):
-        self.__lock.acquire()
-        self.__message_table[key] = value
-        self.__send_message()
-        self.__lock.release()
+        self.set_values([key], [value])
 
     def set_values(self, keys, values):
-        self.__lock.acquire()
-        for index, key in keys.enumerate():
-            self.__message_table[key] = values[index]
-        self.__send_message()
-        self.__lock.release()
+        if self.__recorder is not None:
+            self.__recorder.command(dict(zip(keys, values)))
+        with self.__lock:
+            on_drive_lane = [self.__protocol.set_value(key, value) for key, value in zip(keys, values)]
+            if any(on_drive_lane):
+                self.__send_drive()
+                self.__changed.notify_all()
+            if not all(on_drive_lane):
+                self.__send_message()
+
+    def subscribe(self, keys, callback, dispatch=None) -> int:
+        """
+        Subscribes a callback to the changes of the state of the car, as reported by the controller,
+        and to the changes of the STATUS of the connection
+
+        :param keys: the keys to watch, None watches every key
+        :param callback: called with a dictionary of the changed keys, and their new values
+        :param dispatch: called with the callback, and its argument instead of calling the callback on the receiving
+                         thread, e.g. to hand it to the main loop of the UI
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe(keys, callback, dispatch)
+
+    def subscribe_frames(self, callback) -> int:
+        """
+        Subscribes a callback to every telemetry frame, whether it changed anything or not
+
+        :param callback: called with the frames of each batch, and the time they were received at, by the clock
+                         of the latency monitor, on the receiving thread
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe_frames(callback)
+
+    def unsubscribe(self, token) -> None:
+        self.__subscriptions.unsubscribe(token)
+
+    def snapshot(self):
+        """
+        :return: TelemetrySnapshot of the current state of the car, which is safe to read without any lock
+        """
+        return self.__protocol.snapshot
+
+    def latency(self) -> dict:
+        """
+        :return: the clock offset of the controller, and summaries of the round trip, telemetry,
+                 and control latencies, as described at LatencyMonitor
+        """
+        return self.__protocol.latency.summary()
+
+    def telemetry_age(self, key):
+        """
+        :param key: key of the telemetry
+
+        :return: seconds since the controller measured the value of the key, None if it never reported it
+        """
+        return self.__protocol.latency.age(key)
 
     def get_value(self, key):
-        self.__lock.acquire()
-        data = self.__data_table[key]
-        self.__lock.release()
-        return data
+        return self.__protocol.snapshot[key]
 
     def get_values(self, keys):
-        self.__lock.acquire()
-        data = [self.__data_table[key] if key in self.__data_table else False for key in keys]
-        self.__lock.release()
-        return data
+        return self.__protocol.snapshot.get_values(keys)
@@ -0,0 +1,602 @@
+from heapq import heappush, heappop
+from random import uniform
+from selectors import DefaultSelector, EVENT_READ, EVENT_WRITE
+from socket import socketpair
+from threading import Thread, Lock, Condition, Event
+from time import monotonic
+from traceback import print_exc
+from channel import Channel
+from framing import ReceiveBuffer
+from protocol import Keys, Protocol
+from subscriptions import Subscriptions
+from transport import TcpTransport
+
+
+class ManagedChannel(Keys):
+    """
+    One car of a ChannelManager, with the same interface as Channel.
+    | The connections are served by the I/O thread of the manager, so the car needs no thread of its own.
+    | Changes set while a frame is still being written merge into the next frame, like with Channel.
+    | There is no drive lane, the drive keys go with the rest of the commands.
+
+    .. attribute:: status
+        CONNECTED, RECONNECTING, or DISCONNECTED, also published to the subscribers of STATUS
+
+    .. attribute:: granted
+        Whether the controller accepted the password
+    """
+
+    STATUS = Channel.STATUS
+    CONNECTED = Channel.CONNECTED
+    RECONNECTING = Channel.RECONNECTING
+    DISCONNECTED = Channel.DISCONNECTED
+
+    def __init__(self, manager, transport, password, delta=None, binary=True, reconnect=True,
+                 handshake_timeout=Channel.HANDSHAKE_TIMEOUT):
+        """
+        :param manager: the ChannelManager serving the car
+        :param transport: opens the connections to the controller
+        :param password: password of the controller
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param reconnect: whether to reconnect, when the connection is lost
+        :param handshake_timeout: seconds to wait for the answer of the controller, None waits as long as it takes
+        """
+        super().__init__()
+        self.__manager = manager
+        self.__transport = transport
+        self.__protocol = Protocol(delta, binary)
+        self.__authentication = self.__protocol.authentication(password)
+        self.__reconnect = reconnect
+        self.__handshake_timeout = handshake_timeout
+        self.__lock = Lock()
+        self.__changed = Condition(self.__lock)
+        self.__subscriptions = Subscriptions()
+        self.__buffer = ReceiveBuffer()
+        self.__sending = None
+        self.__receiving = None
+        self.__commands = bytearray()
+        self.__acknowledgements = bytearray()
+        self.__pending = False
+        self.__active = True
+        self.__closed = Event()
+        self.__delay = Channel.RECONNECT_DELAY
+        self.status = self.DISCONNECTED
+        self.granted = False
+
+    @property
+    def codec(self):
+        return self.__protocol.codec
+
+    def open(self):
+        """
+        Opens the connections to the controller, and runs the handshake on them, resuming the last session
+        if there is one, or authenticating with the password otherwise
+
+        :Assumptions:
+          * The car is not attached to the I/O thread meanwhile, as the connections are blocking
+
+        :return: the sending, and the receiving connection, and the bytes after the answer, None if rejected
+
+        :raises OSError: if the controller can not be reached, or does not answer in time
+        """
+        resumption = self.__protocol.resumption()
+        if resumption:
+            opened = self.__handshake(resumption)
+            if opened is not None:
+                return opened
+        return self.__handshake(self.__authentication)
+
+    def __handshake(self, credentials):
+        with self.__lock:
+            self.__protocol.reset()
+        sending, receiving = self.__transport.open()
+        read_timeout = receiving.gettimeout()
+        try:
+            sending.sendall(credentials)
+            receiving.settimeout(self.__handshake_timeout)
+            granted, initial_data = self.__protocol.read_answer(receiving.recv(1024))
+            receiving.settimeout(read_timeout)
+            if granted:
+                sending.sendall(self.__protocol.agree())
+                self.granted = True
+                return sending, receiving, initial_data
+        except OSError:
+            sending.close()
+            receiving.close()
+            raise
+        sending.close()
+        receiving.close()
+        return None
+
+    def attach(self, sending, receiving, initial_data):
+        """
+        Starts serving new connections, and replays the message table on them
+
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :return: None
+        """
+        if not self.__active:
+            # Deactivated while reconnecting
+            sending.close()
+            receiving.close()
+            self.__close()
+            return
+        self.__sending, self.__receiving = sending, receiving
+        sending.setblocking(False)
+        receiving.setblocking(False)
+        self.__delay = Channel.RECONNECT_DELAY
+        with self.__lock:
+            self.__commands.clear()
+            self.__acknowledgements.clear()
+            self.__pending = self.__pending or bool(self.__protocol.message_table)
+        self.__set_status(self.CONNECTED)
+        self.__manager.watch(self)
+        self.handle_received(initial_data)
+        self.handle_writable()
+
+    def sockets(self) -> dict:
+        """
+        :return: the connections to watch, with the events to watch them for
+        """
+        if self.__receiving is None:
+            return dict()
+        events = {self.__receiving: EVENT_READ | (EVENT_WRITE if self.__acknowledgements else 0)}
+        if self.__commands:
+            events[self.__sending] = EVENT_WRITE
+        return events
+
+    def __set_status(self, status):
+        self.status = status
+        self.__subscriptions.notify({self.STATUS: status})
+
+    def handle_readable(self) -> None:
+        """
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :return: None
+        """
+        if self.__receiving is None:
+            # Lost earlier in the same batch of events
+            return
+        try:
+            data = self.__buffer.receive(self.__receiving)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.__lost()
+            return
+        self.handle_received(data)
+
+    def handle_received(self, data) -> None:
+        frames = self.__protocol.decode(data)
+        if not frames:
+            return
+        previous = self.__protocol.snapshot
+        with self.__lock:
+            self.__protocol.apply(frames)
+        self.__acknowledgements += self.__protocol.acknowledgement(frames)
+        self.handle_writable()
+        self.__subscriptions.notify_frames(frames, self.__protocol.received)
+        self.__subscriptions.notify(Subscriptions.diff(previous, self.__protocol.snapshot))
+
+    def handle_writable(self) -> None:
+        """
+        Writes as much of the acknowledgements, and the commands, as the connections take without blocking,
+        building the next command frame once the previous one is out
+
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :return: None
+        """
+        if self.__receiving is None:
+            return
+        try:
+            if self.__acknowledgements:
+                del self.__acknowledgements[:self.__receiving.send(self.__acknowledgements)]
+            with self.__lock:
+                if self.__pending and not self.__commands:
+                    self.__pending = False
+                    self.__commands += self.__protocol.command_frame()
+            if self.__commands:
+                del self.__commands[:self.__sending.send(self.__commands)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.__lost()
+            return
+        with self.__lock:
+            self.__changed.notify_all()
+            closing = not self.__active and not (self.__pending or self.__commands)
+        if closing:
+            self.__close()
+
+    def __close_sockets(self):
+        self.__manager.unwatch(self)
+        for connection in (self.__sending, self.__receiving):
+            if connection is not None:
+                connection.close()
+        self.__sending = self.__receiving = None
+
+    def __close(self):
+        if self.__closed.is_set():
+            # Deactivated while a reconnect was scheduled, which is closing it again
+            return
+        self.__close_sockets()
+        self.__set_status(self.DISCONNECTED)
+        self.__closed.set()
+
+    def __lost(self):
+        self.__close_sockets()
+        with self.__lock:
+            reconnect = self.__active and self.__reconnect
+        if not reconnect:
+            self.__close()
+            return
+        self.__set_status(self.RECONNECTING)
+        self.__manager.schedule_reconnect(self, uniform(self.__delay / 2, self.__delay))
+        self.__delay = min(self.__delay * 2, Channel.RECONNECT_MAX_DELAY)
+
+    def fail(self) -> None:
+        """
+        Drops the connections after serving them raised, and reconnects, like after losing them, if it should.
+        | Should that fail as well, e.g. a subscriber to STATUS raising too, the car is closed for good.
+
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :return: None
+        """
+        try:
+            self.__lost()
+        except Exception:
+            print_exc()
+            with self.__lock:
+                self.__active = False
+            self.__close_sockets()
+            self.__closed.set()
+
+    def reconnect_failed(self) -> None:
+        """
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :return: None
+        """
+        if self.__active:
+            self.__manager.schedule_reconnect(self, uniform(self.__delay / 2, self.__delay))
+            self.__delay = min(self.__delay * 2, Channel.RECONNECT_MAX_DELAY)
+        else:
+            self.__close()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until every change set so far has been sent
+
+        :param timeout: seconds to wait at most, None waits as long as it takes
+
+        :return: whether everything has been sent
+        """
+        with self.__lock:
+            return self.__changed.wait_for(
+                lambda: not (self.__pending or self.__commands) or self.__receiving is None, timeout
+            ) and not self.__pending
+
+    def deactivate(self, timeout=None):
+        """
+        Sends what is left to send, and closes the connections
+
+        :param timeout: seconds to wait for the connections to close, None waits as long as it takes
+
+        :return: None
+        """
+        with self.__lock:
+            self.__active = False
+        self.__manager.call_soon(self.handle_writable if self.__receiving is not None else self.__close, self)
+        self.__closed.wait(timeout)
+
+    def set_value(self, key, value):
+        self.set_values([key], [value])
+
+    def set_values(self, keys, values):
+        with self.__lock:
+            for key, value in zip(keys, values):
+                self.__protocol.set_value(key, value)
+            self.__pending = True
+        self.__manager.call_soon(self.handle_writable, self)
+
+    def subscribe(self, keys, callback, dispatch=None) -> int:
+        """
+        Subscribes a callback to the changes of the state of the car, and of the STATUS of the connection.
+        Callbacks are called on the I/O thread, shared by every car of the manager, unless they give a dispatch.
+
+        :param keys: the keys to watch, None watches every key
+        :param callback: called with a dictionary of the changed keys, and their new values
+        :param dispatch: called with the callback, and its argument instead of calling the callback on the I/O thread
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe(keys, callback, dispatch)
+
+    def subscribe_frames(self, callback) -> int:
+        """
+        Subscribes a callback to every telemetry frame, whether it changed anything or not
+
+        :param callback: called with the frames of each batch, and the time they were received at, by the clock
+                         of the latency monitor, on the I/O thread
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe_frames(callback)
+
+    def unsubscribe(self, token) -> None:
+        self.__subscriptions.unsubscribe(token)
+
+    def snapshot(self):
+        return self.__protocol.snapshot
+
+    def latency(self) -> dict:
+        return self.__protocol.latency.summary()
+
+    def telemetry_age(self, key):
+        return self.__protocol.latency.age(key)
+
+    def get_value(self, key):
+        return self.__protocol.snapshot[key]
+
+    def get_values(self, keys):
+        return self.__protocol.snapshot.get_values(keys)
+
+
+class ChannelManager:
+    """
+    Serves the connections of any number of cars on a single I/O thread, waiting on all of them with a selector.
+    | Commands, and acknowledgements are written without blocking, whatever does not fit into the socket is sent
+    | when it becomes writable again. Handshakes block, so the first one runs on the thread of the caller,
+    | or on a thread of its own for each car of connect_all, and reconnections run on short lived threads of their
+    | own, handing the new connections to the I/O thread. Whatever serving a car raises drops that car only,
+    | which reconnects, like after losing its connections.
+
+    .. attribute:: channels
+        The ManagedChannel of each car connected so far
+    """
+
+    def __init__(self):
+        self.channels = []
+        self.__selector = DefaultSelector()
+        self.__wakeup_receiver, self.__wakeup_sender = socketpair()
+        self.__wakeup_receiver.setblocking(False)
+        self.__wakeup_sender.setblocking(False)
+        self.__selector.register(self.__wakeup_receiver, EVENT_READ)
+        self.__lock = Lock()
+        self.__calls = []
+        self.__reconnects = []
+        self.__watched = dict()
+        self.__stopped = False
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def connect(self, host, port, password, delta=None, binary=True, reconnect=True, transport=None,
+                handshake_timeout=Channel.HANDSHAKE_TIMEOUT):
+        """
+        Connects to a car, and starts serving it on the I/O thread, if the password was accepted
+
+        :param host: IP address of the controller
+        :param port: port of the controller
+        :param password: password of the controller
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param reconnect: whether to reconnect, when the connection is lost
+        :param transport: opens the connections to the controller, a TcpTransport to host, and port if None
+        :param handshake_timeout: seconds to wait for the answer of the controller, None waits as long as it takes
+
+        :return: the ManagedChannel of the car, which is not granted, if the password was rejected
+
+        :raises OSError: if the controller can not be reached, or does not answer in time
+        """
+        transport = transport if transport is not None else TcpTransport(host, port)
+        channel = ManagedChannel(self, transport, password, delta, binary, reconnect, handshake_timeout)
+        self.__open(channel)
+        self.channels.append(channel)
+        return channel
+
+    def connect_all(self, addresses, password, delta=None, binary=True, reconnect=True,
+                    handshake_timeout=Channel.HANDSHAKE_TIMEOUT) -> list:
+        """
+        Connects to several cars at once, running their handshakes in parallel, so connecting a fleet takes
+        as long as its slowest car, not as long as all of them together
+
+        :param addresses: the IP address, and port of the controller of each car
+        :param password: password of the controllers
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param reconnect: whether to reconnect, when the connection is lost
+        :param handshake_timeout: seconds to wait for the answer of the controller, None waits as long as it takes
+
+        :return: the ManagedChannel of each car, as connect returns it, or the OSError connecting to it raised,
+                 in the order of the addresses
+        """
+        results = [
+            ManagedChannel(self, TcpTransport(host, port), password, delta, binary, reconnect, handshake_timeout)
+            for host, port in addresses
+        ]
+
+        def open_channel(index):
+            try:
+                self.__open(results[index])
+            except OSError as error:
+                results[index] = error
+
+        threads = [Thread(target=open_channel, args=(index,), daemon=True) for index in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.channels.extend(result for result in results if isinstance(result, ManagedChannel))
+        return results
+
+    def __open(self, channel):
+        """
+        Runs the handshake of a new car on the calling thread, and hands its connections to the I/O thread
+
+        :param channel: the ManagedChannel of the car
+
+        :return: None
+
+        :raises OSError: if the controller can not be reached, or does not answer in time
+        """
+        opened = channel.open()
+        if opened is not None:
+            self.call_soon(lambda: channel.attach(*opened), channel)
+
+    def call_soon(self, function, channel=None) -> None:
+        """
+        Calls a function on the I/O thread
+
+        :param function: the function to call, without arguments
+        :param channel: the ManagedChannel the call serves, which is dropped if it raises
+
+        :return: None
+        """
+        with self.__lock:
+            self.__calls.append((function, channel))
+        try:
+            self.__wakeup_sender.send(b'\0')
+        except BlockingIOError:
+            # A wakeup is pending already
+            pass
+
+    def schedule_reconnect(self, channel, delay) -> None:
+        """
+        :Assumptions:
+          * This method is called on the I/O thread
+        """
+        heappush(self.__reconnects, (monotonic() + delay, id(channel), channel))
+
+    def watch(self, channel) -> None:
+        """
+        Updates the events the selector waits for on the connections of a channel
+
+        :Assumptions:
+          * This method is called on the I/O thread
+        """
+        wanted = channel.sockets()
+        for connection in self.__watched.get(channel, dict()):
+            if connection not in wanted:
+                self.__selector.unregister(connection)
+        for connection, events in wanted.items():
+            if connection not in self.__watched.get(channel, dict()):
+                self.__selector.register(connection, events, channel)
+            elif self.__watched[channel][connection] != events:
+                self.__selector.modify(connection, events, channel)
+        self.__watched[channel] = wanted
+
+    def unwatch(self, channel) -> None:
+        """
+        :Assumptions:
+          * This method is called on the I/O thread
+        """
+        for connection in self.__watched.pop(channel, dict()):
+            self.__selector.unregister(connection)
+
+    def __reconnect(self, channel):
+        try:
+            opened = channel.open()
+        except OSError:
+            opened = None
+        if opened is None:
+            self.call_soon(channel.reconnect_failed, channel)
+        else:
+            self.call_soon(lambda: channel.attach(*opened), channel)
+
+    def __drain_wakeups(self):
+        try:
+            while self.__wakeup_receiver.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def __dispatch(self, key, events):
+        """
+        Hands an event of the selector to the channel it belongs to
+
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :param key: SelectorKey of the connection
+        :param events: the events ready on the connection
+
+        :return: None
+        """
+        if key.fileobj is self.__wakeup_receiver:
+            self.__drain_wakeups()
+            return
+        channel = key.data
+        if events & EVENT_READ:
+            channel.handle_readable()
+        if events & EVENT_WRITE:
+            channel.handle_writable()
+
+    def __start_reconnects(self):
+        while self.__reconnects and self.__reconnects[0][0] <= monotonic():
+            channel = heappop(self.__reconnects)[2]
+            Thread(target=self.__reconnect, args=(channel,), daemon=True).start()
+
+    @staticmethod
+    def __isolate(channel, function, *arguments):
+        """
+        Calls a function serving a channel, so whatever it raises drops that channel, not the I/O thread,
+        and with it every other car
+
+        :Assumptions:
+          * This method is called on the I/O thread
+
+        :param channel: the ManagedChannel served, None if the call belongs to the manager, which raises then
+        :param function: the function to call
+        :param arguments: the arguments to call it with
+
+        :return: None
+        """
+        try:
+            function(*arguments)
+        except Exception:
+            if channel is None:
+                raise
+            print_exc()
+            channel.fail()
+
+    def __run(self):
+        while not self.__stopped:
+            timeout = max(0.0, self.__reconnects[0][0] - monotonic()) if self.__reconnects else None
+            for key, events in self.__selector.select(timeout):
+                self.__isolate(key.data, self.__dispatch, key, events)
+
+            with self.__lock:
+                calls, self.__calls = self.__calls, []
+            for call, channel in calls:
+                self.__isolate(channel, call)
+
+            self.__start_reconnects()
+            for channel in list(self.__watched):
+                self.watch(channel)
+
+    def close(self) -> None:
+        """Deactivates every car, and stops the I/O thread"""
+        if not self.thread.is_alive():
+            return
+        for channel in self.channels:
+            channel.deactivate(timeout=1.0)
+
+        def stop():
+            self.__stopped = True
+        self.call_soon(stop)
+        self.thread.join()
+        self.__selector.close()
+        self.__wakeup_receiver.close()
+        self.__wakeup_sender.close()
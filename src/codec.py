@@ -0,0 +1,167 @@
+from struct import Struct
+from json import dumps, loads
+from framing import JsonFrameDecoder
+
+
+class JsonCodec:
+    """
+    The original wire format: every frame is a JSON object, terminated by a newline
+
+    :var: NAME
+    """
+
+    NAME = 'JSON'
+
+    @staticmethod
+    def encode(frame) -> bytes:
+        return dumps(frame).encode() + b'\n'
+
+    @staticmethod
+    def decoder():
+        return JsonFrameDecoder()
+
+
+class BinaryCodec:
+    """
+    Compact wire format for the tables of the Channel.
+    | Every known flag is a bit, every known number is a fixed point integer, and whatever else is in the frame
+    | is carried as JSON at the end, so no key is ever lost, not even a number that is not finite,
+    | or does not fit into an int32 in hundredths.
+
+    .. note:: Layout
+        | header: kind (uint8), flag mask (uint32), flag bits (uint32), number mask (uint8), extra length (uint16)
+        | followed by the sequence number (uint32), if the kind is KIND_SEQUENCED,
+        | followed by an int32 for each number in the number mask, in hundredths,
+        | followed by the extra JSON object, if its length is not zero. Everything is little endian.
+
+    :var: NAME
+    :var: FLAGS
+    :var: NUMBERS
+    :var: SCALE
+    """
+
+    NAME = 'BIN1'
+
+    FLAGS = (
+        'forward', 'backward', 'turn_left', 'turn_right', 'right_indicator', 'left_indicator', 'hazard_warning',
+        'lights', 'horn', 'reverse', 'line', 'distance_keeping', 'line_following', 'keep_contained', 'change_direction'
+    )
+    NUMBERS = ('distance', 'speed')
+    SCALE = 100
+    NUMBER_MIN = -2 ** 31
+    NUMBER_MAX = 2 ** 31 - 1
+
+    KIND_STATE = 1
+    KIND_SEQUENCED = 2
+    HEADER = Struct('<BIIBH')
+    SEQUENCE = Struct('<I')
+    NUMBER = Struct('<i')
+
+    FLAG_BITS = {key: 1 << index for index, key in enumerate(FLAGS)}
+    NUMBER_BITS = {key: 1 << index for index, key in enumerate(NUMBERS)}
+
+    @classmethod
+    def encode(cls, frame) -> bytes:
+        flag_mask = flag_bits = number_mask = 0
+        sequence = None
+        numbers = dict()
+        extra = dict()
+
+        for key, value in frame.items():
+            if key == 'seq' and isinstance(value, int):
+                sequence = value
+            elif key in cls.FLAG_BITS and isinstance(value, bool):
+                flag_mask |= cls.FLAG_BITS[key]
+                if value:
+                    flag_bits |= cls.FLAG_BITS[key]
+            elif key in cls.NUMBER_BITS and cls.__fits(value):
+                number_mask |= cls.NUMBER_BITS[key]
+                numbers[key] = value
+            else:
+                extra[key] = value
+
+        extra_data = dumps(extra).encode() if extra else b''
+        kind = cls.KIND_STATE if sequence is None else cls.KIND_SEQUENCED
+        data = [cls.HEADER.pack(kind, flag_mask, flag_bits, number_mask, len(extra_data))]
+        if sequence is not None:
+            data.append(cls.SEQUENCE.pack(sequence))
+        for key in cls.NUMBERS:
+            if key in numbers:
+                data.append(cls.NUMBER.pack(round(numbers[key] * cls.SCALE)))
+        data.append(extra_data)
+        return b''.join(data)
+
+    @classmethod
+    def __fits(cls, value) -> bool:
+        """
+        :param value: value of a number
+
+        :return: whether the value is a finite number, that fits into an int32 in hundredths
+        """
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return False
+        return cls.NUMBER_MIN <= value * cls.SCALE <= cls.NUMBER_MAX
+
+    @staticmethod
+    def decoder():
+        return BinaryFrameDecoder()
+
+
+class BinaryFrameDecoder:
+    """Incremental decoder for a stream of BinaryCodec frames, with the same interface as JsonFrameDecoder"""
+
+    def __init__(self):
+        self.__pending = bytearray()
+
+    def feed(self, data) -> list:
+        self.__pending += data
+        frames = []
+        position = 0
+        header = BinaryCodec.HEADER
+        number = BinaryCodec.NUMBER
+
+        while len(self.__pending) - position >= header.size:
+            kind, flag_mask, flag_bits, number_mask, extra_length = header.unpack_from(self.__pending, position)
+            if kind not in (BinaryCodec.KIND_STATE, BinaryCodec.KIND_SEQUENCED):
+                # Out of sync, nothing after this point can be trusted
+                position = len(self.__pending)
+                break
+            sequenced = kind == BinaryCodec.KIND_SEQUENCED
+            size = header.size + number.size * bin(number_mask).count('1') + extra_length
+            size += BinaryCodec.SEQUENCE.size if sequenced else 0
+            if len(self.__pending) - position < size:
+                break
+
+            frame = {key: bool(flag_bits & bit) for key, bit in BinaryCodec.FLAG_BITS.items() if flag_mask & bit}
+            offset = position + header.size
+            if sequenced:
+                frame['seq'] = BinaryCodec.SEQUENCE.unpack_from(self.__pending, offset)[0]
+                offset += BinaryCodec.SEQUENCE.size
+            for key, bit in BinaryCodec.NUMBER_BITS.items():
+                if number_mask & bit:
+                    frame[key] = number.unpack_from(self.__pending, offset)[0] / BinaryCodec.SCALE
+                    offset += number.size
+            if extra_length:
+                frame.update(self.__extra(self.__pending[offset:offset + extra_length]))
+
+            frames.append(frame)
+            position += size
+
+        del self.__pending[:position]
+        return frames
+
+    @staticmethod
+    def __extra(data) -> dict:
+        """
+        :param data: the extra JSON object of a frame
+
+        :return: the decoded object, empty if it is corrupt, so the flags, and numbers of the frame are still kept
+        """
+        try:
+            extra = loads(bytes(data))
+        except ValueError:
+            return {}
+        return extra if isinstance(extra, dict) else {}
+
+
+CODECS = {codec.NAME: codec for codec in (JsonCodec, BinaryCodec)}
@@ -0,0 +1,246 @@
+from socket import timeout
+from threading import Thread, Lock, Timer
+from time import perf_counter
+from channel import Channel
+from protocol import Keys, TelemetrySnapshot
+from subscriptions import Subscriptions
+from transport import TcpTransport
+
+
+class PendingChannel(Keys):
+    """
+    Stands in for the Channel of a window, until the connection is made, so the window can show up right away.
+    | Commands are dropped, instead of being sent once connected, so a key held meanwhile does not move the car later.
+    | The telemetry reads as nothing reported yet.
+
+    .. attribute:: status
+        The state of the Connector making the connection, also published to the subscribers of STATUS
+
+    .. attribute:: granted
+        Always False, as nothing has accepted the password yet
+    """
+
+    STATUS = Channel.STATUS
+    CONNECTED = Channel.CONNECTED
+    RECONNECTING = Channel.RECONNECTING
+    DISCONNECTED = Channel.DISCONNECTED
+
+    codec = None
+
+    def __init__(self, status):
+        """
+        :param status: the state to show at first
+        """
+        self.status = status
+        self.granted = False
+        self.__subscriptions = Subscriptions()
+        self.__snapshot = TelemetrySnapshot()
+
+    def set_status(self, status) -> None:
+        self.status = status
+        self.__subscriptions.notify({self.STATUS: status})
+
+    def flush(self, timeout=None) -> bool:
+        return True
+
+    def deactivate(self):
+        pass
+
+    def set_value(self, key, value):
+        pass
+
+    def set_values(self, keys, values):
+        pass
+
+    def subscribe(self, keys, callback, dispatch=None) -> int:
+        return self.__subscriptions.subscribe(keys, callback, dispatch)
+
+    def subscribe_frames(self, callback) -> int:
+        return self.__subscriptions.subscribe_frames(callback)
+
+    def unsubscribe(self, token) -> None:
+        self.__subscriptions.unsubscribe(token)
+
+    def snapshot(self):
+        return self.__snapshot
+
+    def latency(self) -> dict:
+        return dict()
+
+    def telemetry_age(self, key):
+        return None
+
+    def get_value(self, key):
+        return self.__snapshot[key]
+
+    def get_values(self, keys):
+        return self.__snapshot.get_values(keys)
+
+
+class Connector:
+    """
+    Connects a Channel on a thread of its own, so the user interface can show up, and stay responsive meanwhile.
+    | The connection is given up after TIMEOUT seconds, or when cancelled, whichever comes first. A Channel
+    | finishing its handshake after that is closed right away. The callback is told about every change of state,
+    | and about the first telemetry frame, whose arrival is the time to first frame of the startup.
+
+    .. attribute:: state
+        CONNECTING, CONNECTED, REJECTED, FAILED, TIMED_OUT, or CANCELLED
+
+    .. attribute:: pending
+        PendingChannel to show until connected, its status follows the state
+
+    .. attribute:: channel
+        The connected Channel, None until connected
+
+    .. attribute:: error
+        Description of the failure, None unless FAILED
+
+    .. attribute:: connected_after
+        Seconds from the start until the controller accepted the password, None until then
+
+    .. attribute:: first_frame_after
+        Seconds from the start until the first telemetry frame arrived, None until then
+
+    :var: TIMEOUT
+    """
+
+    TIMEOUT = 5.0
+
+    CONNECTING = 'connecting'
+    CONNECTED = Channel.CONNECTED
+    REJECTED = 'rejected'
+    FAILED = 'failed'
+    TIMED_OUT = 'timed out'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, connect, callback, dispatch=None, timeout=TIMEOUT):
+        """
+        :param connect: called with the timeout on the thread of the connector, returns the Channel,
+                        see tcp for the usual one
+        :param callback: called with the connector, when its state changes, and when the first frame arrives
+        :param dispatch: called with the callback, and the connector instead of calling the callback
+                         on the thread of the connector, e.g. to hand it to the main loop of the UI
+        :param timeout: seconds to wait for the connection at most, None waits as long as it takes
+        """
+        self.state = self.CONNECTING
+        self.pending = PendingChannel(self.CONNECTING)
+        self.channel = None
+        self.error = None
+        self.connected_after = None
+        self.first_frame_after = None
+        self.__connect = connect
+        self.__callback = callback
+        self.__dispatch = dispatch
+        self.__timeout = timeout
+        self.__lock = Lock()
+        self.__subscription = None
+        self.__started = perf_counter()
+        self.__timer = Timer(timeout, self.__finish, args=(self.TIMED_OUT,)) if timeout is not None else None
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+        if self.__timer is not None:
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    @staticmethod
+    def tcp(host, port, password, **options):
+        """
+        :param host: IP address of the controller
+        :param port: port of the controller
+        :param password: password of the controller
+        :param options: passed to Channel
+
+        :return: connect function for a Connector, connecting over TCP within the timeout
+        """
+        def connect(timeout):
+            transport = TcpTransport(host, port, connect_timeout=timeout)
+            return Channel(host, port, password, transport=transport, handshake_timeout=timeout, **options)
+        return connect
+
+    @property
+    def elapsed(self) -> float:
+        """
+        :return: seconds since the connector started
+        """
+        return perf_counter() - self.__started
+
+    def cancel(self) -> None:
+        """Gives up the connection, unless it has been made already"""
+        self.__finish(self.CANCELLED)
+
+    def __notify(self):
+        if self.__dispatch is None:
+            self.__callback(self)
+        else:
+            self.__dispatch(self.__callback, self)
+
+    def __finish(self, state, error=None) -> bool:
+        with self.__lock:
+            if self.state != self.CONNECTING:
+                return False
+            self.state = state
+            self.error = error
+        if self.__timer is not None:
+            self.__timer.cancel()
+        self.pending.set_status(state)
+        self.__notify()
+        return True
+
+    def __run(self):
+        try:
+            channel = self.__connect(self.__timeout)
+        except timeout:
+            # The handshake ran out of the same time, as the timer, which may not have fired yet
+            self.__finish(self.TIMED_OUT)
+            return
+        except OSError as error:
+            self.__finish(self.FAILED, str(error) or type(error).__name__)
+            return
+        if not channel.granted:
+            channel.deactivate()
+            self.__finish(self.REJECTED)
+            return
+
+        with self.__lock:
+            if self.state != self.CONNECTING:
+                # Timed out, or cancelled meanwhile
+                abandoned = True
+            else:
+                abandoned = False
+                self.state = self.CONNECTED
+                self.channel = channel
+                self.connected_after = self.elapsed
+        if abandoned:
+            channel.deactivate()
+            return
+        if self.__timer is not None:
+            self.__timer.cancel()
+        self.__subscription = channel.subscribe(None, self.__on_telemetry)
+        self.__notify()
+        # The first frame may have arrived before the subscription
+        self.__on_telemetry(None)
+
+    def __on_telemetry(self, changes):
+        with self.__lock:
+            if self.first_frame_after is not None or self.channel.snapshot().version == 0:
+                return
+            self.first_frame_after = self.elapsed
+        self.channel.unsubscribe(self.__subscription)
+        self.__notify()
+
+    def describe(self) -> str:
+        """
+        :return: the progress of the connection, for the user
+        """
+        if self.state == self.CONNECTING:
+            return 'Connecting... %.1f s' % self.elapsed
+        if self.state == self.CONNECTED:
+            if self.first_frame_after is None:
+                return 'Connected in %d ms' % (self.connected_after * 1000)
+            return 'Connected in %d ms, first frame after %d ms' % (
+                self.connected_after * 1000, self.first_frame_after * 1000
+            )
+        if self.state == self.FAILED:
+            return 'Failed: %s' % self.error
+        return self.state.capitalize()
@@ -0,0 +1,216 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import QTimer, QRectF, QPointF, QSize
+from PyQt5.QtGui import QPainter, QPixmap, QColor, QPen, QFont, QTransform
+from PyQt5.Qt import Qt
+from protocol import Keys
+from view_model import ViewModel
+
+
+class Dashboard(QWidget):
+    """
+    The instruments of the car, painted with QPainter, instead of a widget, and a stylesheet each.
+    | The state is applied at most once every FRAME_INTERVAL milliseconds, however fast the telemetry arrives,
+    | and only the instruments, whose element of the ViewModel has changed are repainted, by invalidating
+    | just their rectangle.
+    | The background, with the faces of the gauges is painted once per size into a pixmap, and so is every
+    | look of the switches, so repainting a switch is copying a pixmap.
+    | Everything is laid out in DESIGN_SIZE, and scaled to the size of the widget.
+
+    :var: FRAME_INTERVAL
+    :var: DESIGN_SIZE
+    """
+
+    FRAME_INTERVAL = 16
+    DESIGN_SIZE = QSize(500, 450)
+
+    BACKGROUND_COLOR = QColor('#b8e5ff')
+    FACE_COLOR = QColor('white')
+    ACTIVE_COLOR = QColor('yellow')
+    LIGHTS_COLOR = QColor('#fdff82')
+    WARNING_COLOR = QColor('yellow')
+    COLLIDE_COLOR = QColor('red')
+    BORDER_COLOR = QColor('black')
+    ACTIVE_BORDER_COLOR = QColor('red')
+    LINE_COLOR = QColor('black')
+    LEVEL_COLORS = {ViewModel.NORMAL: FACE_COLOR, ViewModel.WARNING: WARNING_COLOR, ViewModel.DANGER: COLLIDE_COLOR}
+
+    DISTANCE_TEXT = 'Distance'
+    DISTANCE_MEASURE = 'cm'
+    DISTANCE_RANGE = 300
+    SPEED_TEXT = 'Speed'
+    SPEED_MEASURE = 'km/h'
+    SPEED_RANGE = 40
+
+    # Switches, with their rectangle, text, and the fill when active, the arrows show a red border instead
+    SWITCHES = {
+        Keys.L_INDICATOR: (QRectF(50, 50, 50, 50), '🡀', ACTIVE_COLOR),
+        Keys.R_INDICATOR: (QRectF(400, 50, 50, 50), '🡂', ACTIVE_COLOR),
+        Keys.HAZARD_WARNING: (QRectF(225, 80, 50, 50), '⚠', ACTIVE_COLOR),
+        Keys.LIGHTS: (QRectF(225, 150, 50, 50), '⛭', LIGHTS_COLOR),
+        Keys.FORWARD: (QRectF(200, 250, 100, 100), '🡅', None),
+        Keys.BACKWARD: (QRectF(200, 350, 100, 100), '🡇', None),
+        Keys.LEFT: (QRectF(100, 350, 100, 100), '🡄', None),
+        Keys.RIGHT: (QRectF(300, 350, 100, 100), '🡆', None),
+        Keys.REVERSE: (QRectF(125, 275, 50, 50), 'R', None),
+    }
+    LINE_RECT = QRectF(240, 10, 20, 60)
+    DISTANCE_RECT = QRectF(15, 130, 200, 110)
+    SPEED_RECT = QRectF(285, 130, 200, 110)
+
+    def __init__(self, parent=None, predictor=None):
+        """
+        :param parent: parent widget
+        :param predictor: CollisionPredictor for the level of the distance, see ViewModel
+        """
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.__view_model = ViewModel(predictor)
+        self.__latest = None
+        self.__background = None
+        self.__sprites = dict()
+        self.__frame_timer = QTimer(self)
+        self.__frame_timer.setSingleShot(True)
+        self.__frame_timer.timeout.connect(self.render_pending)
+        self.__instruments = dict(
+            {key: rect for key, (rect, _, _) in self.SWITCHES.items()},
+            **{Keys.LINE: self.LINE_RECT, Keys.DISTANCE: self.DISTANCE_RECT, Keys.SPEED: self.SPEED_RECT}
+        )
+
+    def sizeHint(self):
+        return self.DESIGN_SIZE
+
+    def show_state(self, state) -> None:
+        """
+        Shows a state of the car with the next frame
+
+        :param state: TelemetrySnapshot to show
+
+        :return: None
+        """
+        self.__latest = state
+        if not self.__frame_timer.isActive():
+            self.__frame_timer.start(self.FRAME_INTERVAL)
+
+    def render_pending(self) -> None:
+        """Invalidates the instruments, whose value differs in the state waiting to be shown"""
+        self.__frame_timer.stop()
+        state, self.__latest = self.__latest, None
+        if state is None:
+            return
+        transform = self.__transform()
+        for key in self.__view_model.render(state):
+            rect = self.__instruments.get(key)
+            if rect is not None:
+                self.update(transform.mapRect(rect).toAlignedRect().adjusted(-2, -2, 2, 2))
+
+    def __transform(self) -> QTransform:
+        return QTransform.fromScale(
+            self.width() / self.DESIGN_SIZE.width(), self.height() / self.DESIGN_SIZE.height()
+        )
+
+    def resizeEvent(self, event):
+        self.__background = None
+        self.__sprites.clear()
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        ratio = self.devicePixelRatioF()
+        if self.__background is None:
+            self.__background = self.__paint_background(ratio)
+        exposed = event.rect()
+        painter = QPainter(self)
+        painter.drawPixmap(QPointF(exposed.topLeft()), self.__background, QRectF(
+            exposed.x() * ratio, exposed.y() * ratio, exposed.width() * ratio, exposed.height() * ratio
+        ))
+
+        view = self.__view_model.view
+        transform = self.__transform()
+        for key, (rect, _, _) in self.SWITCHES.items():
+            target = transform.mapRect(rect)
+            if target.intersects(QRectF(exposed)):
+                painter.drawPixmap(target.topLeft(), self.__sprite(key, view.get(key, False), ratio))
+
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setTransform(transform)
+        if transform.mapRect(self.LINE_RECT).intersects(QRectF(exposed)):
+            painter.fillRect(
+                self.LINE_RECT, self.LINE_COLOR if view.get(Keys.LINE) else self.FACE_COLOR
+            )
+        for key, rect, full_scale, measure in (
+                (Keys.DISTANCE, self.DISTANCE_RECT, self.DISTANCE_RANGE, self.DISTANCE_MEASURE),
+                (Keys.SPEED, self.SPEED_RECT, self.SPEED_RANGE, self.SPEED_MEASURE)):
+            if transform.mapRect(rect).intersects(QRectF(exposed)):
+                value, level = view.get(key, (False, ViewModel.NORMAL))
+                self.__paint_gauge(painter, rect, value, full_scale, measure, self.LEVEL_COLORS[level])
+        painter.end()
+
+    def __paint_background(self, ratio) -> QPixmap:
+        """
+        :return: the static parts: the background, and the faces, and captions of the gauges
+        """
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(self.BACKGROUND_COLOR)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setTransform(self.__transform())
+        painter.setFont(self.__font(12))
+        for rect, text in ((self.DISTANCE_RECT, self.DISTANCE_TEXT), (self.SPEED_RECT, self.SPEED_TEXT)):
+            painter.setPen(QPen(self.BORDER_COLOR, 1))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRoundedRect(rect, 5, 5)
+            painter.drawText(rect.adjusted(0, 0, 0, -5), Qt.AlignHCenter | Qt.AlignBottom, text)
+        painter.end()
+        return pixmap
+
+    def __sprite(self, key, active, ratio) -> QPixmap:
+        """
+        :return: the look of a switch, painted once per size
+        """
+        sprite = self.__sprites.get((key, active))
+        if sprite is not None:
+            return sprite
+        rect, text, active_fill = self.SWITCHES[key]
+        target = self.__transform().mapRect(rect)
+        sprite = QPixmap((target.size() * ratio).toSize())
+        sprite.setDevicePixelRatio(ratio)
+        sprite.fill(self.BACKGROUND_COLOR)
+        painter = QPainter(sprite)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.scale(target.width() / rect.width(), target.height() / rect.height())
+        local = QRectF(0, 0, rect.width(), rect.height()).adjusted(1, 1, -1, -1)
+        fill = active_fill if active and active_fill is not None else self.FACE_COLOR
+        border = self.ACTIVE_BORDER_COLOR if active and active_fill is None else self.BORDER_COLOR
+        painter.setPen(QPen(border, 2 if active and active_fill is None else 1))
+        painter.setBrush(fill)
+        painter.drawRoundedRect(local, 5, 5)
+        painter.setPen(self.BORDER_COLOR)
+        painter.setFont(self.__font(25 if rect.width() < 100 else 40))
+        painter.drawText(local, Qt.AlignCenter, text)
+        painter.end()
+        self.__sprites[(key, active)] = sprite
+        return sprite
+
+    def __paint_gauge(self, painter, rect, value, full_scale, measure, color):
+        """Paints the dynamic part of a gauge: its arc, filled up to the value, and the value itself"""
+        arc = QRectF(rect.center().x() - 45, rect.top() + 10, 90, 90)
+        painter.setPen(QPen(self.FACE_COLOR, 10, Qt.SolidLine, Qt.FlatCap))
+        painter.drawArc(arc, 225 * 16, -270 * 16)
+        if value is not False:
+            share = max(0.0, min(1.0, value / full_scale))
+            painter.setPen(QPen(color if color != self.FACE_COLOR else self.LINE_COLOR, 10, Qt.SolidLine,
+                                Qt.FlatCap))
+            painter.drawArc(arc, 225 * 16, int(-270 * 16 * share))
+        painter.fillRect(QRectF(arc.left() + 10, arc.center().y() - 15, arc.width() - 20, 30), self.BACKGROUND_COLOR)
+        painter.setPen(self.BORDER_COLOR)
+        painter.setFont(self.__font(16))
+        painter.drawText(
+            QRectF(arc.left(), arc.center().y() - 15, arc.width(), 30), Qt.AlignCenter,
+            '—' if value is False else '%g %s' % (value, measure)
+        )
+
+    @staticmethod
+    def __font(pixels) -> QFont:
+        font = QFont()
+        font.setPixelSize(pixels)
+        return font
@@ -0,0 +1,293 @@
+from math import inf, isnan
+from threading import Lock
+import numpy as np
+
+SMOOTH_CHUNK = 128
+
+
+class Filter:
+    """
+    Base of the filters of noisy sensor readings, which process whole batches of samples at once with NumPy.
+    | A filter keeps its state between batches, so feeding the samples one by one, or all at once gives the same
+    | output. NaN samples, e.g. a distance of False, while the sensor sees nothing, come out as NaN,
+    | and reset the filter, so it starts over with the next reading.
+    """
+
+    def process(self, samples) -> np.ndarray:
+        """
+        :param samples: the next samples, in chronological order
+
+        :return: the filtered samples
+        """
+        samples = np.asarray(samples, dtype=float)
+        output = np.full(len(samples), np.nan)
+        valid = ~np.isnan(samples)
+        if valid.all():
+            output[:] = self._process(samples)
+            return output
+        # The runs of valid samples, as their starts, and ends
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], valid.astype(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if start > 0:
+                self.reset()
+            output[start:end] = self._process(samples[start:end])
+        if not valid[-1]:
+            self.reset()
+        return output
+
+    def _process(self, samples) -> np.ndarray:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+def smooth(gains, samples, initial) -> np.ndarray:
+    """
+    Solves the recurrence output[i] = output[i - 1] + gains[i] * (samples[i] - output[i - 1]) for a batch at once,
+    as the product of a lower triangular matrix of the weights of the samples, in chunks of SMOOTH_CHUNK samples.
+
+    :param gains: the gain of each sample, between 0, and 1
+    :param samples: the samples
+    :param initial: the output before the first sample
+
+    :return: the output for each sample
+    """
+    output = np.empty(len(samples))
+    for start in range(0, len(samples), SMOOTH_CHUNK):
+        chunk = samples[start:start + SMOOTH_CHUNK]
+        gain = np.minimum(gains[start:start + SMOOTH_CHUNK], 1 - 1e-12)
+        # Logarithm of how much of the output before the chunk is left after each sample of it
+        kept = np.cumsum(np.log1p(-gain))
+        weights = np.tril(np.exp(np.minimum(kept[:, None] - kept[None, :], 0))) * gain[None, :]
+        output[start:start + len(chunk)] = weights @ chunk + np.exp(kept) * initial
+        initial = output[start + len(chunk) - 1]
+    return output
+
+
+class ExponentialFilter(Filter):
+    """Exponential moving average, each sample moves the output by alpha of its difference"""
+
+    def __init__(self, alpha):
+        """
+        :param alpha: weight of the newest sample, between 0, and 1, higher follows faster, but smooths less
+        """
+        self.alpha = alpha
+        self.__output = None
+
+    def reset(self) -> None:
+        self.__output = None
+
+    def _process(self, samples) -> np.ndarray:
+        initial = samples[0] if self.__output is None else self.__output
+        output = smooth(np.full(len(samples), self.alpha), samples, initial)
+        self.__output = output[-1]
+        return output
+
+
+class KalmanFilter(Filter):
+    """
+    One dimensional Kalman filter of a value, that drifts randomly, e.g. a distance.
+    | The gains do not depend on the samples, only on the noises, so they are computed ahead of the batch,
+    | until they settle, which takes a few dozen samples, and the batch is then smoothed like an average.
+    """
+
+    def __init__(self, process_noise, measurement_noise):
+        """
+        :param process_noise: variance of the change of the value between two samples
+        :param measurement_noise: variance of the error of a sample
+        """
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.__estimate = None
+        self.__variance = None
+        self.__gain = None
+        self.__settled = False
+
+    def reset(self) -> None:
+        self.__estimate = None
+        self.__variance = None
+        self.__gain = None
+        self.__settled = False
+
+    def __gains(self, count) -> np.ndarray:
+        gains = np.empty(count)
+        for index in range(count):
+            if self.__settled:
+                gains[index:] = self.__gain
+                break
+            prior = self.__variance + self.process_noise
+            gain = prior / (prior + self.measurement_noise)
+            self.__variance = (1 - gain) * prior
+            self.__settled = self.__gain is not None and abs(gain - self.__gain) < 1e-12
+            self.__gain = gain
+            gains[index] = gain
+        return gains
+
+    def _process(self, samples) -> np.ndarray:
+        if self.__estimate is None:
+            # The first sample is taken as it is, with the uncertainty of a measurement
+            self.__estimate = samples[0]
+            self.__variance = self.measurement_noise
+            rest = self._process(samples[1:]) if len(samples) > 1 else np.empty(0)
+            return np.concatenate(([samples[0]], rest))
+        output = smooth(self.__gains(len(samples)), samples, self.__estimate)
+        self.__estimate = output[-1]
+        return output
+
+
+class MedianFilter(Filter):
+    """Median of the last window samples, which drops the spikes of single bad readings entirely"""
+
+    def __init__(self, window):
+        """
+        :param window: the number of samples to take the median of, odd, so there is a sample in the middle
+        """
+        self.window = window
+        self.__history = None
+
+    def reset(self) -> None:
+        self.__history = None
+
+    def _process(self, samples) -> np.ndarray:
+        if self.__history is None:
+            # The first sample after a reset stands in for the ones before it
+            self.__history = np.full(self.window - 1, samples[0])
+        data = np.concatenate((self.__history, samples))
+        windows = np.lib.stride_tricks.as_strided(
+            data, shape=(len(samples), self.window), strides=data.strides * 2, writeable=False
+        )
+        middle = self.window // 2
+        output = np.partition(windows, middle, axis=1)[:, middle]
+        self.__history = data[len(data) - self.window + 1:]
+        return output
+
+
+class FilterPipeline(Filter):
+    """Filters, each filtering the output of the previous one"""
+
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def reset(self) -> None:
+        for stage in self.filters:
+            stage.reset()
+
+    def _process(self, samples) -> np.ndarray:
+        for stage in self.filters:
+            samples = stage.process(samples)
+        return samples
+
+
+class CollisionPredictor:
+    """
+    Filters the distance ahead of the car, and predicts the time until it runs into what is there.
+    | The closing speed is the rate the filtered distance shrank at over the last RATE_WINDOW seconds, smoothed,
+    | so it covers the speed of the car, and of whatever it is driving at, and going backwards away from it
+    | closes nothing. A gap in the distance restarts it.
+    | The time to collision is the filtered distance over the closing speed, inf while it is below
+    | MIN_CLOSING_SPEED. Subscribe feed to the frames of a channel, so a distance holding steady is a sample too.
+    | It only queues the samples, which predict filters as a batch, so the filtering costs a call per frame
+    | of the user interface, whatever the sample rate.
+
+    .. attribute:: prediction
+        The filtered distance, False while nothing is in range, the closing speed, and the time to collision,
+        as of the last sample processed
+
+    :var: MIN_CLOSING_SPEED
+    :var: RATE_WINDOW
+    """
+
+    MIN_CLOSING_SPEED = 1.0
+    RATE_WINDOW = 0.25
+
+    def __init__(self, distance_filter=None, rate_filter=None, key='distance'):
+        """
+        :param distance_filter: Filter of the distance, a median of 5 samples, then a KalmanFilter if None
+        :param rate_filter: Filter of the closing speed, an ExponentialFilter if None
+        :param key: the key of the distance in the frames given to feed
+        """
+        self.distance_filter = distance_filter if distance_filter is not None else FilterPipeline(
+            MedianFilter(5), KalmanFilter(process_noise=4.0, measurement_noise=25.0)
+        )
+        self.rate_filter = rate_filter if rate_filter is not None else ExponentialFilter(0.2)
+        self.key = key
+        self.prediction = (False, 0.0, inf)
+        self.__history = (np.empty(0), np.empty(0))
+        self.__pending_lock = Lock()
+        self.__pending_times = []
+        self.__pending_distances = []
+        self.__lock = Lock()
+
+    def reset(self) -> None:
+        """Forgets every sample, e.g. when switching to another car"""
+        with self.__lock:
+            with self.__pending_lock:
+                self.__pending_times = []
+                self.__pending_distances = []
+            self.distance_filter.reset()
+            self.rate_filter.reset()
+            self.__history = (np.empty(0), np.empty(0))
+            self.prediction = (False, 0.0, inf)
+
+    def feed(self, frames, received) -> None:
+        """
+        Queues the distance of every frame, as a sample of the time it was received at, for the next predict.
+        | A frame without the distance, or with a value of False has nothing in range.
+
+        :param frames: the telemetry frames, as given to the subscribers of the frames of a channel
+        :param received: the time the frames were received at, in seconds
+
+        :return: None
+        """
+        distances = [frame.get(self.key, False) for frame in frames]
+        with self.__pending_lock:
+            self.__pending_times.extend([received] * len(distances))
+            self.__pending_distances.extend(np.nan if value is False or value is None else value for value in distances)
+
+    def predict(self) -> tuple:
+        """
+        Processes the samples queued by feed
+
+        :return: the prediction, see the attribute
+        """
+        with self.__lock:
+            with self.__pending_lock:
+                times, self.__pending_times = self.__pending_times, []
+                distances, self.__pending_distances = self.__pending_distances, []
+            if times:
+                self.process(times, distances)
+            return self.prediction
+
+    def process(self, times, distances) -> tuple:
+        """
+        :param times: the times of the samples, in seconds
+        :param distances: the distances, NaN while nothing is in range
+
+        :return: the filtered distances, the closing speeds, and the times to collision of the samples, as arrays
+        """
+        times = np.asarray(times, dtype=float)
+        filtered = self.distance_filter.process(distances)
+        all_times = np.concatenate((self.__history[0], times))
+        all_filtered = np.concatenate((self.__history[1], filtered))
+        offset = len(self.__history[0])
+
+        # Each sample is compared with the last one at least RATE_WINDOW seconds before it, unless there is a gap
+        # after that one, so the rate does not span a restart of the distance filter
+        bases = np.searchsorted(all_times, times - self.RATE_WINDOW, side='right') - 1
+        gaps = np.maximum.accumulate(np.where(np.isnan(all_filtered), np.arange(len(all_filtered)), -1))
+        valid = (bases >= 0) & (bases > gaps[offset:])
+        bases = np.maximum(bases, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(valid, (all_filtered[bases] - filtered) / (times - all_times[bases]), np.nan)
+        # Samples without a rate restart the average too
+        closing = self.rate_filter.process(rates)
+        closing = np.where(np.isnan(closing), 0.0, closing)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ttc = np.where(closing >= self.MIN_CLOSING_SPEED, filtered / closing, inf)
+
+        kept = max(0, int(np.searchsorted(all_times, times[-1] - self.RATE_WINDOW, side='right')) - 1)
+        self.__history = (all_times[kept:], all_filtered[kept:])
+        distance = filtered[-1]
+        self.prediction = (False if isnan(distance) else float(distance), float(closing[-1]), float(ttc[-1]))
+        return filtered, closing, ttc
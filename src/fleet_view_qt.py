@@ -0,0 +1,143 @@
+from threading import Lock
+from PyQt5.QtWidgets import QWidget, QLabel, QGridLayout, QVBoxLayout
+from PyQt5.QtCore import QTimer
+from PyQt5.Qt import Qt
+from protocol import Keys
+from view_model import ViewModel
+from main_window_qt import MainWindow
+
+
+class CarStatus(QLabel):
+    """Compact status of one car of the fleet: its number, the state of its connection, speed, distance, and line"""
+
+    TEXT = '%d %s  %s km/h  %s cm  %s'
+    STATUS_SYMBOLS = {'connected': '●', 'reconnecting': '◌', 'disconnected': '○'}
+
+    def __init__(self, number, parent):
+        super().__init__(parent)
+        self.number = number
+        self.setProperty('focused', False)
+        self.setAlignment(Qt.AlignCenter)
+
+    def show_state(self, status, state):
+        self.setText(self.TEXT % (
+            self.number, self.STATUS_SYMBOLS.get(status, '?'), state[Keys.SPEED], state[Keys.DISTANCE],
+            '━' if state[Keys.LINE] else ' '
+        ))
+        collide = ViewModel.distance_level(state[Keys.DISTANCE]) == ViewModel.DANGER
+        if self.property('collide') != collide:
+            self.setProperty('collide', collide)
+            self.setStyle(self.style())
+
+
+class FleetView(QWidget):
+    """
+    Shows the status of every car of a ChannelManager, and controls the focused one with a MainWindow.
+    | The number keys focus the car with that number, and Tab focuses the next one. Every other key goes to the
+    | focused car. The drive keys of a car are released, when it loses the focus.
+    | Telemetry only marks the status of a car as stale, the stale ones are redrawn REFRESH_INTERVAL milliseconds
+    | apart, so dozens of cars cost the UI thread a bounded amount of work, however fast they report.
+
+    :var: REFRESH_INTERVAL
+    :var: COLUMNS
+    """
+
+    TITLE = 'RC fleet'
+    REFRESH_INTERVAL = 100
+    COLUMNS = 4
+    DRIVE_KEYS = (Keys.FORWARD, Keys.BACKWARD, Keys.LEFT, Keys.RIGHT, Keys.HORN)
+    NUMBER_KEYS = {getattr(Qt, 'Key_%d' % number): number for number in range(1, 10)}
+
+    def __init__(self, manager, keymap=None, macro_path=None):
+        """
+        :param manager: ChannelManager with the cars connected already
+        :param keymap: the Keymap of the keys, the default one if None
+        :param macro_path: macro file the input is recorded into, and played from, see MainWindow
+        """
+        super().__init__()
+        self.setWindowTitle(self.TITLE)
+        self.manager = manager
+        self.focused = 0
+        self.__stale_lock = Lock()
+        self.__stale = set(range(len(manager.channels)))
+
+        layout = QVBoxLayout(self)
+        statuses = QGridLayout()
+        self.statuses = []
+        for index in range(len(manager.channels)):
+            status = CarStatus(index + 1, self)
+            statuses.addWidget(status, index // self.COLUMNS, index % self.COLUMNS)
+            self.statuses.append(status)
+        layout.addLayout(statuses)
+
+        self.control = MainWindow(manager.channels[self.focused], keymap=keymap, macro_path=macro_path)
+        self.control.setMinimumSize(500, 745)
+        self.control.setFocusPolicy(Qt.NoFocus)
+        layout.addWidget(self.control)
+
+        self.subscriptions = [
+            channel.subscribe(None, lambda changes, index=index: self.__mark_stale(index))
+            for index, channel in enumerate(manager.channels)
+        ]
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.REFRESH_INTERVAL)
+        self.focus(self.focused)
+
+    def __mark_stale(self, index):
+        with self.__stale_lock:
+            self.__stale.add(index)
+
+    def refresh(self):
+        """Redraws the status of the cars, that reported anything since the last refresh"""
+        with self.__stale_lock:
+            stale, self.__stale = self.__stale, set()
+        for index in stale:
+            channel = self.manager.channels[index]
+            self.statuses[index].show_state(channel.status, channel.snapshot())
+
+    def focus(self, index):
+        """
+        Hands the controls to another car
+
+        :param index: index of the car in the manager
+
+        :return: None
+        """
+        if not 0 <= index < len(self.manager.channels):
+            return
+        previous = self.manager.channels[self.focused]
+        if index != self.focused:
+            previous.set_values(self.DRIVE_KEYS, [False] * len(self.DRIVE_KEYS))
+            self.control.keys.release_all()
+            self.control.axes.release_all()
+        self.statuses[self.focused].setProperty('focused', False)
+        self.statuses[self.focused].setStyle(self.statuses[self.focused].style())
+        self.focused = index
+        self.statuses[index].setProperty('focused', True)
+        self.statuses[index].setStyle(self.statuses[index].style())
+        self.control.set_channel(self.manager.channels[index])
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if not event.isAutoRepeat() and key in self.NUMBER_KEYS:
+            self.focus(self.NUMBER_KEYS[key] - 1)
+        elif not event.isAutoRepeat() and key == Qt.Key_Tab:
+            self.focus((self.focused + 1) % len(self.manager.channels))
+        else:
+            self.control.keyPressEvent(event)
+
+    def keyReleaseEvent(self, event):
+        self.control.keyReleaseEvent(event)
+
+    def focusNextPrevChild(self, forward):
+        # Tab switches the car, instead of the focused widget
+        return False
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        for channel, subscription in zip(self.manager.channels, self.subscriptions):
+            channel.unsubscribe(subscription)
+        self.control.channel.unsubscribe(self.control.subscription)
+        self.manager.close()
+        super().closeEvent(event)
@@ -0,0 +1,79 @@
+from codecs import getincrementaldecoder
+from json import JSONDecoder, JSONDecodeError
+
+
+class JsonFrameDecoder:
+    """
+    Incremental decoder for the telemetry stream of the controller.
+    | TCP does not keep message boundaries, so a single recv can hold several frames, or just a part of one.
+    | The decoder keeps the incomplete tail of the stream, and returns every complete frame it has seen so far.
+
+    .. note:: Framing
+        | Frames are JSON objects, optionally separated by newlines. Older firmware sends bare objects back to back,
+        | which is decoded just as well. A frame that can not be decoded is dropped up to the next newline.
+
+    :var: MAX_FRAME_SIZE
+    """
+
+    MAX_FRAME_SIZE = 64 * 1024
+
+    def __init__(self):
+        self.__utf8 = getincrementaldecoder('utf-8')('replace')
+        self.__json = JSONDecoder()
+        self.__pending = ''
+
+    def feed(self, data) -> list:
+        """
+        Feeds the next chunk of the stream into the decoder
+
+        :param data: bytes like object, as received from the socket
+
+        :return: list of the frames completed by this chunk, in the order they were sent
+        """
+        pending = self.__pending + self.__utf8.decode(data)
+        frames = []
+        position = 0
+
+        while True:
+            position = pending.find('{', position)
+            if position < 0:
+                position = len(pending)
+                break
+            try:
+                frame, position = self.__json.raw_decode(pending, position)
+            except JSONDecodeError:
+                newline = pending.find('\n', position)
+                if newline < 0:
+                    break
+                position = newline + 1
+            else:
+                frames.append(frame)
+
+        self.__pending = pending[position:]
+        if len(self.__pending) > self.MAX_FRAME_SIZE:
+            self.__pending = ''
+        return frames
+
+
+class ReceiveBuffer:
+    """
+    Preallocated buffer for receiving from a socket, without allocating a new bytes object on every call
+
+    .. attribute:: view
+        memoryview over the whole buffer
+    """
+
+    def __init__(self, size=4096):
+        self.__buffer = bytearray(size)
+        self.view = memoryview(self.__buffer)
+
+    def receive(self, connection):
+        """
+        Receives the next chunk from the connection
+
+        :param connection: the socket to read from
+
+        :return: memoryview of the received bytes, which is only valid until the next call, empty if the peer closed
+        """
+        size = connection.recv_into(self.__buffer)
+        return self.view[:size]
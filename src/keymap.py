@@ -0,0 +1,464 @@
+"""
+The bindings of the keyboard, shared by the Tkinter, and the Qt user interface, and the recording, and playback
+of the input, so a test drive, or a benchmark can be repeated exactly.
+
+.. note:: Keymap files
+    | A keymap file is a JSON object from chords to bindings, which are added to DEFAULT_BINDINGS, replacing
+    | the bindings of the same chords, null removes the binding of a chord, e.g.
+    | {"i": ["momentary", "forward"], "w": null, "ctrl+shift+r": ["command", "record"]}
+    | A chord is the name of a key, lowercase for characters, and as Tkinter names it otherwise, e.g. Up,
+    | or Escape, after any of the MODIFIERS, joined with +.
+
+.. note:: Macro files
+    | A macro file is a JSON object with the version, and the events, each the seconds since the recording started,
+    | PRESS, or RELEASE, and the chord, e.g. {"version": 1, "events": [[0.0, "press", "w"], [1.5, "release", "w"]]}
+"""
+import json
+from argparse import ArgumentParser
+from threading import Thread, Lock, Event
+from time import perf_counter
+from protocol import Keys
+
+MOMENTARY = 'momentary'
+TOGGLE = 'toggle'
+COMMAND = 'command'
+
+MODIFIERS = {'shift': 1, 'ctrl': 2, 'alt': 4}
+
+CANCEL = 'cancel'
+RECORD = 'record'
+PLAY = 'play'
+
+DEFAULT_BINDINGS = {
+    'w': (MOMENTARY, Keys.FORWARD),
+    'Up': (MOMENTARY, Keys.FORWARD),
+    's': (MOMENTARY, Keys.BACKWARD),
+    'Down': (MOMENTARY, Keys.BACKWARD),
+    'a': (MOMENTARY, Keys.LEFT),
+    'Left': (MOMENTARY, Keys.LEFT),
+    'd': (MOMENTARY, Keys.RIGHT),
+    'Right': (MOMENTARY, Keys.RIGHT),
+    'b': (MOMENTARY, Keys.HORN),
+    'q': (TOGGLE, Keys.L_INDICATOR),
+    'e': (TOGGLE, Keys.R_INDICATOR),
+    'h': (TOGGLE, Keys.HAZARD_WARNING),
+    'l': (TOGGLE, Keys.LIGHTS),
+    'r': (TOGGLE, Keys.REVERSE),
+    'ctrl+d': (TOGGLE, Keys.DISTANCE_KEEPING),
+    'ctrl+l': (TOGGLE, Keys.LINE_FOLLOWING),
+    'ctrl+k': (TOGGLE, Keys.KEEP_CONTAINED),
+    'shift+c': (TOGGLE, Keys.CHANGE_DIRECTION),
+    'Escape': (COMMAND, CANCEL),
+    'F9': (COMMAND, RECORD),
+    'F10': (COMMAND, PLAY),
+}
+
+KEYS = {value for name, value in vars(Keys).items() if name.isupper()}
+
+
+def key_name(name) -> str:
+    """
+    :param name: the name of a key, as the user interface reports it
+
+    :return: the name of the key in a chord, single characters are lowercase, so shift does not change them
+    """
+    return name.lower() if len(name) == 1 else name
+
+
+def parse_chord(chord) -> tuple:
+    """
+    :param chord: a chord, e.g. ctrl+d
+
+    :return: the name of the key, and the mask of the MODIFIERS
+
+    :raises ValueError: if a modifier is unknown, or the key is missing
+    """
+    *modifiers, name = chord.split('+')
+    mask = 0
+    for modifier in modifiers:
+        if modifier.lower() not in MODIFIERS:
+            raise ValueError('unknown modifier %r in %r, expected one of %s'
+                             % (modifier, chord, ', '.join(MODIFIERS)))
+        mask |= MODIFIERS[modifier.lower()]
+    if not name:
+        raise ValueError('no key in %r' % chord)
+    return key_name(name), mask
+
+
+def format_chord(name, modifiers) -> str:
+    """
+    :param name: the name of the key
+    :param modifiers: the mask of the MODIFIERS held
+
+    :return: the chord, with the modifiers in the order of MODIFIERS
+    """
+    return '+'.join([modifier for modifier, bit in MODIFIERS.items() if modifiers & bit] + [name])
+
+
+class Keymap:
+    """
+    The bindings of the chords, compiled into a table, that finds the binding of a key with a single lookup.
+    | A MOMENTARY binding holds a key of the message table True, while the key is held, a TOGGLE binding switches
+    | a key of the message table, whenever the key is pressed, and a COMMAND binding runs a command
+    | of the user interface, e.g. CANCEL. Bindings with modifiers only apply while the modifiers are held,
+    | but MOMENTARY bindings without modifiers apply whatever is held, so driving does not stop,
+    | while a modifier is held for something else.
+
+    .. attribute:: bindings
+        The bindings, by chord, as given
+    """
+
+    def __init__(self, bindings=None):
+        """
+        :param bindings: the bindings, by chord, each the kind, and the key, or the command, DEFAULT_BINDINGS if None
+
+        :raises ValueError: if a chord, or a binding is invalid
+        """
+        self.bindings = dict(bindings if bindings is not None else DEFAULT_BINDINGS)
+        self.__table = dict()
+        for chord, binding in self.bindings.items():
+            kind, target = binding
+            if kind not in (MOMENTARY, TOGGLE, COMMAND):
+                raise ValueError('unknown kind of binding %r for %r' % (kind, chord))
+            if kind != COMMAND and target not in KEYS:
+                raise ValueError('unknown key %r for %r' % (target, chord))
+            self.__table[parse_chord(chord)] = (kind, target)
+
+    @classmethod
+    def load(cls, path, base=None):
+        """
+        :param path: the path of a keymap file, see the top of the module
+        :param base: the bindings the file changes, DEFAULT_BINDINGS if None
+
+        :return: the Keymap
+
+        :raises OSError: if the file can not be read
+        :raises ValueError: if the file is not a keymap
+        """
+        with open(path) as file:
+            changes = json.load(file)
+        if not isinstance(changes, dict):
+            raise ValueError('a keymap is a JSON object of chords, and bindings')
+        bindings = dict(base if base is not None else DEFAULT_BINDINGS)
+        for chord, binding in changes.items():
+            if binding is None:
+                bindings.pop(chord, None)
+            elif isinstance(binding, list) and len(binding) == 2:
+                bindings[chord] = tuple(binding)
+            else:
+                raise ValueError('expected [kind, target], or null for %r, got %r' % (chord, binding))
+        return cls(bindings)
+
+    def lookup(self, name, modifiers=0):
+        """
+        :param name: the name of the key, see key_name
+        :param modifiers: the mask of the MODIFIERS held
+
+        :return: the kind, and the target of the binding, None if the chord is not bound
+        """
+        binding = self.__table.get((name, modifiers))
+        if binding is None and modifiers:
+            binding = self.__table.get((name, 0))
+            if binding is not None and binding[0] != MOMENTARY:
+                return None
+        return binding
+
+
+class KeyDispatcher(Keys):
+    """
+    Applies the key presses, and releases of a user interface to the channel, as the Keymap binds them.
+    | Pressing a key, that is held already, e.g. the repetitions of the keyboard, does nothing, and a release
+    | undoes what the press of the same key did, whatever modifiers are held by then. The drive keys also move
+    | the DriveAxes, if there are any. The presses, and releases of the keys bound to the message table are added
+    | to the macro being recorded, if any, the ones of the commands are not, so playing a macro does not record,
+    | or play another one.
+
+    .. attribute:: keymap
+        The Keymap in use
+
+    .. attribute:: channel
+        The channel the keys control, replaced by the user interface, when it switches to another one
+
+    .. attribute:: recording
+        The Macro being recorded, None if there is none
+
+    .. attribute:: macro
+        The Macro play plays, the last one recorded, or the one the user interface loaded, None if there is none
+
+    .. attribute:: player
+        The MacroPlayer of the last play, None if nothing has been played
+    """
+
+    def __init__(self, keymap, channel, axes=None, commands=None):
+        """
+        :param keymap: the Keymap
+        :param channel: the channel to control
+        :param axes: the DriveAxes moved by the drive keys, None if there are none
+        :param commands: the functions of the COMMAND bindings, called without arguments, by their names,
+                         the commands without a function are ignored
+        """
+        self.keymap = keymap
+        self.channel = channel
+        self.axes = axes
+        self.commands = commands if commands is not None else dict()
+        self.recording = None
+        self.macro = None
+        self.player = None
+        self.__held = dict()
+        self.__lock = Lock()
+        self.__pressers = {MOMENTARY: self.__hold, TOGGLE: self.__toggle, COMMAND: self.__command}
+
+    def press(self, name, modifiers=0) -> bool:
+        """
+        :param name: the name of the key, see key_name
+        :param modifiers: the mask of the MODIFIERS held
+
+        :return: whether the key is bound
+        """
+        with self.__lock:
+            if name in self.__held:
+                return self.__held[name] is not None
+            binding = self.keymap.lookup(name, modifiers)
+            self.__held[name] = binding
+            if self.recording is not None and binding is not None and binding[0] != COMMAND:
+                self.recording.add(Macro.PRESS, format_chord(name, modifiers))
+        if binding is None:
+            return False
+        self.__pressers[binding[0]](binding[1])
+        return True
+
+    def release(self, name, modifiers=0) -> bool:
+        """
+        :param name: the name of the key, see key_name
+        :param modifiers: the mask of the MODIFIERS held
+
+        :return: whether the key was bound, when it was pressed
+        """
+        with self.__lock:
+            if name not in self.__held:
+                return False
+            binding = self.__held.pop(name)
+            if self.recording is not None and binding is not None and binding[0] != COMMAND:
+                self.recording.add(Macro.RELEASE, format_chord(name, modifiers))
+        if binding is not None and binding[0] == MOMENTARY:
+            self.__set(binding[1], False)
+        return binding is not None
+
+    def release_all(self) -> None:
+        """Releases every key held, e.g. when the window loses the focus, and would miss the releases"""
+        with self.__lock:
+            names = list(self.__held)
+        for name in names:
+            self.release(name)
+
+    def __hold(self, key):
+        self.__set(key, True)
+
+    def __set(self, key, active):
+        self.channel.set_value(key, active)
+        if self.axes is not None:
+            if active:
+                self.axes.press(key)
+            else:
+                self.axes.release(key)
+
+    def __toggle(self, key):
+        self.channel.set_value(key, not self.channel.get_value(key))
+
+    def __command(self, name):
+        if name in self.commands:
+            self.commands[name]()
+
+    def start_recording(self):
+        """
+        Starts recording the presses, and releases into a new Macro
+
+        :return: the Macro
+        """
+        self.recording = Macro()
+        return self.recording
+
+    def stop_recording(self):
+        """
+        Stops recording, the Macro recorded is the one played from then on
+
+        :return: the Macro recorded, None if none was being recorded
+        """
+        recording, self.recording = self.recording, None
+        if recording is not None:
+            self.macro = recording
+        return recording
+
+    def toggle_recording(self, path=None):
+        """
+        Starts recording, or stops, and saves the recording, for the RECORD command
+
+        :param path: where to save the Macro, None only keeps it for play
+
+        :return: the Macro recorded, None if the recording has just started
+        """
+        if self.recording is None:
+            self.start_recording()
+            return None
+        recording = self.stop_recording()
+        if path is not None:
+            recording.save(path)
+        return recording
+
+    def play(self, dispatch=None):
+        """
+        Plays the last Macro recorded, or loaded, unless one is being played, or recorded, for the PLAY command
+
+        :param dispatch: see MacroPlayer
+
+        :return: the MacroPlayer, None if nothing is played
+        """
+        if self.macro is None or self.recording is not None or (self.player is not None and self.player.playing):
+            return None
+        self.player = MacroPlayer(self.macro, self, dispatch)
+        return self.player
+
+
+class Macro:
+    """
+    Presses, and releases of keys, with the seconds since the recording started, see the top of the module.
+
+    .. attribute:: events
+        The events, each the seconds, PRESS, or RELEASE, and the chord
+
+    :var: VERSION
+    """
+
+    VERSION = 1
+    PRESS = 'press'
+    RELEASE = 'release'
+
+    def __init__(self, events=None):
+        """
+        :param events: the events, None starts recording now
+        """
+        self.events = list(events) if events is not None else []
+        self.__started = perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return self.events[-1][0] if self.events else 0.0
+
+    def add(self, kind, chord) -> None:
+        """
+        Records an event, as of now
+
+        :param kind: PRESS, or RELEASE
+        :param chord: the chord of the key
+
+        :return: None
+        """
+        self.events.append((perf_counter() - self.__started, kind, chord))
+
+    def save(self, path) -> None:
+        with open(path, 'w') as file:
+            json.dump({'version': self.VERSION, 'events': [list(event) for event in self.events]}, file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: the path of a macro file
+
+        :return: the Macro
+
+        :raises OSError: if the file can not be read
+        :raises ValueError: if the file is not a macro of a known version
+        """
+        with open(path) as file:
+            content = json.load(file)
+        if not isinstance(content, dict) or content.get('version') != cls.VERSION:
+            raise ValueError('not a macro of version %d' % cls.VERSION)
+        events = []
+        for seconds, kind, chord in content['events']:
+            if kind not in (cls.PRESS, cls.RELEASE):
+                raise ValueError('unknown event %r' % kind)
+            parse_chord(chord)
+            events.append((float(seconds), kind, chord))
+        return cls(events)
+
+
+class MacroPlayer:
+    """
+    Plays a Macro back into a KeyDispatcher on a thread of its own, at the times it was recorded at.
+    | The thread sleeps until SPIN seconds before each event, and waits for the rest of the time actively,
+    | so the events are played within microseconds of their times, rather than within the resolution of
+    | the timer of the system. Keys still held at the end, or when stopped are released.
+
+    .. attribute:: lateness
+        Seconds each event was played after its time, as measured before it was dispatched
+
+    .. attribute:: thread
+        The thread playing the macro
+
+    :var: SPIN
+    """
+
+    SPIN = 0.002
+
+    def __init__(self, macro, dispatcher, dispatch=None, speed=1.0):
+        """
+        Starts playing
+
+        :param macro: the Macro to play
+        :param dispatcher: the KeyDispatcher to play it into
+        :param dispatch: called with a function, and its arguments instead of calling the function on the thread
+                         of the player, e.g. to hand it to the main loop of the UI
+        :param speed: how many times faster than recorded to play
+        """
+        self.macro = macro
+        self.dispatcher = dispatcher
+        self.lateness = []
+        self.__dispatch = dispatch if dispatch is not None else lambda function, *arguments: function(*arguments)
+        self.__speed = speed
+        self.__stopped = Event()
+        self.thread = Thread(target=self.__play, daemon=True)
+        self.thread.start()
+
+    def __play(self):
+        start = perf_counter()
+        for seconds, kind, chord in self.macro.events:
+            deadline = start + seconds / self.__speed
+            if self.__stopped.wait(max(0.0, deadline - perf_counter() - self.SPIN)):
+                break
+            while perf_counter() < deadline:
+                pass
+            self.lateness.append(perf_counter() - deadline)
+            name, modifiers = parse_chord(chord)
+            function = self.dispatcher.press if kind == Macro.PRESS else self.dispatcher.release
+            self.__dispatch(function, name, modifiers)
+        self.__dispatch(self.dispatcher.release_all)
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+    def wait(self, timeout=None) -> bool:
+        """
+        :param timeout: seconds to wait at most, None waits as long as it takes
+
+        :return: whether the playback is over
+        """
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    @property
+    def playing(self) -> bool:
+        return self.thread.is_alive()
+
+
+def parse_arguments(argv=None):
+    """
+    Parses the options of the applications about the keyboard, leaving the rest, e.g. to Qt
+
+    :param argv: the arguments, the ones of the process if None
+
+    :return: the parsed options
+    """
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument('--keymap', metavar='PATH', help='keymap file changing the default bindings')
+    parser.add_argument('--macro', metavar='PATH', help='macro file the input is recorded into, and played from')
+    return parser.parse_known_args(argv)[0]
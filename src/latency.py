@@ -0,0 +1,168 @@
+from collections import deque
+from math import ceil
+from time import monotonic
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies, with buckets of constant relative width, like HdrHistogram.
+    | Recording is a constant time operation, and the memory needed only grows with the logarithm of the range.
+    | Percentiles are accurate within 2 ** (1 - PRECISION_BITS) of the value, about 1.6%.
+
+    .. attribute:: count
+        The number of recorded values
+
+    .. attribute:: max
+        The largest recorded value, in seconds
+
+    :var: PRECISION_BITS
+    """
+
+    PRECISION_BITS = 7
+
+    def __init__(self):
+        self.__counts = dict()
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds) -> None:
+        value = max(0, int(seconds * 1e6))
+        shift = max(0, value.bit_length() - self.PRECISION_BITS)
+        bucket = value >> shift << shift
+        self.__counts[bucket] = self.__counts.get(bucket, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent) -> float:
+        """
+        :param percent: the percentile to compute, between 0 and 100
+
+        :return: the value below which the given percent of the recorded values are, in seconds, 0 if there is none
+        """
+        counts = sorted(list(self.__counts.items()))
+        target = max(1, ceil(sum(count for _, count in counts) * percent / 100))
+        seen = 0
+        for bucket, count in counts:
+            seen += count
+            if seen >= target:
+                width = 1 << max(0, bucket.bit_length() - self.PRECISION_BITS)
+                return min((bucket + width / 2) / 1e6, self.max)
+        return 0.0
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class LatencyMonitor:
+    """
+    Measures how far behind the car the client is.
+    | Command frames are stamped with the clock of the client in TIMESTAMP_KEY. The telemetry of the controller
+    | is stamped with its own clock in TIMESTAMP_KEY, and it echoes the time of the last acknowledgement in ECHO_KEY,
+    | with the time it received that acknowledgement in RECEIVED_KEY, and the stamp of the last command frame it
+    | has applied in APPLIED_KEY. From these, the clock offset, and the round trip time are estimated the way NTP does,
+    | taking the offset measured with the shortest round trip of the last SAMPLES.
+
+    .. attribute:: offset
+        The clock of the controller minus the clock of the client, in seconds, None until it is measured
+
+    .. attribute:: rtt
+        LatencyHistogram of the round trip times
+
+    .. attribute:: telemetry
+        LatencyHistogram of the time between the controller sending a telemetry frame, and the client receiving it
+
+    .. attribute:: control
+        LatencyHistogram of the time between the client sending a command, and the controller reporting it applied
+
+    :var: SAMPLES
+    """
+
+    TIMESTAMP_KEY = 'ts'
+    ECHO_KEY = 'echo'
+    RECEIVED_KEY = 'rx'
+    APPLIED_KEY = 'applied'
+    SAMPLES = 8
+
+    def __init__(self, clock=monotonic):
+        """
+        :param clock: function returning the current time of the client in seconds
+        """
+        self.clock = clock
+        self.offset = None
+        self.rtt = LatencyHistogram()
+        self.telemetry = LatencyHistogram()
+        self.control = LatencyHistogram()
+        self.__samples = deque(maxlen=self.SAMPLES)
+        self.__last_echo = None
+        self.__last_applied = None
+        self.__updated = dict()
+
+    def resynchronize(self) -> None:
+        """Forgets the clock offset, e.g. because the controller might have restarted"""
+        self.offset = None
+        self.__samples.clear()
+        self.__last_echo = None
+        self.__last_applied = None
+
+    def stamp(self, frame) -> None:
+        frame[self.TIMESTAMP_KEY] = self.clock()
+
+    def observe(self, frame, received=None) -> None:
+        """
+        Takes the timestamps out of a telemetry frame, and updates the statistics with them
+
+        :param frame: the decoded telemetry frame, which is modified
+        :param received: the time the frame was received, by the clock of the client, now if None
+
+        :return: None
+        """
+        received = self.clock() if received is None else received
+        sent = frame.pop(self.TIMESTAMP_KEY, None)
+        echo = frame.pop(self.ECHO_KEY, None)
+        echo_received = frame.pop(self.RECEIVED_KEY, None)
+        applied = frame.pop(self.APPLIED_KEY, None)
+
+        if sent is not None and echo is not None and echo_received is not None and echo != self.__last_echo:
+            self.__last_echo = echo
+            offset = ((echo_received - echo) + (sent - received)) / 2
+            rtt = (received - echo) - (sent - echo_received)
+            self.rtt.record(max(0.0, rtt))
+            self.__samples.append((rtt, offset))
+            self.offset = min(self.__samples)[1]
+
+        if sent is not None and self.offset is not None:
+            self.telemetry.record(max(0.0, received - (sent - self.offset)))
+            sample_time = min(received, sent - self.offset)
+        else:
+            sample_time = received
+
+        if applied is not None and applied != self.__last_applied:
+            self.__last_applied = applied
+            self.control.record(max(0.0, received - applied))
+
+        for key in frame:
+            self.__updated[key] = sample_time
+
+    def age(self, key, now=None):
+        """
+        :param key: key of the telemetry
+        :param now: the current time by the clock of the client, now if None
+
+        :return: seconds since the controller measured the value of the key, None if it never reported it
+        """
+        if key not in self.__updated:
+            return None
+        return (self.clock() if now is None else now) - self.__updated[key]
+
+    def summary(self) -> dict:
+        return {
+            'offset': self.offset,
+            'rtt': self.rtt.summary(),
+            'telemetry': self.telemetry.summary(),
+            'control': self.control.summary(),
+        }
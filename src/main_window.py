@@ -1,7 +1,17 @@
-from time import sleep
-from tkinter import Tk, Label, Button, Frame, Entry, Toplevel, Event, BOTH
-from collections import defaultdict
-from src.channel import Channel
+from os import path as paths
+from queue import Queue, Empty
+from socket import socketpair
+from tkinter import Tk, Label, Button, Frame, Entry, Toplevel, Event, BOTH, READABLE
+from axes import DriveAxes
+from connector import Connector, PendingChannel
+from keymap import Keymap, KeyDispatcher, Macro, MODIFIERS, CANCEL, RECORD, PLAY, key_name
+from view_model import ViewModel
+
+try:
+    from filters import CollisionPredictor
+except ImportError:
+    # NumPy is optional for the Tkinter UI, without it the warnings follow the raw distance
+    CollisionPredictor = None
 
 
 class ConnectionDialog:
@@ -24,7 +34,12 @@ class ConnectionDialog:
         | before is advised.
     """
 
-    def __init__(self, parent):
+    def __init__(self, parent, on_connect=None):
+        """
+        :param parent: the window the dialog belongs to
+        :param on_connect: called without arguments, once the user has entered the details
+        """
+        self.__on_connect = on_connect
         self.top = Toplevel(parent)
         self.top.columnconfigure(0, weight=MainWindow.WEIGHT)
         self.top.columnconfigure(1, weight=MainWindow.WEIGHT)
@@ -57,6 +72,8 @@ class ConnectionDialog:
         self.port = self.port_entry.get()
         self.password = self.password_entry.get()
         self.top.destroy()
+        if self.__on_connect is not None:
+            self.__on_connect()
 
 
 class MainWindow:
@@ -77,9 +94,29 @@ class MainWindow:
 
     .. attribute:: channel
         A Channel object, which is responsible for the communication between this application, and the controller.
+        A PendingChannel, while the connection is being made.
+
+    .. attribute:: connector
+        The Connector making the connection in the background, None if the channel was given
+
+    .. attribute:: view_model
+        The ViewModel telling, which widgets the state of the car changes
+
+    .. attribute:: predictor
+        The CollisionPredictor the distance warnings follow, None if NumPy is not installed
 
+    .. attribute:: axes
+        The DriveAxes ramped by the drive keys, and streamed by the Channel connected to
 
+    .. attribute:: keys
+        The KeyDispatcher applying the keys pressed to the channel
 
+    .. attribute:: macro_path
+        The macro file the input is recorded into, and played from, None keeps the recording in memory
+
+
+
+    :var: TITLE
     :var: FILL
     :var: MIN_SIZE
     :var: WEIGHT
@@ -106,8 +143,13 @@ class MainWindow:
     :var: HORN_TEXT
     :var: REVERSE_SWITCH_TEXT
 
+    :var: LEVEL_COLORS
+    :var: MODIFIER_STATES
+    :var: POLL_INTERVAL
+
     """
 
+    TITLE = 'RC controller'
     FILL = 'nesw'
     MIN_SIZE = 100
     WEIGHT = 1
@@ -134,58 +176,251 @@ class MainWindow:
     HORN_TEXT = '📯'
     REVERSE_SWITCH_TEXT = 'R'
 
-    def __init__(self):
-        """Initializing the main window"""
+    LEVEL_COLORS = {ViewModel.NORMAL: BACKGROUND_COLOR, ViewModel.WARNING: 'yellow', ViewModel.DANGER: 'red'}
+
+    MODIFIER_STATES = {0x1: MODIFIERS['shift'], 0x4: MODIFIERS['ctrl'], 0x8: MODIFIERS['alt']}
+
+    PROGRESS_INTERVAL = 100
+    POLL_INTERVAL = 10
+
+    def __init__(self, channel=None, run=True, recorder=None, keymap=None, macro_path=None):
+        """
+        Initializing the main window
+
+        :param channel: Channel to control, e.g. one on a LoopbackTransport, None asks the user where to connect
+        :param run: whether to run the main loop, False leaves it to the caller, e.g. to a benchmark
+        :param recorder: FlightRecorder for the Channel connected to, if channel is None
+        :param keymap: the Keymap of the keys, the default one if None
+        :param macro_path: macro file the input is recorded into, and played from, if it exists already
+        """
 
         self.window = Tk()
         self.window.columnconfigure(0, weight=self.WEIGHT)
         self.window.rowconfigure(0, weight=self.WEIGHT)
         self.window.protocol('WM_DELETE_WINDOW', self.__on_close_event)
 
+        self.recorder = recorder
+        self.connector = None
+        self.dial = None
+        self.channel = channel if channel is not None else PendingChannel(PendingChannel.DISCONNECTED)
+        self.axes = DriveAxes()
+        self.__connect_on_top = False
+
         self.__handle_labels_layout()
         self.__handle_light_button_layout()
         self.__handle_move_button_layout()
+        self.__handle_progress_layout()
+
+        self.predictor = CollisionPredictor(key=self.channel.DISTANCE) if CollisionPredictor is not None else None
+        self.view_model = ViewModel(self.predictor)
+        self.__renderers = self.__create_renderers()
+
+        self.macro_path = macro_path
+        self.keys = KeyDispatcher(keymap if keymap is not None else Keymap(), self.channel, self.axes, {
+            CANCEL: self.__cancel_connection,
+            RECORD: lambda: self.keys.toggle_recording(self.macro_path),
+            PLAY: lambda: self.keys.play(self.__call_soon),
+        })
+        if macro_path is not None and paths.exists(macro_path):
+            self.keys.macro = Macro.load(macro_path)
+
+        self.window.bind('<KeyPress>', self.__on_key_press_event)
+        self.window.bind('<KeyRelease>', self.__on_key_release_event)
+
+        self.__continue_update = True
+        self.__rendered_version = None
+        self.__rendered_status = None
+        self.__update_scheduled = True
+        self.__calls = Queue()
+        self.__wakeup_receiver, self.__wakeup_sender = socketpair()
+        self.__wakeup_receiver.setblocking(False)
+        self.__wakeup_sender.setblocking(False)
+        self.__polled = not hasattr(self.window.tk, 'createfilehandler')
+        if self.__polled:
+            # Tcl can not watch sockets on Windows, where the queue is polled every POLL_INTERVAL instead
+            self.window.after(self.POLL_INTERVAL, self.__run_calls)
+        else:
+            self.window.tk.createfilehandler(self.__wakeup_receiver, READABLE, self.__run_calls)
+        self.__subscription = self.channel.subscribe(None, self.__on_telemetry_change)
+        self.__frame_subscription = self.channel.subscribe_frames(self.__on_frames)
+        self.__call_soon(self.__upadte_widgets)
+
+        if channel is None:
+            # Asked once the window is up
+            self.window.after(0, self.__ask_connection)
+
+        if run:
+            self.window.mainloop()
+
+    def set_channel(self, channel) -> None:
+        """
+        Switches to controlling another channel, e.g. the connected one instead of the PendingChannel
+
+        :Assumptions:
+          * This method should only be called from the Tkinter main loop
+
+        :param channel: the Channel to control
+
+        :return: None
+        """
+        self.channel.unsubscribe(self.__subscription)
+        self.channel.unsubscribe(self.__frame_subscription)
+        self.channel = channel
+        self.keys.channel = channel
+        self.__rendered_version = None
+        self.__rendered_status = None
+        if self.predictor is not None:
+            self.predictor.reset()
+        self.__subscription = self.channel.subscribe(None, self.__on_telemetry_change)
+        self.__frame_subscription = self.channel.subscribe_frames(self.__on_frames)
+        self.__upadte_widgets()
+
+    def __ask_connection(self) -> None:
+        """
+        Asks the user where to connect, keeping the dialog on top of the window, without blocking the main loop
 
-        self.dial = ConnectionDialog(self.window)
+        :return: None
+        """
+        self.dial = ConnectionDialog(self.window, self.__start_connection)
         self.__connect_on_top = True
         self.window.after(100, self.__ensure_connect_on_top)
-        self.window.wait_window(self.dial.top)
-        self.__connect_on_top = False
 
+    def __start_connection(self) -> None:
+        """
+        Starts connecting in the background, to where the user asked
+
+        :return: None
+        """
+        self.__connect_on_top = False
         # tmp!!!!! TODO:
-        self.channel = Channel('192.168.1.11', 8000 + int(self.dial.port), '69420')
-        # self.channel = Channel(self.dial.host, self.dial.port, self.dial.password)
+        try:
+            port = 8000 + int(self.dial.port)
+        except ValueError:
+            port = 8000
+        # Connector.tcp(self.dial.host, self.dial.port, self.dial.password)
+        self.connector = Connector(
+            Connector.tcp('192.168.1.11', port, '69420', recorder=self.recorder, axes=self.axes),
+            self.__on_connection_change,
+            self.__call_soon
+        )
+        self.set_channel(self.connector.pending)
+        self.progress_button['text'] = 'Cancel'
+        self.progress_button.grid()
+        self.progress_layout.grid()
+        self.__show_progress()
 
-        self.switcher = self.__create_switcher()
-        self.__key_event_modifier = defaultdict(bool)
-        self.__ctrl_pressed = False
+    def __show_progress(self) -> None:
+        """
+        Shows the progress of the connection, every PROGRESS_INTERVAL milliseconds, as long as it is being made
 
-        self.window.bind('<KeyPress>', self.__on_key_press_event)
-        self.window.bind('<KeyRelease>', self.__on_key_release_event)
+        :return: None
+        """
+        if self.connector is None:
+            return
+        self.progress_label['text'] = self.connector.describe()
+        if self.connector.state == Connector.CONNECTING:
+            self.window.after(self.PROGRESS_INTERVAL, self.__show_progress)
+
+    def __on_progress_button(self) -> None:
+        if self.connector is not None and self.connector.state == Connector.CONNECTING:
+            self.connector.cancel()
+        else:
+            self.__ask_connection()
 
-        self.__continue_update = True
-        self.window.after(10, self.__upadte_widgets)
+    def __on_connection_change(self, connector) -> None:
+        """
+        Shows the outcome of the connection, and hands the controls to the channel, once it is connected
 
-        self.window.mainloop()
+        :Assumptions:
+          * This method should only be called from the Tkinter main loop
+
+        :param connector: the Connector, whose state has changed
+
+        :return: None
+        """
+        if connector is not self.connector or not self.__continue_update:
+            # Replaced by a retry, or the window is closed
+            return
+        self.progress_label['text'] = connector.describe()
+        if connector.state == Connector.CONNECTED:
+            if self.channel is not connector.channel:
+                self.set_channel(connector.channel)
+            self.progress_button.grid_remove()
+        else:
+            self.progress_button['text'] = 'Retry'
 
     def __on_close_event(self) -> None:
         """
         Function that handles the user clicked exit event.
           * The channel with the controller itself should be closed properly, before exiting the application.
+          * A connection still being made is given up, or closed, if it has been made, but not handed over yet.
           * The UI updating thread should be stopped
 
         :Assumptions: None
 
         :return: None
         """
-        self.channel.set_value(self.channel.DISTANCE_KEEPING, False)
-        self.channel.set_value(self.channel.LINE_FOLLOWING, False)
+        if self.connector is not None:
+            self.connector.cancel()
+            if self.connector.channel is not None and self.connector.channel is not self.channel:
+                self.connector.channel.deactivate()
+        self.channel.set_values([self.channel.DISTANCE_KEEPING, self.channel.LINE_FOLLOWING], [False, False])
         self.__continue_update = False
+        self.channel.unsubscribe(self.__subscription)
+        self.channel.unsubscribe(self.__frame_subscription)
         self.channel.deactivate()
+        if not self.__polled:
+            self.window.tk.deletefilehandler(self.__wakeup_receiver)
+        self.__wakeup_receiver.close()
+        self.__wakeup_sender.close()
         self.window.destroy()
 
+    def __call_soon(self, function, *arguments) -> None:
+        """
+        Hands a call to the Tkinter main loop, as Tkinter must not be called from any other thread.
+        | The main loop is woken up by a byte on a socket it watches, so it does nothing while nothing is queued,
+        | and the caller never waits for it, even while the window is closing.
+
+        :Assumptions:
+          * This method may be called on any thread
+
+        :param function: the function to call on the main loop
+        :param arguments: the arguments to call it with
+
+        :return: None
+        """
+        self.__calls.put((function, arguments))
+        try:
+            self.__wakeup_sender.send(b'\0')
+        except OSError:
+            # A wakeup is pending already, or the window is closed
+            pass
+
+    def __run_calls(self, *_) -> None:
+        """
+        Runs the calls handed to the main loop so far, when the wakeup socket becomes readable
+
+        :Assumptions:
+          * This method is called on the Tkinter main loop, as the file handler of the wakeup socket
+
+        :return: None
+        """
+        try:
+            while self.__wakeup_receiver.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                function, arguments = self.__calls.get_nowait()
+            except Empty:
+                break
+            function(*arguments)
+        if self.__polled and self.__continue_update:
+            self.window.after(self.POLL_INTERVAL, self.__run_calls)
+
     def __ensure_connect_on_top(self):
-        if self.__connect_on_top:
+        if self.__connect_on_top and self.dial.top.winfo_exists():
             self.dial.top.lift()
             self.window.after(100, self.__ensure_connect_on_top)
 
@@ -210,6 +445,25 @@ class MainWindow:
         self.speed_label = Label(master=self.label_layout, text=self.SPEED_TEXT, background=self.BACKGROUND_COLOR)
         self.speed_label.grid(row=0, column=2, sticky=self.FILL)
 
+    def __handle_progress_layout(self) -> None:
+        """
+        Creates the bar showing the progress of the connection, with the button cancelling, or retrying it,
+        hidden until a connection is made
+
+        :Assumptions: None
+
+        :return: None
+        """
+        self.progress_layout = Frame(master=self.window)
+        self.progress_layout.columnconfigure(0, weight=self.WEIGHT)
+        self.progress_layout.grid(row=3, column=0, sticky=self.FILL)
+        self.progress_label = Label(master=self.progress_layout, anchor='w', background=self.BACKGROUND_COLOR)
+        self.progress_label.grid(row=0, column=0, sticky=self.FILL)
+        self.progress_button = Button(master=self.progress_layout, background=self.BACKGROUND_COLOR,
+                                      command=self.__on_progress_button)
+        self.progress_button.grid(row=0, column=1, sticky=self.FILL)
+        self.progress_layout.grid_remove()
+
     def __handle_light_button_layout(self) -> None:
         """
         Creates, and manages the layout for the buttons, such as the light, and hazard warning switch, and the indicators
@@ -314,76 +568,61 @@ class MainWindow:
             master=self.button_layout,
             text=self.FORWARD_ARROW_TEXT,
             background=self.BACKGROUND_COLOR,
-            command=lambda: self.channel.set_value(
-                self.channel.FORWARD,
-                not self.channel.get_value(self.channel.FORWARD)
-            )
+            command=lambda: self.__toggle_drive(self.channel.FORWARD)
         )
         self.forward_button.grid(row=0, column=1, sticky=self.FILL)
         self.backward_button = Button(
             master=self.button_layout,
             text=self.BACK_ARROW_TEXT,
             background=self.BACKGROUND_COLOR,
-            command=lambda: self.channel.set_value(
-                self.channel.BACKWARD,
-                not self.channel.get_value(self.channel.BACKWARD)
-            )
+            command=lambda: self.__toggle_drive(self.channel.BACKWARD)
         )
         self.backward_button.grid(row=1, column=1, sticky=self.FILL)
         self.left_button = Button(
             master=self.button_layout,
             text=self.LEFT_ARROW_TEXT,
             background=self.BACKGROUND_COLOR,
-            command=lambda: self.channel.set_value(
-                self.channel.LEFT,
-                not self.channel.get_value(self.channel.LEFT)
-            )
+            command=lambda: self.__toggle_drive(self.channel.LEFT)
         )
         self.left_button.grid(row=1, column=0, sticky=self.FILL)
         self.right_button = Button(
             master=self.button_layout,
             text=self.RIGHT_ARROW_TEXT,
             background=self.BACKGROUND_COLOR,
-            command=lambda: self.channel.set_value(
-                self.channel.RIGHT,
-                not self.channel.get_value(self.channel.RIGHT)
-            )
+            command=lambda: self.__toggle_drive(self.channel.RIGHT)
         )
         self.right_button.grid(row=1, column=2, sticky=self.FILL)
 
-    def __create_switcher(self):
+    def __toggle_drive(self, key) -> None:
         """
-        Create the switcher object, for the key events, so implementing a switch case is possible,
-        without creating a new object every time a key is pressed
+        Switches a drive key, and the axis it drives, on, or off, for the buttons
 
-        :Assumptions:
-          * The Channel object have been created, before this method is called
-
-        :return: the switcher object
-        """
-        return defaultdict(
-            lambda: 'None',
-            {
-                65362: self.channel.FORWARD,
-                119: self.channel.FORWARD,
-                65364: self.channel.BACKWARD,
-                115: self.channel.BACKWARD,
-                65361: self.channel.LEFT,
-                97: self.channel.LEFT,
-                65363: self.channel.RIGHT,
-                100: self.channel.RIGHT,
-                98: self.channel.HORN,
-                108: self.channel.LIGHTS,
-                104: self.channel.HAZARD_WARNING,
-                114: self.channel.REVERSE,
-                113: self.channel.L_INDICATOR,
-                101: self.channel.R_INDICATOR
-            }
-        )
+        :param key: the drive key
+
+        :return: None
+        """
+        active = not self.channel.get_value(key)
+        self.channel.set_value(key, active)
+        if active:
+            self.axes.press(key)
+        else:
+            self.axes.release(key)
+
+    def __modifiers(self, event: Event) -> int:
+        """
+        :param event: the key event
+
+        :return: the mask of the MODIFIERS held, as the Keymap expects it
+        """
+        return sum(bit for state, bit in self.MODIFIER_STATES.items() if event.state & state)
+
+    def __cancel_connection(self) -> None:
+        if self.connector is not None:
+            self.connector.cancel()
 
     def __on_key_press_event(self, event: Event) -> None:
         """
-        Handles the event, when the user presses a key
+        Handles the event, when the user presses a key, see KeyDispatcher
 
         :Assumption:
           * This method should only be called from the Tkinter main loop
@@ -392,32 +631,11 @@ class MainWindow:
 
         :return: None
         """
-        mod_switcher = defaultdict(
-            lambda: 'None',
-            {
-                100: self.channel.DISTANCE_KEEPING,
-                108: self.channel.LINE_FOLLOWING
-            }
-        )
-
-        case = self.switcher[event.keysym_num]
-        if event.keysym_num in [65507, 65508] and not self.__key_event_modifier['Ctrl']:
-            self.__key_event_modifier['Ctrl'] = True
-            self.__ctrl_pressed = True
-        elif self.__ctrl_pressed and event.keysym_num not in [65507, 65508]:
-            self.channel.set_value(
-                mod_switcher[event.keysym_num],
-                not self.channel.get_value(mod_switcher[event.keysym_num])
-            )
-        elif not self.__ctrl_pressed and event.keysym_num in [101, 104, 108, 113, 114]:
-            self.channel.set_value(case, not self.channel.get_value(case))
-        elif not self.__ctrl_pressed and not self.__key_event_modifier[case] and event.keysym_num not in [65507, 65508]:
-            self.channel.set_value(case, True)
-            self.__key_event_modifier[case] = True
+        self.keys.press(key_name(event.keysym), self.__modifiers(event))
 
     def __on_key_release_event(self, event: Event) -> None:
         """
-        Handles the event, when the user releases a key
+        Handles the event, when the user releases a key, see KeyDispatcher
 
         :Assumption:
           * This method should only be called from the Tkinter main loop
@@ -426,70 +644,124 @@ class MainWindow:
 
         :return: None
         """
-        if event.keysym_num in [65507, 65508]:
-            self.__key_event_modifier['Ctrl'] = False
-            self.__ctrl_pressed = False
-        if event.keysym_num not in [97, 100, 101, 104, 108, 113, 114, 65507, 65508]:
-            self.channel.set_value(self.switcher[event.keysym_num], False)
-            self.__key_event_modifier[self.switcher[event.keysym_num]] = False
+        self.keys.release(key_name(event.keysym), self.__modifiers(event))
+
+    def __on_telemetry_change(self, changes) -> None:
+        """
+        Schedules an update of the UI, when the state of the car has changed.
+        | Changes arriving before the update runs are all shown by that single update.
+
+        :Assumptions:
+          * This method is called on the receiving thread of the channel
+
+        :param changes: the changed keys, and their new values
+
+        :return: None
+        """
+        self.__schedule_update()
+
+    def __on_frames(self, frames, received) -> None:
+        """
+        Feeds the distance of every frame to the predictor, and schedules an update of the UI,
+        as the prediction moves on, even while the distance holds steady
+
+        :Assumptions:
+          * This method is called on the receiving thread of the channel
+
+        :param frames: the telemetry frames received
+        :param received: the time they were received at
+
+        :return: None
+        """
+        if self.predictor is not None:
+            self.predictor.feed(frames, received)
+            self.__schedule_update()
+
+    def __schedule_update(self) -> None:
+        """
+        :Assumptions:
+          * This method may be called on any thread
+
+        :return: None
+        """
+        if self.__continue_update and not self.__update_scheduled:
+            self.__update_scheduled = True
+            self.__call_soon(self.__upadte_widgets)
 
     def __upadte_widgets(self) -> None:
         """
-        Continuously updates the UI in the background.
+        Updates the UI to the latest state of the car.
+        | Reads a single snapshot of the car per call, and leaves the widgets alone, if it has not changed since
+        | the last update. Otherwise only the widgets, whose element of the view differs are touched.
+        | The status of the connection is shown in the title of the window.
 
         :Assumptions:
-          * This method is called on a separate thread, via Tkinter's after function
+          * This method is called on the Tkinter main loop, via __run_calls
 
         :return: None
         """
-        self.forward_button['background'] = \
-            self.ACTIVE_ARROW_COLOR if self.channel.get_value(self.channel.FORWARD) else self.BACKGROUND_COLOR
-        self.backward_button['background'] = \
-            self.ACTIVE_ARROW_COLOR if self.channel.get_value(self.channel.BACKWARD) else self.BACKGROUND_COLOR
-        self.left_button['background'] = \
-            self.ACTIVE_ARROW_COLOR if self.channel.get_value(self.channel.LEFT) else self.BACKGROUND_COLOR
-        self.right_button['background'] = \
-            self.ACTIVE_ARROW_COLOR if self.channel.get_value(self.channel.RIGHT) else self.BACKGROUND_COLOR
-
-        self.reverse_button['background'] = \
-            'red' if self.channel.get_value(self.channel.REVERSE) else self.BACKGROUND_COLOR
-        self.reverse_button['foreground'] = \
-            self.BACKGROUND_COLOR if self.channel.get_value(self.channel.REVERSE) else 'red'
-
-        self.light_switch['background'] = \
-            '#fdff82' if self.channel.get_value(self.channel.LIGHTS) else self.BACKGROUND_COLOR
-
-        constants = [self.channel.HAZARD_WARNING, self.channel.R_INDICATOR, self.channel.L_INDICATOR]
-        for index, indicator in enumerate([self.hazard_warning, self.right_indicator, self.left_indicator]):
-            indicator['background'] = \
-                'yellow' if self.channel.get_value(constants[index]) else self.BACKGROUND_COLOR
-
-        distance = self.channel.get_value(self.channel.DISTANCE)
-        speed = self.channel.get_value(self.channel.SPEED)
-
-        self.distance_label['text'] = self.DISTANCE_TEXT + str(distance) + self.DISTANCE_MES
-        if distance < 10:
-            bg = 'red'
-        elif distance < 25:
-            bg = 'yellow'
-        else:
-            bg = self.BACKGROUND_COLOR
-        self.distance_label['background'] = bg
-
-        self.speed_label['text'] = self.SPEED_TEXT + str(speed) + self.SPEED_MES
-        if speed > 30:
-            bg = 'red'
-        elif speed > 20:
-            bg = 'yellow'
-        else:
-            bg = self.BACKGROUND_COLOR
-        self.speed_label['background'] = bg
+        self.__update_scheduled = False
+        if self.channel.status != self.__rendered_status:
+            self.__rendered_status = self.channel.status
+            self.window.title(self.TITLE + ('' if self.__rendered_status == self.channel.CONNECTED
+                                            else ' - ' + self.__rendered_status))
+
+        state = self.channel.snapshot()
+        if state.version != self.__rendered_version:
+            self.__rendered_version = state.version
+            self.__render(state)
+
+    def __render(self, state) -> None:
+        """
+        Updates the widgets, whose element of the view has changed, to show the given state of the car
+
+        :param state: TelemetrySnapshot to show
 
-        self.line_label['background'] = 'black' if self.channel.get_value(self.channel.LINE) else 'white'
+        :return: None
+        """
+        for key, value in self.view_model.render(state).items():
+            self.__renderers[key](value)
+
+    def __create_renderers(self) -> dict:
+        """
+        Creates the functions applying a changed element of the view to its widget
+
+        :Assumptions:
+          * The widgets have been created, before this method is called
+
+        :return: the functions, by the key of the element
+        """
+        def background(widget, color):
+            return lambda active: widget.configure(background=color if active else self.BACKGROUND_COLOR)
+
+        def gauge(widget, text, measure):
+            return lambda value: widget.configure(
+                text=text + str(value[0]) + measure, background=self.LEVEL_COLORS[value[1]]
+            )
 
-        if self.__continue_update:
-            self.window.after(10, self.__upadte_widgets)
+        return {
+            ViewModel.FORWARD: background(self.forward_button, self.ACTIVE_ARROW_COLOR),
+            ViewModel.BACKWARD: background(self.backward_button, self.ACTIVE_ARROW_COLOR),
+            ViewModel.LEFT: background(self.left_button, self.ACTIVE_ARROW_COLOR),
+            ViewModel.RIGHT: background(self.right_button, self.ACTIVE_ARROW_COLOR),
+            ViewModel.REVERSE: lambda active: self.reverse_button.configure(
+                background='red' if active else self.BACKGROUND_COLOR,
+                foreground=self.BACKGROUND_COLOR if active else 'red'
+            ),
+            ViewModel.LIGHTS: background(self.light_switch, '#fdff82'),
+            ViewModel.HAZARD_WARNING: background(self.hazard_warning, 'yellow'),
+            ViewModel.R_INDICATOR: background(self.right_indicator, 'yellow'),
+            ViewModel.L_INDICATOR: background(self.left_indicator, 'yellow'),
+            ViewModel.LINE: lambda active: self.line_label.configure(background='black' if active else 'white'),
+            ViewModel.DISTANCE: gauge(self.distance_label, self.DISTANCE_TEXT, self.DISTANCE_MES),
+            ViewModel.SPEED: gauge(self.speed_label, self.SPEED_TEXT, self.SPEED_MES),
+        }
 
 
 if __name__ == '__main__':
-    MainWindow()
+    from recorder import parse_arguments, open_session
+    from keymap import parse_arguments as parse_keyboard_arguments
+    replay_channel, flight_recorder = open_session(parse_arguments())
+    keyboard = parse_keyboard_arguments()
+    MainWindow(replay_channel, recorder=flight_recorder,
+               keymap=Keymap.load(keyboard.keymap) if keyboard.keymap else None, macro_path=keyboard.macro)
@@ -1,11 +1,16 @@
+from functools import partial
+from os import path as paths
 from PyQt5.QtWidgets import QWidget, QLabel, QPushButton
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtCore import pyqtSignal, QTimer
 from PyQt5.Qt import Qt
-from threading import Thread, Lock
-from channel import Channel
+from axes import DriveAxes
 from connect_dialog import ConnectDialog
-
-from time import sleep
+from dashboard_qt import Dashboard
+from filters import CollisionPredictor
+from keymap import Keymap, KeyDispatcher, Macro, MODIFIERS, CANCEL, RECORD, PLAY, key_name
+from plot_qt import TimeSeriesPlot
+from connector import PendingChannel
+from qt_channel import QtChannel
 
 
 class Button(QPushButton):
@@ -15,10 +20,7 @@ class Button(QPushButton):
 
 class MainWindow(QWidget):
 
-    DISTANCE_TEXT = 'Distance: '
-    DISTANCE_MEASURE = 'cm'
-    SPEED_TEXT = 'Speed: '
-    SPEED_MEASURE = 'km/h'
+    TITLE = 'RC controller'
 
     R_INDICATOR = 'right_indicator'
     L_INDICATOR = 'left_indicator'
@@ -40,212 +42,235 @@ class MainWindow(QWidget):
 
     CHANGE_DIRECTION = 'change_direction'
 
-    widget_update_signal = pyqtSignal()
+    PROGRESS_INTERVAL = 100
 
-    def __init__(self):
-        super().__init__()
+    # The names of the keys, as Tkinter, and so the keymap names them
+    KEY_NAMES = {getattr(Qt, name): name[4:] for name in dir(Qt) if name.startswith('Key_')}
+    KEY_NAMES.update({
+        Qt.Key_Space: 'space', Qt.Key_Backspace: 'BackSpace', Qt.Key_PageUp: 'Prior', Qt.Key_PageDown: 'Next'
+    })
+    MODIFIER_FLAGS = {Qt.ShiftModifier: MODIFIERS['shift'], Qt.ControlModifier: MODIFIERS['ctrl'],
+                      Qt.AltModifier: MODIFIERS['alt']}
 
-        dial = ConnectDialog(self)
-        dial.exec()
+    widget_update_signal = pyqtSignal()
+    invoke_signal = pyqtSignal(object)
+
+    def __init__(self, channel=None, recorder=None, keymap=None, macro_path=None):
+        """
+        The window is built, and shown right away. Without a channel, the user is asked where to connect,
+        and a QtChannel connects on the event loop, with its progress shown at the bottom.
+
+        :param channel: Channel to control, e.g. one on a LoopbackTransport, None asks the user where to connect
+        :param recorder: FlightRecorder for the Channel connected to, if channel is None
+        :param keymap: the Keymap of the keys, the default one if None
+        :param macro_path: macro file the input is recorded into, and played from, if it exists already
+        """
+        super().__init__()
 
+        self.recorder = recorder
+        self.cancelled = False
+        self.dial = None
+        self.channel = channel if channel is not None else PendingChannel(PendingChannel.DISCONNECTED)
+        self.axes = DriveAxes()
+        self.macro_path = macro_path
+        self.keys = KeyDispatcher(keymap if keymap is not None else Keymap(), self.channel, self.axes, {
+            CANCEL: self.cancel_connection,
+            RECORD: lambda: self.keys.toggle_recording(self.macro_path),
+            # The macro is played on the event loop, like the keys pressed
+            PLAY: lambda: self.keys.play(lambda function, *arguments: self.invoke_signal.emit(
+                partial(function, *arguments)
+            )),
+        })
+        if macro_path is not None and paths.exists(macro_path):
+            self.keys.macro = Macro.load(macro_path)
+        self.invoke_signal.connect(lambda call: call())
+
+        self.predictor = CollisionPredictor(key=self.DISTANCE)
+        self.dashboard = Dashboard(self, self.predictor)
+        self.dashboard.setGeometry(0, 0, 500, 450)
+        self.progress_label = None
+        self.progress_button = None
+        self.place_progress()
+        self.speed_plot = None
+        self.distance_plot = None
+        self.place_plots()
+
+        self.rendered_version = None
+        self.rendered_status = None
+        self.widget_update_signal.connect(self.update_widgets)
+        self.subscription = self.channel.subscribe(None, lambda changes: self.widget_update_signal.emit())
+        self.plot_subscription = self.channel.subscribe_frames(self.record_frames)
+        self.update_widgets()
+
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.show_progress)
+        if channel is None:
+            # Asked once the window is up
+            QTimer.singleShot(0, self.ask_connection)
+
+    def place_progress(self):
+        self.progress_label = QLabel(self)
+        self.progress_label.setGeometry(15, 455, 370, 35)
+        self.progress_label.setProperty('dial', True)
+        self.progress_button = Button(self)
+        self.progress_button.setGeometry(390, 455, 95, 35)
+        self.progress_button.setProperty('dial', True)
+        self.progress_button.clicked.connect(self.progress_clicked)
+        self.progress_label.hide()
+        self.progress_button.hide()
+
+    def place_plots(self):
+        self.speed_plot = TimeSeriesPlot(self.SPEED, Dashboard.SPEED_TEXT, Dashboard.SPEED_MEASURE,
+                                         Dashboard.SPEED_RANGE, self)
+        self.speed_plot.setGeometry(15, 495, 470, 120)
+        self.distance_plot = TimeSeriesPlot(self.DISTANCE, Dashboard.DISTANCE_TEXT, Dashboard.DISTANCE_MEASURE,
+                                            Dashboard.DISTANCE_RANGE, self)
+        self.distance_plot.setGeometry(15, 620, 470, 120)
+
+    def record_frames(self, frames, received):
+        """
+        Records the speed, and the distance of every frame for the plots, and the predictor, on the channel's thread,
+        and updates the dashboard, as the prediction moves on, even while the distance holds steady
+        """
+        self.predictor.feed(frames, received)
+        self.speed_plot.feed(frames, received)
+        self.distance_plot.feed(frames, received)
+        self.widget_update_signal.emit()
+
+    def ask_connection(self):
+        """Asks the user where to connect, without blocking the window"""
+        self.dial = ConnectDialog(self)
+        self.dial.accepted.connect(self.start_connection)
+        self.dial.open()
+
+    def start_connection(self):
+        """Starts connecting on the event loop, to where the user asked"""
         # tmp!!!!! TODO:
         try:
-            self.channel = Channel('192.168.1.11', 8000 + int(dial.port_field.text()), '69420')
-        except ValueError as _:
-            self.channel = Channel('192.168.1.11', 8000, '69420')
+            port = 8000 + int(self.dial.port_field.text())
+        except ValueError:
+            port = 8000
+        # QtChannel(dial.host_field.text(), dial.port_field.text(), dial.password_field.text())
+        previous = self.channel
+        channel = QtChannel('192.168.1.11', port, '69420', recorder=self.recorder, axes=self.axes, parent=self)
+        channel.ready.connect(self.connection_ready)
+        self.set_channel(channel)
+        if isinstance(previous, QtChannel):
+            # A connection that failed, or was cancelled
+            previous.deactivate()
+            previous.deleteLater()
+        self.cancelled = False
+        self.progress_button.setText('Cancel')
+        self.progress_label.show()
+        self.progress_button.show()
+        self.show_progress()
+        self.progress_timer.start(self.PROGRESS_INTERVAL)
+
+    def describe_connection(self) -> str:
+        """
+        :return: the progress of the connection, for the user
+        """
+        channel = self.channel
+        if self.cancelled:
+            return 'Cancelled'
+        if channel.status == QtChannel.CONNECTING:
+            return 'Connecting... %.1f s' % channel.elapsed
+        if not channel.granted:
+            return 'Failed: %s' % channel.error if channel.error else 'Rejected'
+        if channel.first_frame_after is None:
+            return 'Connected in %d ms' % (channel.connected_after * 1000)
+        return 'Connected in %d ms, first frame after %d ms' % (
+            channel.connected_after * 1000, channel.first_frame_after * 1000
+        )
 
-        # self.channel = Channel(dial.host_field.text(), dial.port_field.text(), dial.password_field.text())
+    def show_progress(self):
+        self.progress_label.setText(self.describe_connection())
+        if self.channel.status != QtChannel.CONNECTING and (
+                not self.channel.granted or self.channel.first_frame_after is not None):
+            self.progress_timer.stop()
+
+    def progress_clicked(self):
+        if self.channel.status == QtChannel.CONNECTING:
+            self.cancelled = True
+            self.channel.deactivate()
+            self.progress_button.setText('Retry')
+            self.show_progress()
+        else:
+            self.ask_connection()
 
-        self.move_buttons = dict()
-        self.light_buttons = dict()
-        self.distance_label = None
-        self.speed_label = None
-        self.line_label = None
+    def connection_ready(self, granted):
+        """
+        Shows the outcome of the connection
 
-        self.place_move_buttons()
-        self.place_light_buttons()
-        self.place_labels()
+        :param granted: whether the controller accepted the password
 
-        self.widget_update_signal.connect(self.update_widgets)
-        self.lock = Lock()
-        self.update_active = True
-
-        Thread(target=self.supervise_update).start()
-
-    def place_move_buttons(self):
-        self.move_buttons[self.FORWARD] = QLabel('🡅', self)
-        self.move_buttons[self.BACKWARD] = QLabel('🡇', self)
-        self.move_buttons[self.LEFT] = QLabel('🡄', self)
-        self.move_buttons[self.RIGHT] = QLabel('🡆', self)
-        self.move_buttons[self.REVERSE] = QLabel('R', self)
-
-        for button in self.move_buttons.values():
-            button.resize(100, 100)
-            button.setAlignment(Qt.AlignCenter)
-            button.setProperty('active', False)
-
-        self.move_buttons[self.REVERSE].resize(50, 50)
-
-        self.move_buttons[self.FORWARD].move(200, 250)
-        self.move_buttons[self.BACKWARD].move(200, 350)
-        self.move_buttons[self.LEFT].move(100, 350)
-        self.move_buttons[self.RIGHT].move(300, 350)
-        self.move_buttons[self.REVERSE].move(125, 275)
-
-    def place_light_buttons(self):
-        self.light_buttons[self.R_INDICATOR] = Button(self)
-        self.light_buttons[self.R_INDICATOR].setGeometry(400, 50, 50, 50)
-        self.light_buttons[self.R_INDICATOR].setText('🡂')
-
-        self.light_buttons[self.L_INDICATOR] = Button(self)
-        self.light_buttons[self.L_INDICATOR].setGeometry(50, 50, 50, 50)
-        self.light_buttons[self.L_INDICATOR].setText('🡀')
-
-        self.light_buttons[self.HAZARD_WARNING] = Button(self)
-        self.light_buttons[self.HAZARD_WARNING].setGeometry(225, 80, 50, 50)
-        self.light_buttons[self.HAZARD_WARNING].setText('⚠')
-
-        self.light_buttons[self.LIGHTS] = Button(self)
-        self.light_buttons[self.LIGHTS].setGeometry(225, 150, 50, 50)
-        self.light_buttons[self.LIGHTS].setText('⛭')
-        self.light_buttons[self.LIGHTS].setObjectName('lights')
-
-        for light in self.light_buttons.values():
-            light.setProperty('active', False)
-
-    def place_labels(self):
-        self.distance_label = QLabel(self.DISTANCE_TEXT + '0.0' + self.DISTANCE_MEASURE, self)
-        self.speed_label = QLabel(self.SPEED_TEXT + '0.0' + self.SPEED_MEASURE, self)
-        self.line_label = QLabel(parent=self)
-
-        for label in [self.distance_label, self.speed_label]:
-            label.resize(200, 50)
-            label.setAlignment(Qt.AlignCenter)
-            label.setProperty('warning', False)
-            label.setProperty('collide', False)
-
-        self.line_label.resize(20, 60)
-        self.line_label.setObjectName('linefollower')
-        self.line_label.setProperty('active', False)
-
-        self.distance_label.move(15, 150)
-        self.speed_label.move(285, 150)
-        self.line_label.move(240, 10)
+        :return: None
+        """
+        self.show_progress()
+        if granted:
+            self.progress_button.hide()
+        else:
+            self.progress_button.setText('Retry')
+
+    def set_channel(self, channel):
+        """
+        Switches to controlling another car, e.g. the one focused in a FleetView
+
+        :param channel: Channel of the car
+
+        :return: None
+        """
+        self.channel.unsubscribe(self.subscription)
+        self.channel.unsubscribe(self.plot_subscription)
+        self.channel = channel
+        self.keys.channel = channel
+        self.rendered_version = None
+        self.rendered_status = None
+        self.predictor.reset()
+        self.speed_plot.clear()
+        self.distance_plot.clear()
+        self.subscription = self.channel.subscribe(None, lambda changes: self.widget_update_signal.emit())
+        self.plot_subscription = self.channel.subscribe_frames(self.record_frames)
+        self.update_widgets()
+
+    def cancel_connection(self):
+        if self.channel.status == QtChannel.CONNECTING:
+            self.progress_clicked()
+
+    def key_event(self, event) -> tuple:
+        """
+        :param event: the key event
+
+        :return: the name of the key, and the mask of the MODIFIERS held, as the keymap expects them
+        """
+        modifiers = event.modifiers()
+        return (key_name(self.KEY_NAMES.get(event.key(), '')),
+                sum(bit for flag, bit in self.MODIFIER_FLAGS.items() if modifiers & flag))
 
     def keyPressEvent(self, event):
         if not event.isAutoRepeat():
-            key = event.key()
-
-            if event.modifiers() and Qt.ControlModifier and key == Qt.Key_D:
-                self.channel.set_value(self.DISTANCE_KEEPING, not self.channel.get_value(self.DISTANCE_KEEPING))
-            elif event.modifiers() and Qt.ControlModifier and key == Qt.Key_L:
-                self.channel.set_value(self.LINE_FOLLOWING, not self.channel.get_value(self.LINE_FOLLOWING))
-            elif event.modifiers() and Qt.ControlModifier and key == Qt.Key_K:
-                self.channel.set_value(self.KEEP_CONTAINED, not self.channel.get_value(self.KEEP_CONTAINED))
-            elif event.modifiers() and Qt.ShiftModifier and key == Qt.Key_C:
-                self.channel.set_value(self.CHANGE_DIRECTION, not self.channel.get_value(self.CHANGE_DIRECTION))
-            elif key == Qt.Key_Q:
-                self.channel.set_value(self.L_INDICATOR, not self.channel.get_value(self.L_INDICATOR))
-            elif key == Qt.Key_E:
-                self.channel.set_value(self.R_INDICATOR, not self.channel.get_value(self.R_INDICATOR))
-            elif key == Qt.Key_H:
-                self.channel.set_value(self.HAZARD_WARNING, not self.channel.get_value(self.HAZARD_WARNING))
-            elif key == Qt.Key_L:
-                self.channel.set_value(self.LIGHTS, not self.channel.get_value(self.LIGHTS))
-            elif key == Qt.Key_R:
-                self.channel.set_value(self.REVERSE, not self.channel.get_value(self.REVERSE))
-            elif key == Qt.Key_B:
-                self.channel.set_value(self.HORN, True)
-            elif key in (Qt.Key_W, Qt.Key_Up):
-                self.channel.set_value(self.FORWARD, True)
-            elif key in (Qt.Key_S, Qt.Key_Down):
-                self.channel.set_value(self.BACKWARD, True)
-            elif key in (Qt.Key_A, Qt.Key_Left):
-                self.channel.set_value(self.LEFT, True)
-            elif key in (Qt.Key_D, Qt.Key_Right):
-                self.channel.set_value(self.RIGHT, True)
+            self.keys.press(*self.key_event(event))
 
     def keyReleaseEvent(self, event):
         if not event.isAutoRepeat():
-            key = event.key()
-            if key == Qt.Key_B:
-                self.channel.set_value(self.HORN, False)
-            elif key in (Qt.Key_W, Qt.Key_Up):
-                self.channel.set_value(self.FORWARD, False)
-            elif key in (Qt.Key_S, Qt.Key_Down):
-                self.channel.set_value(self.BACKWARD, False)
-            elif key in (Qt.Key_A, Qt.Key_Left):
-                self.channel.set_value(self.LEFT, False)
-            elif key in (Qt.Key_D, Qt.Key_Right):
-                self.channel.set_value(self.RIGHT, False)
+            self.keys.release(*self.key_event(event))
 
     def update_widgets(self):
-        self.lock.acquire(timeout=1)
-
-        self.distance_label.setText(
-            self.DISTANCE_TEXT +
-            str(self.channel.get_value(self.DISTANCE)) +
-            self.DISTANCE_MEASURE
-        )
-
-        old_value = self.distance_label.property('collide')
-        self.distance_label.setProperty('collide', self.channel.get_value(self.DISTANCE) < 10)
-        if old_value != self.distance_label.property('collide'):
-            self.distance_label.setStyle(self.distance_label.style())
-        else:
-            old_value = self.distance_label.property('warning')
-            self.distance_label.setProperty('warning', self.channel.get_value(self.DISTANCE) < 25)
-            if old_value != self.distance_label.property('warning'):
-                self.distance_label.setStyle(self.distance_label.style())
-
-        self.speed_label.setText(
-            self.SPEED_TEXT +
-            str(self.channel.get_value(self.SPEED)) +
-            self.SPEED_MEASURE
-        )
+        if self.channel.status != self.rendered_status:
+            self.rendered_status = self.channel.status
+            connected = self.rendered_status == self.channel.CONNECTED
+            self.setWindowTitle(self.TITLE if connected else self.TITLE + ' - ' + self.rendered_status)
 
-        old_value = self.speed_label.property('collide')
-        self.speed_label.setProperty('collide', self.channel.get_value(self.SPEED) > 30)
-        if old_value != self.speed_label.property('collide'):
-            self.speed_label.setStyle(self.speed_label.style())
-        else:
-            old_value = self.speed_label.property('warning')
-            self.speed_label.setProperty('warning', self.channel.get_value(self.SPEED) > 20)
-            if old_value != self.speed_label.property('warning'):
-                self.speed_label.setStyle(self.speed_label.style())
-
-        old_value = self.line_label.property('active')
-        self.line_label.setProperty('active', self.channel.get_value(self.LINE))
-        if old_value != self.line_label.property('active'):
-            self.line_label.setStyle(self.line_label.style())
-
-        for name, button in self.light_buttons.items():
-            old_value = button.property('active')
-            button.setProperty('active', self.channel.get_value(name))
-            if old_value != button.property('active'):
-                button.setStyle(button.style())
-
-        for name, button in self.move_buttons.items():
-            old_value = button.property('active')
-            button.setProperty('active', self.channel.get_value(name))
-            if old_value != button.property('active'):
-                button.setStyle(button.style())
-
-        self.lock.release()
+        state = self.channel.snapshot()
+        if state.version == self.rendered_version:
+            return
+        self.rendered_version = state.version
+        self.dashboard.show_state(state)
 
     def closeEvent(self, event):
-        self.channel.set_value(self.DISTANCE_KEEPING, False)
-        sleep(0.05)
-        self.channel.set_value(self.LINE_FOLLOWING, False)
-        sleep(0.05)
-        self.channel.set_value(self.KEEP_CONTAINED, False)
+        self.progress_timer.stop()
+        self.channel.set_values([self.DISTANCE_KEEPING, self.LINE_FOLLOWING, self.KEEP_CONTAINED], [False] * 3)
+        self.channel.unsubscribe(self.subscription)
+        self.channel.unsubscribe(self.plot_subscription)
         self.channel.deactivate()
-        self.lock.acquire()
-        self.update_active = False
         super().closeEvent(event)
-
-    def supervise_update(self):
-        while self.lock.acquire(timeout=1) and self.update_active:
-            self.lock.release()
-            self.widget_update_signal.emit()
-            sleep(0.05)
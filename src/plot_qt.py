@@ -0,0 +1,124 @@
+from math import isnan
+from time import monotonic
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import QTimer, QRectF, QLineF
+from PyQt5.QtGui import QPainter, QColor, QPen, QFont
+from PyQt5.Qt import Qt
+from ring_buffer import RingBuffer, decimate
+
+
+class TimeSeriesPlot(QWidget):
+    """
+    Rolling plot of the last span seconds of a key of the telemetry.
+    | Every frame is appended to a RingBuffer by feed, on whichever thread the channel receives on, and the plot
+    | is redrawn FRAME_INTERVAL milliseconds apart. Each redraw decimates the window to the lowest, and the highest
+    | value of every pixel column, so it costs the same at any telemetry rate, only the width of the plot counts.
+    | The wheel zooms the span between MIN_SPAN, and MAX_SPAN.
+
+    .. attribute:: buffer
+        The RingBuffer of the samples, big enough for MAX_SPAN seconds at MAX_RATE
+
+    .. attribute:: span
+        The seconds shown
+
+    :var: FRAME_INTERVAL
+    :var: SPAN
+    :var: MIN_SPAN
+    :var: MAX_SPAN
+    :var: MAX_RATE
+    """
+
+    FRAME_INTERVAL = 33
+    SPAN = 30.0
+    MIN_SPAN = 10.0
+    MAX_SPAN = 60.0
+    SPAN_STEP = 10.0
+    MAX_RATE = 1000
+
+    MARGIN = 5
+    CAPTION_HEIGHT = 18
+    BACKGROUND_COLOR = QColor('white')
+    BORDER_COLOR = QColor('black')
+    GRID_COLOR = QColor('#d0d0d0')
+    LINE_COLOR = QColor('#1f5fbf')
+
+    def __init__(self, key, text, measure, full_scale, parent=None):
+        """
+        :param key: the key of the telemetry to plot
+        :param text: caption of the plot
+        :param measure: unit of the values
+        :param full_scale: the value at the top of the plot, which grows, if a higher one is shown
+        :param parent: parent widget
+        """
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.key = key
+        self.text = text
+        self.measure = measure
+        self.full_scale = full_scale
+        self.span = self.SPAN
+        self.buffer = RingBuffer(int(self.MAX_SPAN * self.MAX_RATE))
+        self.__timer = QTimer(self)
+        self.__timer.timeout.connect(self.update)
+        self.__timer.start(self.FRAME_INTERVAL)
+
+    def feed(self, frames, received) -> None:
+        """
+        Records the value of the key in every frame, a frame without it, or with a value of False leaves a gap
+
+        :param frames: the telemetry frames, as given to the subscribers of the frames of a channel
+        :param received: the time the frames were received at, by the monotonic clock
+
+        :return: None
+        """
+        for frame in frames:
+            value = frame.get(self.key, False)
+            self.buffer.append(received, np.nan if value is False or value is None else value)
+
+    def clear(self) -> None:
+        self.buffer.clear()
+        self.update()
+
+    def set_span(self, seconds) -> None:
+        self.span = max(self.MIN_SPAN, min(self.MAX_SPAN, seconds))
+        self.update()
+
+    def wheelEvent(self, event):
+        self.set_span(self.span - self.SPAN_STEP * event.angleDelta().y() / 120)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.BACKGROUND_COLOR)
+        plot = QRectF(self.rect()).adjusted(self.MARGIN, self.CAPTION_HEIGHT, -self.MARGIN, -self.MARGIN)
+        columns = max(1, int(plot.width()))
+
+        end = monotonic()
+        times, values = self.buffer.window(end - self.span)
+        low, high = decimate(times, values, end - self.span, end, columns)
+        top = max(self.full_scale, float(np.nanmax(high))) if not np.isnan(high).all() else self.full_scale
+
+        painter.setPen(self.GRID_COLOR)
+        for share in (0.25, 0.5, 0.75):
+            y = plot.bottom() - plot.height() * share
+            painter.drawLine(QLineF(plot.left(), y, plot.right(), y))
+
+        # Each column is a vertical line from its lowest to its highest value, at least a pixel long
+        shown = ~np.isnan(low)
+        xs = plot.left() + np.arange(columns)[shown] + 0.5
+        lows = plot.bottom() - plot.height() * np.clip(low[shown] / top, 0, 1)
+        highs = plot.bottom() - plot.height() * np.clip(high[shown] / top, 0, 1)
+        painter.setPen(QPen(self.LINE_COLOR, 1))
+        painter.drawLines([QLineF(x, y0 + 0.5, x, y1 - 0.5) for x, y0, y1 in zip(xs, lows, highs)])
+
+        painter.setPen(self.BORDER_COLOR)
+        painter.drawRect(plot)
+        font = QFont()
+        font.setPixelSize(12)
+        painter.setFont(font)
+        latest = values[-1] if len(values) else np.nan
+        painter.drawText(
+            QRectF(self.MARGIN, 0, self.width() - 2 * self.MARGIN, self.CAPTION_HEIGHT), Qt.AlignVCenter,
+            '%s: %s    last %g s' % (self.text, '—' if isnan(latest) else '%g %s' % (latest, self.measure), self.span)
+        )
+        painter.end()
@@ -0,0 +1,402 @@
+from collections import defaultdict
+from hashlib import sha256
+from struct import Struct
+from codec import JsonCodec, BinaryCodec
+from latency import LatencyMonitor
+
+
+class Keys:
+    """Keys of the message, and the data tables exchanged with the controller"""
+
+    FORWARD = 'forward'
+    BACKWARD = 'backward'
+    LEFT = 'turn_left'
+    RIGHT = 'turn_right'
+    R_INDICATOR = 'right_indicator'
+    L_INDICATOR = 'left_indicator'
+    HAZARD_WARNING = 'hazard_warning'
+    LIGHTS = 'lights'
+    HORN = 'horn'
+    DISTANCE = 'distance'
+    SPEED = 'speed'
+    LINE = 'line'
+    REVERSE = 'reverse'
+    THROTTLE = 'throttle'
+    STEERING = 'steering'
+
+    DISTANCE_KEEPING = 'distance_keeping'
+    LINE_FOLLOWING = 'line_following'
+    KEEP_CONTAINED = 'keep_contained'
+
+    CHANGE_DIRECTION = 'change_direction'
+
+
+class TelemetrySnapshot:
+    """
+    Immutable state of the car, as reported by the controller at one point in time.
+    | A new snapshot is published for every batch of telemetry, by replacing the reference to the old one,
+    | so readers need no lock, and everything read from a single snapshot is consistent.
+    | Keys the controller did not report read as False, like they always have.
+
+    .. attribute:: version
+        Increases by one with every published snapshot, so readers can tell whether anything has changed
+    """
+
+    __slots__ = ('version', '__values')
+
+    def __init__(self, version=0, values=None):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, '_TelemetrySnapshot__values', dict(values) if values else dict())
+
+    def __setattr__(self, key, value):
+        raise AttributeError('TelemetrySnapshot is immutable')
+
+    def __getitem__(self, key):
+        return self.__values.get(key, False)
+
+    def __contains__(self, key):
+        return key in self.__values
+
+    def get_values(self, keys) -> list:
+        return [self.__values.get(key, False) for key in keys]
+
+    def items(self):
+        return self.__values.items()
+
+
+class Protocol:
+    """
+    The protocol spoken with the controller, without any I/O, so every kind of channel can share it.
+
+    .. note:: Handshake
+        | The sha256 digest of the password is sent on the sending connection, and the controller answers
+        | on the receiving one. Older firmware answers with a bare GRANTED, newer firmware lists its capabilities
+        | after it, e.g. GRANTED BIN1 DELTA, and waits for the client to pick from them with a USE line,
+        | e.g. USE BIN1, before the first frame in either direction.
+
+    .. note:: Frames
+        | Commands are sent as frames of the message table, either whole, or in delta mode only the keys that
+        | differ from what was last sent to the controller, with a full frame every RESYNC_INTERVAL-th time.
+        | Each telemetry frame updates the snapshot, never the message table, and is acknowledged with
+        | ACKNOWLEDGEMENT, so older firmware has a single frame in flight at a time. Firmware offering SEQ=<window>
+        | numbers its frames with a seq key, and keeps sending while less than window frames are unacknowledged.
+        | Those frames are acknowledged cumulatively, with an ACK <seq> line once half of the window has arrived.
+
+    .. note:: Drive lane
+        | Firmware offering UDP=<port> accepts the state of the DRIVE_KEYS as datagrams on that port, so a lost
+        | segment of the TCP stream can not hold up the steering. A datagram is a sequence number, and a bit for
+        | each drive key, see DRIVE_DATAGRAM. The controller drops datagrams older than the newest one it has seen.
+        | The state is sent on every change, then repeated while any drive key is active, and DRIVE_REPEATS times
+        | after all of them are released, so losing a datagram only delays the car until the next one.
+        | Drive keys are left out of the command frames, once the lane is agreed on.
+
+    .. note:: Sessions
+        | Firmware offering TOKEN=<token> lets a client, that lost its connections, resume the session by sending
+        | a RESUME <token> line, instead of the digest of the password. The answer is the same as to the password,
+        | and the client replays its whole message table after it.
+
+    .. note:: Timing
+        | Firmware offering TIME, along with SEQ, stamps its telemetry, and reports the stamps of the client back,
+        | as described at LatencyMonitor. The client stamps its command frames, and adds its clock to the ACK lines,
+        | as ACK <seq> <time>.
+
+    .. attribute:: codec
+        The codec agreed on with the controller, JsonCodec unless both sides support a binary one
+
+    .. attribute:: capabilities
+        The capabilities offered by the controller
+
+    .. attribute:: message_table
+        The commanded state of the car, only ever set by the client, never by the telemetry
+
+    .. attribute:: snapshot
+        TelemetrySnapshot of the last telemetry frame received from the controller
+
+    .. attribute:: received
+        The time the last chunk of telemetry was received at, by the clock of the latency monitor
+
+    .. attribute:: window
+        The number of telemetry frames the controller may send without waiting for an acknowledgement
+
+    .. attribute:: lost_frames
+        The number of telemetry frames missing from the sequence numbers seen so far
+
+    .. attribute:: drive_port
+        The UDP port of the drive lane, None if the drive keys are sent in the command frames
+
+    .. attribute:: token
+        The token to resume the session with, None if the controller did not offer one
+
+    .. attribute:: latency
+        LatencyMonitor of the connection, which knows the age of the telemetry even without TIME
+
+    :var: GRANTED
+    :var: DELTA_CAPABILITY
+    :var: SEQUENCE_CAPABILITY
+    :var: RESYNC_INTERVAL
+    :var: ACKNOWLEDGEMENT
+    :var: SEQUENCE_KEY
+    :var: UDP_CAPABILITY
+    :var: DRIVE_KEYS
+    :var: DRIVE_DATAGRAM
+    :var: DRIVE_REPEATS
+    :var: TOKEN_CAPABILITY
+    :var: TIME_CAPABILITY
+    """
+
+    GRANTED = 'GRANTED'
+    DELTA_CAPABILITY = 'DELTA'
+    SEQUENCE_CAPABILITY = 'SEQ'
+    RESYNC_INTERVAL = 50
+    ACKNOWLEDGEMENT = b'Done.'
+    SEQUENCE_KEY = 'seq'
+
+    UDP_CAPABILITY = 'UDP'
+    DRIVE_KEYS = (Keys.FORWARD, Keys.BACKWARD, Keys.LEFT, Keys.RIGHT)
+    DRIVE_BITS = {key: 1 << index for index, key in enumerate(DRIVE_KEYS)}
+    DRIVE_DATAGRAM = Struct('<IB')
+    DRIVE_REPEATS = 3
+    TOKEN_CAPABILITY = 'TOKEN'
+    TIME_CAPABILITY = 'TIME'
+
+    def __init__(self, delta=None, binary=True, udp=False):
+        """
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param udp: whether to send the drive keys on the UDP lane, if the controller supports it
+        """
+        self.message_table = defaultdict(bool)
+        self.snapshot = TelemetrySnapshot()
+        self.received = None
+        self.lost_frames = 0
+        self.token = None
+        self.latency = LatencyMonitor()
+
+        self.__requested_delta = delta
+        self.__binary = binary
+        self.__udp = udp
+        self.__drive_state = dict()
+        self.__drive_sequence = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forgets everything agreed on with the controller, but keeps the tables, so they can be replayed
+        on a new connection. The first command frame after a reset is always a full one.
+
+        :return: None
+        """
+        self.codec = JsonCodec
+        self.capabilities = []
+        self.window = 1
+        self.drive_port = None
+
+        self.__delta = bool(self.__requested_delta)
+        self.__sent_table = dict()
+        self.__frames_since_resync = self.RESYNC_INTERVAL
+        self.__decoder = None
+        self.__sequenced = False
+        self.__timed = False
+        self.__last_sequence = None
+        self.__unacknowledged = 0
+        self.__drive_repeats = self.DRIVE_REPEATS if self.__drive_state else 0
+        self.latency.resynchronize()
+
+    @staticmethod
+    def authentication(password) -> bytes:
+        return sha256(password.encode()).digest()
+
+    def resumption(self) -> bytes:
+        """
+        :return: what to send instead of the authentication, to resume the last session, nothing if it can not be
+        """
+        if self.token is None:
+            return b''
+        return b'RESUME ' + self.token.encode() + b'\n'
+
+    def read_answer(self, answer):
+        """
+        Reads the answer of the controller to the password
+
+        :param answer: the first bytes received on the receiving connection
+
+        :return: whether the password was accepted, and the bytes after the answer, which belong to the telemetry
+        """
+        end = answer.find(b'\n')
+        if end < 0:
+            # Older firmware does not terminate the answer, and may send the first frame right after it
+            end = answer.find(b'{')
+            end = len(answer) if end < 0 else end
+            rest = answer[end:]
+        else:
+            rest = answer[end + 1:]
+
+        words = answer[:end].decode().split()
+        self.capabilities = words[1:]
+        granted = words[:1] == [self.GRANTED]
+        token = self.capability(self.TOKEN_CAPABILITY) if granted else None
+        self.token = token if token not in (None, True) else None
+        return granted, rest
+
+    def capability(self, name):
+        """
+        :param name: name of the capability
+
+        :return: the value after the = sign of the capability, True if it has none, None if it is not offered
+        """
+        for capability in self.capabilities:
+            key, separator, value = capability.partition('=')
+            if key == name:
+                return value if separator else True
+        return None
+
+    def agree(self) -> bytes:
+        """
+        Picks the options to use from the capabilities offered by the controller
+
+        :Assumptions:
+          * The answer of the controller has been read already
+
+        :return: the USE line to send to the controller, or nothing for older firmware
+        """
+        if not self.capabilities:
+            return b''
+
+        chosen = []
+        if self.__binary and BinaryCodec.NAME in self.capabilities:
+            self.codec = BinaryCodec
+            chosen.append(BinaryCodec.NAME)
+        if self.__requested_delta is None:
+            self.__delta = self.DELTA_CAPABILITY in self.capabilities
+        if self.__delta and self.DELTA_CAPABILITY in self.capabilities:
+            chosen.append(self.DELTA_CAPABILITY)
+        window = self.capability(self.SEQUENCE_CAPABILITY)
+        if window is not None:
+            self.__sequenced = True
+            self.window = max(1, int(window)) if window is not True else 1
+            chosen.append(self.SEQUENCE_CAPABILITY)
+            if self.TIME_CAPABILITY in self.capabilities:
+                self.__timed = True
+                chosen.append(self.TIME_CAPABILITY)
+        port = self.capability(self.UDP_CAPABILITY)
+        if self.__udp and port not in (None, True):
+            self.drive_port = int(port)
+            chosen.append(self.UDP_CAPABILITY)
+        return ' '.join(['USE'] + chosen).encode() + b'\n'
+
+    def set_value(self, key, value) -> bool:
+        """
+        Sets a value of the message table
+
+        :param key: the key to set
+        :param value: the new value
+
+        :return: whether the key goes on the drive lane, instead of the command frames
+        """
+        self.message_table[key] = value
+        if self.drive_port is None or key not in self.DRIVE_BITS:
+            return False
+        self.__drive_state[key] = bool(value)
+        self.__drive_repeats = self.DRIVE_REPEATS
+        return True
+
+    def drive_datagram(self) -> bytes:
+        """
+        Builds the next datagram of the drive lane, from the drive keys last set, never from the telemetry
+
+        :return: the datagram
+        """
+        self.__drive_sequence = (self.__drive_sequence + 1) & 0xffffffff
+        bits = 0
+        for key, value in self.__drive_state.items():
+            if value:
+                bits |= self.DRIVE_BITS[key]
+        if not bits:
+            self.__drive_repeats -= 1
+        return self.DRIVE_DATAGRAM.pack(self.__drive_sequence, bits)
+
+    def drive_refresh_needed(self) -> bool:
+        """
+        :return: whether the state of the drive lane has to be repeated
+        """
+        return self.drive_port is not None and (self.__drive_repeats > 0 or any(self.__drive_state.values()))
+
+    def command_frame(self) -> bytes:
+        """
+        Builds the next command frame, and assumes it is going to be sent
+
+        :return: the encoded frame, which is empty if there is nothing to send
+        """
+        excluded = self.DRIVE_BITS if self.drive_port is not None else ()
+        if not self.__delta or self.__frames_since_resync >= self.RESYNC_INTERVAL:
+            self.__frames_since_resync = 0
+            frame = {key: value for key, value in self.message_table.items() if key not in excluded}
+        else:
+            frame = {
+                key: value for key, value in self.message_table.items()
+                if key not in excluded and (key not in self.__sent_table or self.__sent_table[key] != value)
+            }
+            if frame:
+                self.__frames_since_resync += 1
+
+        if not frame:
+            return b''
+        self.__sent_table.update(frame)
+        if self.__timed:
+            self.latency.stamp(frame)
+        return self.codec.encode(frame)
+
+    def decode(self, data) -> list:
+        """
+        Decodes the next chunk of the telemetry stream
+
+        :param data: bytes like object, as received from the socket
+
+        :return: the frames completed by this chunk
+        """
+        if self.__decoder is None:
+            self.__decoder = self.codec.decoder()
+        frames = [frame for frame in self.__decoder.feed(data) if isinstance(frame, dict)]
+        received = self.received = self.latency.clock()
+
+        if self.__sequenced:
+            for frame in frames:
+                sequence = frame.pop(self.SEQUENCE_KEY, None)
+                if not isinstance(sequence, int):
+                    continue
+                if self.__last_sequence is not None and sequence > self.__last_sequence + 1:
+                    self.lost_frames += sequence - self.__last_sequence - 1
+                self.__last_sequence = sequence
+        for frame in frames:
+            self.latency.observe(frame, received)
+        return frames
+
+    def apply(self, frames) -> None:
+        """
+        Publishes the snapshot of the last telemetry frame. The message table, and what was sent of it are left
+        as they are, so a report, stale or not, can neither overwrite a change, nor hide it from the next delta.
+
+        :param frames: the frames, as returned by decode
+
+        :return: None
+        """
+        if not frames:
+            return
+        self.snapshot = TelemetrySnapshot(self.snapshot.version + 1, frames[-1])
+
+    def acknowledgement(self, frames) -> bytes:
+        """
+        :param frames: the frames, as returned by decode
+
+        :return: what to send back to the controller for them, which can be nothing
+        """
+        if not self.__sequenced:
+            return self.ACKNOWLEDGEMENT * len(frames)
+
+        self.__unacknowledged += len(frames)
+        if self.__last_sequence is None or self.__unacknowledged < max(1, self.window // 2):
+            return b''
+        self.__unacknowledged = 0
+        if self.__timed:
+            return b'ACK %d %.6f\n' % (self.__last_sequence, self.latency.clock())
+        return b'ACK %d\n' % self.__last_sequence
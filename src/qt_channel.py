@@ -0,0 +1,392 @@
+from random import uniform
+from PyQt5.QtCore import QObject, QTimer, QElapsedTimer, pyqtSignal
+from PyQt5.QtNetwork import QAbstractSocket, QTcpSocket
+from axes import AxisStreamer
+from channel import Channel
+from protocol import Keys, Protocol
+from subscriptions import Subscriptions
+
+
+class QtChannel(QObject, Keys):
+    """
+    Class handling the communication with the controller of the car, on the Qt event loop.
+    | It speaks the same protocol as Channel, over QTcpSockets, so it needs no thread, no lock, and no polling:
+    | the telemetry is decoded, and handed to the subscribers as soon as Qt reports it readable,
+    | and the subscribers run on the thread of the event loop, so they may touch the widgets right away.
+    | The handshake does not block either, the window keeps responding while it runs, and ready is emitted
+    | once it is over. Changes made within a tick of the first one are sent in the same frame, and while
+    | the socket still has a frame to write, further changes merge into the next one, like with Channel.
+    | Lost connections are reestablished with the backoff of Channel, resuming the session if possible.
+    | There is no drive lane, the drive keys go with the rest of the commands.
+    | Given DriveAxes, a timer sends their changes axis_rate times a second, like Channel does.
+
+    .. attribute:: status
+        CONNECTING, CONNECTED, RECONNECTING, or DISCONNECTED, also published to the subscribers of STATUS
+
+    .. attribute:: granted
+        Whether the controller accepted the password
+
+    .. attribute:: error
+        Why the last attempt to connect failed, None if it did not
+
+    .. attribute:: connected_after
+        Seconds from the start until the controller accepted the password, None until then
+
+    .. attribute:: first_frame_after
+        Seconds from the start until the first telemetry frame arrived, None until then
+    """
+
+    STATUS = Channel.STATUS
+    CONNECTING = 'connecting'
+    CONNECTED = Channel.CONNECTED
+    RECONNECTING = Channel.RECONNECTING
+    DISCONNECTED = Channel.DISCONNECTED
+
+    ready = pyqtSignal(bool)
+
+    def __init__(self, host, port, password, delta=None, binary=True, tick=Channel.TICK, reconnect=True,
+                 recorder=None, handshake_timeout=Channel.HANDSHAKE_TIMEOUT, axes=None, axis_rate=AxisStreamer.RATE,
+                 axis_quantum=AxisStreamer.QUANTUM, parent=None):
+        """
+        Starts connecting to the controller, ready tells whether the password was accepted
+
+        :param host: IP address of the controller
+        :param port: port of the controller
+        :param password: password of the controller
+        :param delta: whether to send delta frames, None leaves it to the capabilities of the controller
+        :param binary: whether to use the binary codec, if the controller supports it
+        :param tick: seconds to gather changes for, before sending them, None sends each right away
+        :param reconnect: whether to reconnect, when the connection is lost
+        :param recorder: FlightRecorder to record the session with, which is closed with the channel
+        :param handshake_timeout: seconds to wait for the connections, and the answer of the controller
+        :param axes: DriveAxes to stream, None sends only what is set
+        :param axis_rate: how many times a second the axes are sent, at most
+        :param axis_quantum: the step of the values of the axes sent
+        :param parent: parent QObject
+        """
+        QObject.__init__(self, parent)
+        self.__host = host
+        self.__port = int(port)
+        self.__protocol = Protocol(delta, binary)
+        self.__authentication = self.__protocol.authentication(password)
+        self.__tick = tick
+        self.__reconnect = reconnect
+        self.__recorder = recorder
+        self.__subscriptions = Subscriptions()
+        self.__pending = False
+        self.__active = True
+        self.__handshaking = False
+        self.__resuming = False
+        self.__delay = Channel.RECONNECT_DELAY
+        self.status = self.DISCONNECTED
+        self.granted = False
+        self.error = None
+        self.connected_after = None
+        self.first_frame_after = None
+        self.__started = QElapsedTimer()
+        self.__started.start()
+
+        self.__sending = QTcpSocket(self)
+        self.__receiving = QTcpSocket(self)
+        self.__sending.connected.connect(self.__receiving_connect)
+        self.__receiving.connected.connect(self.__authenticate)
+        self.__receiving.readyRead.connect(self.__read)
+        self.__sending.bytesWritten.connect(self.__send)
+        for connection in (self.__sending, self.__receiving):
+            connection.error.connect(self.__failed)
+            connection.disconnected.connect(self.__lost)
+
+        self.__tick_timer = self.__single_shot(self.__send)
+        self.__handshake_timer = self.__single_shot(self.__timed_out)
+        self.__handshake_timeout = handshake_timeout
+        self.__reconnect_timer = self.__single_shot(self.__open)
+        self.__streamer = AxisStreamer(axes, axis_quantum) if axes is not None else None
+        self.__axis_timer = QTimer(self)
+        self.__axis_timer.timeout.connect(self.__stream)
+        if self.__streamer is not None:
+            self.__axis_timer.start(int(1000 / axis_rate))
+
+        self.__set_status(self.CONNECTING)
+        self.__open()
+
+    def __single_shot(self, slot) -> QTimer:
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(slot)
+        return timer
+
+    @property
+    def codec(self):
+        return self.__protocol.codec
+
+    @property
+    def elapsed(self) -> float:
+        """
+        :return: seconds since the channel started connecting
+        """
+        return self.__started.elapsed() / 1000
+
+    def __set_status(self, status):
+        self.status = status
+        self.__subscriptions.notify({self.STATUS: status})
+
+    def __open(self):
+        """Opens the connections, the command connection first, as the controller pairs them in that order"""
+        if not self.__active:
+            return
+        self.__protocol.reset()
+        self.__handshaking = True
+        self.__resuming = bool(self.__protocol.resumption())
+        if self.__handshake_timeout is not None:
+            self.__handshake_timer.start(int(self.__handshake_timeout * 1000))
+        self.__sending.connectToHost(self.__host, self.__port)
+
+    def __receiving_connect(self):
+        self.__sending.setSocketOption(QAbstractSocket.LowDelayOption, 1)
+        self.__sending.setSocketOption(QAbstractSocket.KeepAliveOption, 1)
+        self.__receiving.connectToHost(self.__host, self.__port)
+
+    def __authenticate(self):
+        self.__receiving.setSocketOption(QAbstractSocket.LowDelayOption, 1)
+        self.__receiving.setSocketOption(QAbstractSocket.KeepAliveOption, 1)
+        self.__sending.write(self.__protocol.resumption() if self.__resuming else self.__authentication)
+
+    def __read(self):
+        data = bytes(self.__receiving.readAll())
+        if self.__handshaking:
+            self.__answer(data)
+        else:
+            self.__receive(data)
+
+    def __receive(self, data):
+        """
+        Applies the telemetry in the received bytes, acknowledges it, and notifies the subscribers
+
+        :param data: bytes received on the receiving connection
+
+        :return: None
+        """
+        frames = self.__protocol.decode(data)
+        if not frames:
+            return
+        previous = self.__protocol.snapshot
+        self.__protocol.apply(frames)
+        if self.__recorder is not None:
+            self.__recorder.telemetry(frames)
+        acknowledgement = self.__protocol.acknowledgement(frames)
+        if acknowledgement:
+            self.__receiving.write(acknowledgement)
+        if self.first_frame_after is None:
+            self.first_frame_after = self.elapsed
+        self.__subscriptions.notify_frames(frames, self.__protocol.received)
+        self.__subscriptions.notify(Subscriptions.diff(previous, self.__protocol.snapshot))
+
+    def __answer(self, data):
+        """
+        Reads the answer of the controller, and starts the session, if it accepted the credentials
+
+        :param data: the first bytes received on the receiving connection
+
+        :return: None
+        """
+        self.__handshake_timer.stop()
+        granted, initial_data = self.__protocol.read_answer(data)
+        if not granted:
+            resumed = self.__resuming
+            self.__close_sockets()
+            if resumed:
+                # The session has expired, so the password is sent instead
+                self.__protocol.token = None
+                self.__open()
+            elif self.connected_after is None:
+                self.__handshaking = False
+                self.__set_status(self.DISCONNECTED)
+                self.ready.emit(False)
+            else:
+                self.__schedule_reconnect()
+            return
+
+        self.__handshaking = False
+        self.__sending.write(self.__protocol.agree())
+        self.__delay = Channel.RECONNECT_DELAY
+        self.error = None
+        first = not self.granted
+        self.granted = True
+        if first:
+            self.connected_after = self.elapsed
+        self.__set_status(self.CONNECTED)
+        if self.__protocol.message_table:
+            # Replays the message table, so the car gets back to the commanded state
+            self.__pending = True
+            self.__send()
+        if first:
+            self.ready.emit(True)
+        if initial_data:
+            self.__receive(initial_data)
+
+    def __send(self):
+        """Sends the changes of the message table, unless the previous frame is still being written"""
+        if not self.__pending or self.status != self.CONNECTED or self.__tick_timer.isActive():
+            return
+        if self.__sending.bytesToWrite():
+            # bytesWritten calls again, once the socket has taken the previous frame
+            return
+        self.__pending = False
+        frame = self.__protocol.command_frame()
+        if frame:
+            self.__sending.write(frame)
+
+    def __stream(self):
+        """Sends the changes of the axes, which are kept until connected, and replayed then, like the rest"""
+        changes = self.__streamer.poll()
+        if changes:
+            self.set_values(list(changes), list(changes.values()))
+
+    def __close_sockets(self):
+        self.__handshake_timer.stop()
+        for connection in (self.__sending, self.__receiving):
+            connection.blockSignals(True)
+            connection.abort()
+            connection.blockSignals(False)
+
+    def __failed(self):
+        connection = self.sender()
+        self.__handshake_failed(connection.errorString() if connection is not None else None)
+
+    def __timed_out(self):
+        self.__handshake_failed('timed out')
+
+    def __handshake_failed(self, error):
+        """
+        Gives up the attempt to connect, retrying later if the channel has been connected before
+
+        :param error: why the attempt failed
+
+        :return: None
+        """
+        if not self.__active:
+            return
+        if not self.__handshaking:
+            self.__lost()
+            return
+        self.error = error
+        self.__close_sockets()
+        if self.connected_after is None:
+            self.__handshaking = False
+            self.__set_status(self.DISCONNECTED)
+            self.ready.emit(False)
+        else:
+            self.__schedule_reconnect()
+
+    def __lost(self):
+        if not self.__active or self.__handshaking or self.status != self.CONNECTED:
+            return
+        self.__close_sockets()
+        if not self.__reconnect:
+            self.__set_status(self.DISCONNECTED)
+            return
+        self.__set_status(self.RECONNECTING)
+        self.__schedule_reconnect()
+
+    def __schedule_reconnect(self):
+        self.__handshaking = False
+        if self.status != self.RECONNECTING:
+            self.__set_status(self.RECONNECTING)
+        self.__reconnect_timer.start(int(uniform(self.__delay / 2, self.__delay) * 1000))
+        self.__delay = min(self.__delay * 2, Channel.RECONNECT_MAX_DELAY)
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Writes every change set so far, blocking the event loop until it is written, or the timeout passes
+
+        :param timeout: seconds to wait at most, None waits as long as it takes
+
+        :return: whether everything has been sent
+        """
+        self.__tick_timer.stop()
+        self.__send()
+        if self.status != self.CONNECTED:
+            return not self.__pending
+        milliseconds = int(timeout * 1000) if timeout is not None else -1
+        while self.__sending.bytesToWrite() and self.__sending.waitForBytesWritten(milliseconds):
+            self.__send()
+        return not self.__pending and not self.__sending.bytesToWrite()
+
+    def deactivate(self, timeout=1.0):
+        """
+        Sends what is left to send, and closes the connections
+
+        :param timeout: seconds to wait for the rest to be sent at most
+
+        :return: None
+        """
+        if not self.__active:
+            return
+        self.__axis_timer.stop()
+        if self.__streamer is not None:
+            # The last changes of the axes go with the rest
+            self.__stream()
+        if self.status == self.CONNECTED:
+            self.flush(timeout)
+        self.__active = False
+        self.__reconnect_timer.stop()
+        self.__close_sockets()
+        if self.__recorder is not None:
+            self.__recorder.close()
+        self.__set_status(self.DISCONNECTED)
+
+    def set_value(self, key, value):
+        self.set_values([key], [value])
+
+    def set_values(self, keys, values):
+        for key, value in zip(keys, values):
+            self.__protocol.set_value(key, value)
+        if self.__recorder is not None:
+            self.__recorder.command(dict(zip(keys, values)))
+        self.__pending = True
+        if self.__tick is None:
+            self.__send()
+        elif not self.__tick_timer.isActive():
+            self.__tick_timer.start(int(self.__tick * 1000))
+
+    def subscribe(self, keys, callback, dispatch=None) -> int:
+        """
+        Subscribes a callback to the changes of the state of the car, and of the STATUS of the connection.
+        Callbacks are called on the thread of the event loop, unless they give a dispatch.
+
+        :param keys: the keys to watch, None watches every key
+        :param callback: called with a dictionary of the changed keys, and their new values
+        :param dispatch: called with the callback, and its argument instead of calling the callback
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe(keys, callback, dispatch)
+
+    def subscribe_frames(self, callback) -> int:
+        """
+        Subscribes a callback to every telemetry frame, whether it changed anything or not
+
+        :param callback: called with the frames of each batch, and the time they were received at, by the clock
+                         of the latency monitor, on the thread of the event loop
+
+        :return: token for unsubscribe
+        """
+        return self.__subscriptions.subscribe_frames(callback)
+
+    def unsubscribe(self, token) -> None:
+        self.__subscriptions.unsubscribe(token)
+
+    def snapshot(self):
+        return self.__protocol.snapshot
+
+    def latency(self) -> dict:
+        return self.__protocol.latency.summary()
+
+    def telemetry_age(self, key):
+        return self.__protocol.latency.age(key)
+
+    def get_value(self, key):
+        return self.__protocol.snapshot[key]
+
+    def get_values(self, keys):
+        return self.__protocol.snapshot.get_values(keys)
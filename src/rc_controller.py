@@ -0,0 +1,338 @@
+"""
+Drives a car without any user interface, for scripts, automation, and continuous integration.
+| It imports no user interface toolkit, only channel, protocol, axes, keymap, and the standard library,
+| so it starts quickly, and runs anywhere Python does.
+
+.. note:: Usage
+    | python -m rc_controller connect
+    | python -m rc_controller send lights=true horn=false
+    | python -m rc_controller stream --keys speed distance --duration 10
+    | python -m rc_controller run maneuver.txt
+    | python -m rc_controller play drive.json
+
+.. note:: Scripts
+    | A script of run has one step per line, blank lines, and lines starting with # are skipped.
+    | KEY=VALUE ... (or set KEY=VALUE ...) sets the keys, the values are JSON, or else strings.
+    | wait SECONDS waits.
+    | until KEY OPERATOR VALUE [within SECONDS] waits for the telemetry to satisfy the condition,
+    | and fails the script, if it does not within SECONDS, which default to UNTIL_TIMEOUT.
+    | stop releases the drive keys, and centers the throttle, and the steering.
+    | They are released whenever the script ends, fails, or is interrupted too.
+
+.. note:: Macros
+    | play plays a macro recorded in a user interface, see the keymap module, through the same keymap,
+    | and with the throttle, and the steering ramped the same way, so a test drive can be repeated without a display.
+"""
+import json
+import operator
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from queue import Queue, Empty
+from time import monotonic, sleep, time
+from axes import DriveAxes
+from channel import Channel
+from keymap import Keymap, KeyDispatcher, Macro, MacroPlayer
+from protocol import Keys
+
+EXIT_FAILED = 1
+EXIT_TIMED_OUT = 3
+UNTIL_TIMEOUT = 10.0
+FLUSH_TIMEOUT = 2.0
+
+KEYS = {value for name, value in vars(Keys).items() if name.isupper()}
+DRIVE_KEYS = (Channel.FORWARD, Channel.BACKWARD, Channel.LEFT, Channel.RIGHT, Channel.HORN)
+STOPPED = dict([(key, False) for key in DRIVE_KEYS] + [(Channel.THROTTLE, 0.0), (Channel.STEERING, 0.0)])
+OPERATORS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq, '!=': operator.ne
+}
+
+
+class ScriptError(Exception):
+    """A step of a script that can not be parsed, or a condition that was not met in time"""
+
+    def __init__(self, line, message, exit_code=EXIT_FAILED):
+        super().__init__('line %d: %s' % (line, message))
+        self.exit_code = exit_code
+
+
+def parse_value(text):
+    """
+    :param text: the value as written on the command line, or in a script
+
+    :return: the value decoded as JSON, e.g. true, 12, or "text", or the text itself, if it is not JSON
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_assignments(assignments) -> dict:
+    """
+    :param assignments: KEY=VALUE strings
+
+    :return: the keys with their values
+
+    :raises ValueError: if an assignment is malformed, or its key is unknown
+    """
+    table = dict()
+    for assignment in assignments:
+        key, separator, value = assignment.partition('=')
+        if not separator or key not in KEYS:
+            raise ValueError('expected KEY=VALUE with KEY one of %s, got %r' % (', '.join(sorted(KEYS)), assignment))
+        table[key] = parse_value(value)
+    return table
+
+
+def emit(record, output=None) -> None:
+    """Writes a record as a line of JSON"""
+    output = output if output is not None else sys.stdout
+    output.write(json.dumps(record, sort_keys=True) + '\n')
+    output.flush()
+
+
+def connect(options, output=None):
+    """
+    :param options: the parsed command line
+    :param output: stream the failures are reported to, stdout if None
+
+    :return: a Channel to the car, None if it could not be reached, or the password was rejected, which is reported
+    """
+    try:
+        # Channel reports the handshake on stdout, which carries the JSON lines
+        with redirect_stdout(sys.stderr):
+            channel = Channel(options.host, options.port, options.password, binary=options.binary,
+                              reconnect=options.reconnect, axes=options.axes)
+    except OSError as error:
+        emit({'event': 'error', 'error': str(error)}, output)
+        return None
+    if not channel.granted:
+        emit({'event': 'rejected'}, output)
+        channel.deactivate()
+        return None
+    return channel
+
+
+def command_connect(channel, options, output) -> int:
+    emit({'event': 'connected', 'codec': channel.codec.NAME, 'status': channel.status}, output)
+    return 0
+
+
+def command_send(channel, options, output) -> int:
+    table = parse_assignments(options.assignments)
+    channel.set_values(list(table), list(table.values()))
+    if not channel.flush(options.timeout):
+        emit({'event': 'error', 'error': 'not sent within %g seconds' % options.timeout}, output)
+        return EXIT_FAILED
+    emit({'event': 'sent', 'values': table}, output)
+    return 0
+
+
+def command_stream(channel, options, output) -> int:
+    changes = Queue()
+    keys = options.keys or None
+    token = channel.subscribe(keys, changes.put)
+    try:
+        snapshot = channel.snapshot()
+        emit({'time': time(), 'values': dict(
+            (key, value) for key, value in snapshot.items() if keys is None or key in keys
+        )}, output)
+        deadline = monotonic() + options.duration if options.duration is not None else None
+        count = 0
+        while options.count is None or count < options.count:
+            remaining = deadline - monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                changed = changes.get(timeout=remaining)
+            except Empty:
+                break
+            emit({'time': time(), 'values': changed}, output)
+            count += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        channel.unsubscribe(token)
+    return 0
+
+
+def run_script(channel, lines, output=None) -> None:
+    """
+    Runs the steps of a script, as described at the top of the module, releasing the drive keys afterwards
+
+    :param channel: Channel of the car
+    :param lines: the lines of the script
+    :param output: stream the progress is reported to as JSON lines, stdout if None
+
+    :return: None
+
+    :raises ScriptError: if a step is malformed, or a condition is not met in time
+    """
+    try:
+        for number, line in enumerate(lines, 1):
+            words = line.split()
+            if not words or words[0].startswith('#'):
+                continue
+            step = words[0]
+            if step == 'wait':
+                if len(words) != 2:
+                    raise ScriptError(number, 'expected wait SECONDS')
+                sleep(float(words[1]))
+            elif step == 'until':
+                wait_until(channel, number, words[1:])
+            elif step == 'stop':
+                channel.set_values(list(STOPPED), list(STOPPED.values()))
+            else:
+                try:
+                    table = parse_assignments(words[1:] if step == 'set' else words)
+                except ValueError as error:
+                    raise ScriptError(number, str(error))
+                channel.set_values(list(table), list(table.values()))
+            emit({'event': 'step', 'line': number, 'step': line.strip()}, output)
+    finally:
+        channel.set_values(list(STOPPED), list(STOPPED.values()))
+        channel.flush(FLUSH_TIMEOUT)
+
+
+def wait_until(channel, number, words) -> None:
+    """
+    Waits for the telemetry to satisfy the condition of an until step
+
+    :param channel: Channel of the car
+    :param number: number of the line of the step
+    :param words: the words of the step after until
+
+    :return: None
+
+    :raises ScriptError: if the step is malformed, or the condition is not met in time
+    """
+    if len(words) not in (3, 5) or words[1] not in OPERATORS or (len(words) == 5 and words[3] != 'within'):
+        raise ScriptError(number, 'expected until KEY OPERATOR VALUE [within SECONDS]')
+    key, compare, expected = words[0], OPERATORS[words[1]], parse_value(words[2])
+    timeout = float(words[4]) if len(words) == 5 else UNTIL_TIMEOUT
+    satisfied = Queue()
+
+    def check(changes):
+        value = changes.get(key, channel.get_value(key))
+        try:
+            if compare(value, expected):
+                satisfied.put(True)
+        except TypeError:
+            # e.g. a distance of False, while the sensor sees nothing
+            pass
+
+    token = channel.subscribe([key], check)
+    try:
+        check(dict())
+        satisfied.get(timeout=timeout)
+    except Empty:
+        raise ScriptError(number, '%s was %r after %g seconds' % (key, channel.get_value(key), timeout),
+                          EXIT_TIMED_OUT)
+    finally:
+        channel.unsubscribe(token)
+
+
+def command_run(channel, options, output) -> int:
+    if options.script == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(options.script) as script:
+            lines = script.read().splitlines()
+    try:
+        run_script(channel, lines, output)
+    except ScriptError as error:
+        emit({'event': 'failed', 'error': str(error)}, output)
+        return error.exit_code
+    except KeyboardInterrupt:
+        emit({'event': 'interrupted'}, output)
+        return EXIT_FAILED
+    emit({'event': 'finished'}, output)
+    return 0
+
+
+def command_play(channel, options, output) -> int:
+    keymap = Keymap.load(options.keymap) if options.keymap else Keymap()
+    player = MacroPlayer(Macro.load(options.macro), KeyDispatcher(keymap, channel, options.axes), speed=options.speed)
+    try:
+        while not player.wait(0.1):
+            pass
+    except KeyboardInterrupt:
+        player.stop()
+        player.wait()
+        emit({'event': 'interrupted'}, output)
+        return EXIT_FAILED
+    finally:
+        options.axes.stop()
+        channel.set_values(list(STOPPED), list(STOPPED.values()))
+        channel.flush(FLUSH_TIMEOUT)
+    emit({'event': 'finished', 'events': len(player.lateness),
+          'max_lateness_ms': max(player.lateness, default=0.0) * 1000}, output)
+    return 0
+
+
+def parse_arguments(argv=None):
+    """
+    :param argv: the arguments, the ones of the process if None
+
+    :return: the parsed options
+    """
+    parser = ArgumentParser(prog='rc_controller', description='Drives an RC car from the command line')
+    parser.add_argument('--host', default='192.168.1.11', help='address of the controller')
+    parser.add_argument('--port', type=int, default=8000, help='port of the controller')
+    parser.add_argument('--password', default='69420')
+    parser.add_argument('--json', dest='binary', action='store_false', help='do not use the binary codec')
+    parser.add_argument('--no-reconnect', dest='reconnect', action='store_false',
+                        help='give up, instead of reconnecting, when the connection is lost')
+    parser.set_defaults(axes=None)
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    connect_parser = commands.add_parser('connect', help='connect, and report the negotiated session')
+    connect_parser.set_defaults(run=command_connect)
+
+    send_parser = commands.add_parser('send', help='set keys, e.g. lights=true, and wait until they are sent')
+    send_parser.add_argument('assignments', nargs='+', metavar='KEY=VALUE')
+    send_parser.add_argument('--timeout', type=float, default=FLUSH_TIMEOUT, help='seconds to wait for the send')
+    send_parser.set_defaults(run=command_send)
+
+    stream_parser = commands.add_parser('stream', help='print the telemetry as JSON lines')
+    stream_parser.add_argument('--keys', nargs='+', metavar='KEY', help='keys to print, every key if not given')
+    stream_parser.add_argument('--duration', type=float, default=None, help='seconds to stream for')
+    stream_parser.add_argument('--count', type=int, default=None, help='changes to stream')
+    stream_parser.set_defaults(run=command_stream)
+
+    run_parser = commands.add_parser('run', help='run a maneuver script, - reads it from stdin')
+    run_parser.add_argument('script')
+    run_parser.set_defaults(run=command_run)
+
+    play_parser = commands.add_parser('play', help='play a macro recorded in a user interface')
+    play_parser.add_argument('macro')
+    play_parser.add_argument('--keymap', metavar='PATH', help='keymap file the macro was recorded with')
+    play_parser.add_argument('--speed', type=float, default=1.0, help='how many times faster than recorded to play')
+    play_parser.set_defaults(run=command_play, axes=DriveAxes())
+    return parser.parse_args(argv)
+
+
+def main(argv=None, output=None) -> int:
+    """
+    :param argv: the arguments, the ones of the process if None
+    :param output: stream the JSON lines are written to, stdout if None
+
+    :return: the exit code
+    """
+    options = parse_arguments(argv)
+    channel = connect(options, output)
+    if channel is None:
+        return EXIT_FAILED
+    try:
+        return options.run(channel, options, output)
+    except ValueError as error:
+        emit({'event': 'error', 'error': str(error)}, output)
+        return EXIT_FAILED
+    finally:
+        channel.deactivate()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
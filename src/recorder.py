@@ -0,0 +1,369 @@
+from argparse import ArgumentParser
+from bisect import bisect_left
+from mmap import mmap
+from os import path as paths
+from socket import SHUT_RDWR
+from struct import Struct, error as StructError
+from threading import Thread, Lock, Condition, Event
+from time import perf_counter, monotonic, time
+from channel import Channel
+from codec import BinaryCodec
+from protocol import Protocol
+from transport import LoopbackTransport
+
+
+class FlightRecorder:
+    """
+    Append-only log of the telemetry, and the commands of a session, with the time of each.
+    | The log is written into memory mapped segments of SEGMENT_SIZE bytes, allocated up front, so recording
+    | a frame is encoding it, and copying it into memory, without any system call on the thread that records it.
+    | The pages are flushed by the system, so what was recorded survives the application crashing.
+    | The segments are the files <path>.000, <path>.001, and so on, trimmed to their content when closed.
+
+    .. note:: Layout
+        | Every segment starts with SEGMENT_HEADER: MAGIC, VERSION, the index of the segment,
+        | and the wall clock time the recording started at, followed by the records. A record is RECORD_HEADER:
+        | its kind, the seconds since the recording started, and the length of the frame, followed by the frame,
+        | encoded with BinaryCodec. A kind of 0 marks the end of the segment. Everything is little endian.
+
+    :var: SEGMENT_SIZE
+    :var: MAGIC
+    :var: VERSION
+    :var: TELEMETRY
+    :var: COMMAND
+    """
+
+    SEGMENT_SIZE = 4 * 1024 * 1024
+    MAGIC = b'RCFR'
+    VERSION = 1
+    SEGMENT_HEADER = Struct('<4sBHd')
+    RECORD_HEADER = Struct('<BdI')
+
+    END = 0
+    TELEMETRY = 1
+    COMMAND = 2
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE):
+        """
+        :param path: path of the log, the segments are named after it
+        :param segment_size: bytes allocated for each segment
+        """
+        self.path = path
+        self.__segment_size = segment_size
+        self.__lock = Lock()
+        self.__started = time()
+        self.__clock_start = perf_counter()
+        self.__index = -1
+        self.__file = None
+        self.__map = None
+        self.__position = 0
+        self.__open_segment(segment_size)
+
+    @staticmethod
+    def segment_path(path, index) -> str:
+        return '%s.%03d' % (path, index)
+
+    def __open_segment(self, size):
+        self.__close_segment()
+        self.__index += 1
+        self.__file = open(self.segment_path(self.path, self.__index), 'wb+')
+        self.__file.truncate(size)
+        self.__map = mmap(self.__file.fileno(), size)
+        self.SEGMENT_HEADER.pack_into(self.__map, 0, self.MAGIC, self.VERSION, self.__index, self.__started)
+        self.__position = self.SEGMENT_HEADER.size
+
+    def __close_segment(self):
+        if self.__map is None:
+            return
+        self.__map.flush()
+        self.__map.close()
+        self.__file.truncate(self.__position)
+        self.__file.close()
+        self.__map = None
+
+    def __record(self, kind, frame):
+        try:
+            data = BinaryCodec.encode(frame)
+        except (StructError, TypeError, ValueError):
+            # A frame that can not be encoded, e.g. with a value that is not JSON, is left out of the log
+            return
+        header = self.RECORD_HEADER
+        with self.__lock:
+            if self.__map is None:
+                return
+            # The end of the segment is marked by the zeros after the last record, or by its end
+            needed = header.size + len(data)
+            if self.__position + needed > len(self.__map):
+                self.__open_segment(max(self.__segment_size, self.SEGMENT_HEADER.size + needed))
+            header.pack_into(self.__map, self.__position, kind, perf_counter() - self.__clock_start, len(data))
+            start = self.__position + header.size
+            self.__map[start:start + len(data)] = data
+            self.__position = start + len(data)
+
+    def telemetry(self, frames) -> None:
+        """
+        :param frames: decoded telemetry frames, as applied to the tables
+
+        :return: None
+        """
+        for frame in frames:
+            self.__record(self.TELEMETRY, frame)
+
+    def command(self, table) -> None:
+        """
+        :param table: the keys set by the user, with their new values
+
+        :return: None
+        """
+        self.__record(self.COMMAND, table)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__close_segment()
+
+
+class FlightLog:
+    """
+    A log written by FlightRecorder, read into memory
+
+    .. attribute:: started
+        The wall clock time the recording started at
+
+    .. attribute:: records
+        List of the records, as the seconds since the start, the kind, and the frame, in the order of recording
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path the log was recorded with, or the path of its first segment
+
+        :raises ValueError: if a segment is not a flight log
+        """
+        if not paths.exists(FlightRecorder.segment_path(path, 0)) and path.endswith('.000'):
+            path = path[:-len('.000')]
+        self.started = None
+        self.records = []
+        index = 0
+        while paths.exists(FlightRecorder.segment_path(path, index)):
+            with open(FlightRecorder.segment_path(path, index), 'rb') as segment:
+                self.__read_segment(segment.read())
+            index += 1
+
+    def __read_segment(self, data):
+        segment_header = FlightRecorder.SEGMENT_HEADER
+        header = FlightRecorder.RECORD_HEADER
+        magic, version, _, started = segment_header.unpack_from(data, 0)
+        if magic != FlightRecorder.MAGIC or version != FlightRecorder.VERSION:
+            raise ValueError('not a flight log of version %d' % FlightRecorder.VERSION)
+        self.started = started if self.started is None else self.started
+
+        decoder = BinaryCodec.decoder()
+        position = segment_header.size
+        while position + header.size <= len(data):
+            kind, seconds, length = header.unpack_from(data, position)
+            if kind == FlightRecorder.END:
+                break
+            position += header.size
+            frames = decoder.feed(data[position:position + length])
+            position += length
+            if frames:
+                self.records.append((seconds, kind, frames[0]))
+
+    @property
+    def duration(self) -> float:
+        return self.records[-1][0] if self.records else 0.0
+
+
+class Replay:
+    """
+    Stands in for the car on a LoopbackTransport, and streams the telemetry of a FlightLog to the Channel
+    connected to it, with the timing it was recorded with, sped up by speed, or as fast as the Channel takes it.
+    | The password is not checked, and the commands of the user are read, and ignored.
+
+    .. attribute:: log
+        The FlightLog being replayed
+
+    .. attribute:: transport
+        The LoopbackTransport to connect the Channel to
+
+    .. attribute:: finished
+        Event set when the end of the log is reached
+    """
+
+    CAPABILITIES = '%s %s=64' % (BinaryCodec.NAME, Protocol.SEQUENCE_CAPABILITY)
+
+    def __init__(self, path, speed=1.0):
+        """
+        :param path: path of the log
+        :param speed: how many times faster than recorded to replay, None replays as fast as possible
+        """
+        self.log = FlightLog(path)
+        self.transport = LoopbackTransport()
+        self.finished = Event()
+        self.__telemetry = [
+            (seconds, frame) for seconds, kind, frame in self.log.records if kind == FlightRecorder.TELEMETRY
+        ]
+        self.__times = [seconds for seconds, _ in self.__telemetry]
+        self.__changed = Condition()
+        self.__speed = speed
+        self.__index = 0
+        self.__origin = (monotonic(), 0.0)
+        self.__connections = None
+        self.__stopped = False
+        self.__thread = Thread(target=self.__serve, daemon=True)
+        self.__thread.start()
+
+    @property
+    def position(self) -> float:
+        """
+        :return: the seconds since the start of the log, the replay is at
+        """
+        with self.__changed:
+            if self.__index >= len(self.__telemetry):
+                return self.log.duration
+            return self.__telemetry[self.__index][0]
+
+    @property
+    def speed(self):
+        return self.__speed
+
+    @speed.setter
+    def speed(self, speed):
+        with self.__changed:
+            self.__speed = speed
+            self.__restart_clock()
+
+    def seek(self, seconds) -> None:
+        """
+        Continues the replay from the given seconds since the start of the log
+
+        :param seconds: the position to continue from
+
+        :return: None
+        """
+        with self.__changed:
+            self.__index = bisect_left(self.__times, seconds)
+            self.finished.clear()
+            self.__restart_clock()
+
+    def __restart_clock(self):
+        position = self.__telemetry[self.__index][0] if self.__index < len(self.__telemetry) else self.log.duration
+        self.__origin = (monotonic(), position)
+        self.__changed.notify_all()
+
+    def connect(self, **options):
+        """
+        :param options: passed to Channel
+
+        :return: a Channel connected to the replay
+        """
+        return Channel(None, None, '', transport=self.transport, **options)
+
+    def __serve(self):
+        while not self.__stopped:
+            commands, telemetry = self.transport.accept()
+            if self.__stopped:
+                break
+            commands.recv(1024)
+            telemetry.sendall(('%s %s\n' % (Protocol.GRANTED, self.CAPABILITIES)).encode())
+            with self.__changed:
+                self.__connections = (commands, telemetry)
+                self.__restart_clock()
+            Thread(target=self.__drain, args=(commands, True), daemon=True).start()
+            Thread(target=self.__drain, args=(telemetry, False), daemon=True).start()
+            self.__stream(telemetry)
+
+    def __drain(self, connection, ends_session):
+        try:
+            while connection.recv(4096):
+                pass
+        except OSError:
+            pass
+        if ends_session:
+            # Like the firmware, which ends the session when the client closes its command connection
+            with self.__changed:
+                self.__close_connections()
+
+    def __close_connections(self):
+        """
+        :Assumptions:
+          * The condition is held by the caller
+        """
+        if self.__connections is None:
+            return
+        for connection in self.__connections:
+            try:
+                connection.shutdown(SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        self.__connections = None
+        self.__changed.notify_all()
+
+    def __stream(self, telemetry):
+        sequence = 0
+        while True:
+            with self.__changed:
+                while True:
+                    if self.__stopped or self.__connections is None:
+                        return
+                    if self.__index >= len(self.__telemetry):
+                        self.finished.set()
+                        self.__changed.wait()
+                        continue
+                    seconds, frame = self.__telemetry[self.__index]
+                    if self.__speed is None:
+                        break
+                    started, position = self.__origin
+                    delay = started + (seconds - position) / self.__speed - monotonic()
+                    if delay <= 0:
+                        break
+                    self.__changed.wait(delay)
+                self.__index += 1
+            sequence += 1
+            try:
+                telemetry.sendall(BinaryCodec.encode(dict(frame, **{Protocol.SEQUENCE_KEY: sequence})))
+            except OSError:
+                return
+
+    def stop(self) -> None:
+        with self.__changed:
+            self.__stopped = True
+            waiting = self.__connections is None
+            self.__close_connections()
+        if waiting:
+            # Wakes up the thread waiting for a Channel
+            for connection in self.transport.open():
+                connection.close()
+        self.__thread.join()
+
+
+def parse_arguments(argv=None):
+    """
+    Parses the options of the applications about recording, and replaying, leaving the rest, e.g. to Qt
+
+    :param argv: the arguments, the ones of the process if None
+
+    :return: the parsed options
+    """
+    parser = ArgumentParser(description='Controls an RC car, or replays a recorded session of one')
+    parser.add_argument('--record', metavar='PATH', help='record the session into a flight log')
+    parser.add_argument('--replay', metavar='PATH', help='replay a flight log, instead of connecting to a car')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed of the replay, 0 replays as fast as possible')
+    parser.add_argument('--seek', type=float, default=0.0, help='seconds into the log to start the replay at')
+    return parser.parse_known_args(argv)[0]
+
+
+def open_session(options) -> tuple:
+    """
+    :param options: options returned by parse_arguments
+
+    :return: the Channel of the replay, or None to connect to a car, and the FlightRecorder to connect with, if any
+    """
+    if options.replay:
+        replay = Replay(options.replay, options.speed or None)
+        replay.seek(options.seek)
+        return replay.connect(), None
+    if options.record:
+        return None, FlightRecorder(options.record)
+    return None, None
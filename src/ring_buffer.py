@@ -0,0 +1,96 @@
+from threading import Lock
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed size history of a value, with the time of each sample, kept in NumPy arrays allocated up front.
+    | Appending writes into the arrays in place, so the receiving thread can record hundreds of samples a second,
+    | without allocating, or ever growing. The oldest samples are overwritten, once the buffer is full.
+    | Readers get a chronological copy of the window they ask for, so they never see a sample being written.
+
+    .. attribute:: capacity
+        The number of samples kept
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: the number of samples to keep
+        """
+        self.capacity = capacity
+        self.__times = np.zeros(capacity)
+        self.__values = np.zeros(capacity)
+        self.__count = 0
+        self.__lock = Lock()
+
+    def __len__(self):
+        return min(self.__count, self.capacity)
+
+    def append(self, time, value) -> None:
+        """
+        :param time: time of the sample, in seconds, not earlier than the previous one
+        :param value: the value, NaN for no value, which leaves a gap in a plot
+        """
+        with self.__lock:
+            index = self.__count % self.capacity
+            self.__times[index] = time
+            self.__values[index] = value
+            self.__count += 1
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__count = 0
+
+    def window(self, start) -> tuple:
+        """
+        :param start: time of the first sample needed, in seconds
+
+        :return: the times, and the values of the samples from start on, in chronological order,
+                 with the last sample before start first, if there is one, as the value the window starts with
+        """
+        with self.__lock:
+            if self.__count <= self.capacity:
+                times = self.__times[:self.__count].copy()
+                values = self.__values[:self.__count].copy()
+            else:
+                oldest = self.__count % self.capacity
+                times = np.concatenate((self.__times[oldest:], self.__times[:oldest]))
+                values = np.concatenate((self.__values[oldest:], self.__values[:oldest]))
+        first = max(0, int(np.searchsorted(times, start)) - 1)
+        return times[first:], values[first:]
+
+
+def decimate(times, values, start, end, columns) -> tuple:
+    """
+    Reduces samples to the lowest, and the highest value within each of equally wide columns of time,
+    e.g. one per pixel of a plot, so drawing them costs the same at any sample rate.
+    | Each column spans from the value it starts with, the one of the last sample before it, so steps are drawn
+    | connected, and columns without a sample hold that value. NaN samples are left out of the columns,
+    | and columns before the first sample are NaN.
+
+    :param times: times of the samples, in chronological order
+    :param values: values of the samples
+    :param start: time the first column starts at
+    :param end: time the last column ends at
+    :param columns: the number of columns
+
+    :return: the lowest, and the highest values of the columns, as two arrays of length columns
+    """
+    edges = np.linspace(start, end, columns + 1)
+    bounds = np.searchsorted(times, edges)
+    first, last = bounds[:-1], bounds[1:]
+    entering = np.full(columns, np.nan)
+    before = first > 0
+    entering[before] = values[first[before] - 1]
+    low, high = entering.copy(), entering.copy()
+
+    filled = last > first
+    if filled.any():
+        # Samples past the last column, and before the first one are cut off, so each filled column is reduced
+        # from its first sample to the first sample of the next filled column, which is where it ends
+        offset = first[filled][0]
+        inside = values[offset:last[filled][-1]]
+        starts = first[filled] - offset
+        low[filled] = np.fmin(low[filled], np.fmin.reduceat(inside, starts))
+        high[filled] = np.fmax(high[filled], np.fmax.reduceat(inside, starts))
+    return low, high
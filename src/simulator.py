@@ -0,0 +1,637 @@
+from argparse import ArgumentParser
+from collections import deque
+from hashlib import sha256
+from math import atan2, cos, hypot, pi, sin, sqrt
+from queue import Empty
+from random import Random
+from secrets import token_hex
+from socket import socket, timeout, AF_INET, SOCK_STREAM, SOCK_DGRAM, SHUT_RDWR
+from threading import Thread, Lock, Event
+from time import monotonic
+from codec import JsonCodec, BinaryCodec
+from latency import LatencyMonitor
+from protocol import Keys, Protocol
+from transport import LoopbackTransport
+
+
+class CarModel(Keys):
+    """
+    Kinematic model of the car, driving in a square arena with round obstacles, and a circular line track.
+    | The car starts on the line, facing along it. Its distance sensor looks straight ahead, and sees the obstacles,
+    | and the walls of the arena up to SENSOR_RANGE. Distances are in centimeters, speeds in centimeters per second.
+    | With distance keeping on, the car does not drive closer to what is ahead than KEEP_DISTANCE, with line following
+    | on, it steers itself along the line, and it never drives into anything. The THROTTLE, and the STEERING
+    | drive it proportionally, once the client has sent them, the drive keys drive it at full throttle, and steering
+    | before that, like older firmware.
+
+    .. attribute:: x
+        Position of the car
+
+    .. attribute:: y
+        Position of the car
+
+    .. attribute:: heading
+        Direction of the car in radians, counterclockwise from the x axis
+
+    .. attribute:: speed
+        Signed speed of the car, negative when it goes backwards
+
+    .. attribute:: obstacles
+        List of the obstacles, as x, y, and radius
+
+    :var: MAX_SPEED
+    :var: ACCELERATION
+    :var: DECELERATION
+    :var: TURN_RATE
+    :var: SENSOR_RANGE
+    :var: KEEP_DISTANCE
+    :var: ARENA_SIZE
+    :var: TRACK_RADIUS
+    :var: LINE_WIDTH
+    :var: OBSTACLES
+    """
+
+    MAX_SPEED = 40.0
+    ACCELERATION = 60.0
+    DECELERATION = 120.0
+    TURN_RATE = 2.0
+    SENSOR_RANGE = 300.0
+    KEEP_DISTANCE = 25.0
+    ARENA_SIZE = 400.0
+    TRACK_RADIUS = 150.0
+    LINE_WIDTH = 4.0
+    OBSTACLES = 6
+
+    def __init__(self, seed=None, obstacles=None):
+        """
+        :param seed: seed of the placement of the obstacles, so runs can be repeated
+        :param obstacles: list of the obstacles, as x, y, and radius, placed randomly if None
+        """
+        self.x = self.TRACK_RADIUS
+        self.y = 0.0
+        self.heading = pi / 2
+        self.speed = 0.0
+        if obstacles is None:
+            random = Random(seed)
+            obstacles = []
+            while len(obstacles) < self.OBSTACLES:
+                radius = random.uniform(10, 25)
+                x = random.uniform(radius - self.ARENA_SIZE / 2, self.ARENA_SIZE / 2 - radius)
+                y = random.uniform(radius - self.ARENA_SIZE / 2, self.ARENA_SIZE / 2 - radius)
+                # Nothing is placed onto the car at the start
+                if hypot(x - self.x, y - self.y) > radius + self.KEEP_DISTANCE * 2:
+                    obstacles.append((x, y, radius))
+        self.obstacles = obstacles
+
+    def distance(self) -> float:
+        """
+        :return: distance to the nearest obstacle, or wall straight ahead, at most SENSOR_RANGE
+        """
+        direction_x, direction_y = cos(self.heading), sin(self.heading)
+        nearest = self.SENSOR_RANGE
+        half = self.ARENA_SIZE / 2
+        for position, direction in ((self.x, direction_x), (self.y, direction_y)):
+            if direction > 1e-9:
+                nearest = min(nearest, (half - position) / direction)
+            elif direction < -1e-9:
+                nearest = min(nearest, (-half - position) / direction)
+        for x, y, radius in self.obstacles:
+            along = (x - self.x) * direction_x + (y - self.y) * direction_y
+            across = (x - self.x) * direction_y - (y - self.y) * direction_x
+            if along > 0 and abs(across) < radius:
+                nearest = min(nearest, along - sqrt(radius * radius - across * across))
+        return max(0.0, nearest)
+
+    def on_line(self) -> bool:
+        return abs(hypot(self.x, self.y) - self.TRACK_RADIUS) < self.LINE_WIDTH / 2
+
+    def __blocked(self, x, y) -> bool:
+        half = self.ARENA_SIZE / 2
+        if not (-half < x < half and -half < y < half):
+            return True
+        return any(hypot(x - obstacle_x, y - obstacle_y) < radius for obstacle_x, obstacle_y, radius in self.obstacles)
+
+    def step(self, commands, dt) -> None:
+        """
+        Moves the car according to the commands
+
+        :param commands: the message table received from the client
+        :param dt: seconds passed since the last step
+
+        :return: None
+        """
+        if self.THROTTLE in commands:
+            throttle = max(-1.0, min(1.0, float(commands[self.THROTTLE])))
+        else:
+            throttle = int(bool(commands.get(self.FORWARD))) - int(bool(commands.get(self.BACKWARD)))
+        if commands.get(self.REVERSE):
+            throttle = -throttle
+        if self.STEERING in commands:
+            steering = max(-1.0, min(1.0, float(commands[self.STEERING])))
+        else:
+            steering = int(bool(commands.get(self.LEFT))) - int(bool(commands.get(self.RIGHT)))
+
+        if commands.get(self.LINE_FOLLOWING):
+            tangent = atan2(self.y, self.x) + pi / 2
+            error = (tangent - self.heading + pi) % (2 * pi) - pi
+            outside = hypot(self.x, self.y) - self.TRACK_RADIUS
+            # The curvature of the track, plus corrections for the heading, and for the side of the line
+            curvature = self.MAX_SPEED / (self.TRACK_RADIUS * self.TURN_RATE)
+            steering = max(-1.0, min(1.0, curvature + 2 * error + 0.05 * outside))
+
+        distance = self.distance()
+        target = throttle * self.MAX_SPEED
+        if commands.get(self.DISTANCE_KEEPING) and target > 0:
+            # Slow enough to stop at KEEP_DISTANCE
+            target = min(target, sqrt(2 * self.DECELERATION * max(0.0, distance - self.KEEP_DISTANCE)))
+
+        rate = self.ACCELERATION if abs(target) > abs(self.speed) else self.DECELERATION
+        change = max(-rate * dt, min(rate * dt, target - self.speed))
+        self.speed += change
+        self.heading = (self.heading + steering * self.TURN_RATE * dt * self.speed / self.MAX_SPEED) % (2 * pi)
+
+        x = self.x + self.speed * dt * cos(self.heading)
+        y = self.y + self.speed * dt * sin(self.heading)
+        if self.__blocked(x, y) or (self.speed > 0 and self.speed * dt >= distance):
+            self.speed = 0.0
+        else:
+            self.x, self.y = x, y
+
+    def telemetry(self) -> dict:
+        return {
+            self.DISTANCE: round(self.distance(), 2),
+            self.SPEED: round(abs(self.speed), 2),
+            self.LINE: self.on_line(),
+        }
+
+
+class DelayLine:
+    """
+    Delays items by a latency, and a random jitter, keeping their order, like a stream over a slow link
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, random=None):
+        """
+        :param latency: seconds to delay the items by on average
+        :param jitter: seconds the delay varies by in either direction, uniformly
+        :param random: Random instance to draw the jitter from
+        """
+        self.__latency = latency
+        self.__jitter = jitter
+        self.__random = random if random is not None else Random()
+        self.__items = deque()
+        self.__last = 0.0
+
+    def put(self, item, now) -> None:
+        delay = self.__latency + (self.__random.uniform(-self.__jitter, self.__jitter) if self.__jitter else 0.0)
+        self.__last = max(self.__last, now + max(0.0, delay))
+        self.__items.append((self.__last, item))
+
+    def pop_due(self, now) -> list:
+        due = []
+        while self.__items and self.__items[0][0] <= now:
+            due.append(self.__items.popleft()[1])
+        return due
+
+    def next_due(self):
+        """
+        :return: the time the next item is due at, None if there is none
+        """
+        return self.__items[0][0] if self.__items else None
+
+
+class Session:
+    """
+    One accepted client of a CarServer, from the end of the handshake until either side closes the connections.
+    | Command frames are read on a thread of their own, and so are the acknowledgements of the telemetry.
+    | Everything else is done by the loop of the CarServer, under its lock.
+
+    .. attribute:: active
+        Whether the connections are still usable
+    """
+
+    def __init__(self, server, commands, telemetry, chosen, initial_data=b''):
+        """
+        :param server: the CarServer the session belongs to
+        :param commands: the command connection
+        :param telemetry: the telemetry connection
+        :param chosen: the words of the USE line, None for a legacy client
+        :param initial_data: bytes of the command stream received along with the USE line
+        """
+        self.__server = server
+        self.__commands = commands
+        self.__telemetry = telemetry
+        chosen = chosen if chosen is not None else []
+        self.__codec = BinaryCodec if BinaryCodec.NAME in chosen else JsonCodec
+        self.__sequenced = Protocol.SEQUENCE_CAPABILITY in chosen
+        self.__timed = self.__sequenced and Protocol.TIME_CAPABILITY in chosen
+        self.__window = server.window if self.__sequenced else 1
+        self.__sequence = 0
+        self.__in_flight = deque()
+        self.__echo = None
+        self.__applied = None
+        self.__outgoing = DelayLine(server.latency, server.jitter, server.random)
+        self.__incoming = DelayLine(server.latency, server.jitter, server.random)
+        self.active = True
+
+        Thread(target=self.__read_commands, args=(initial_data,), daemon=True).start()
+        Thread(target=self.__read_acknowledgements, daemon=True).start()
+
+    def __read_commands(self, data):
+        decoder = self.__codec.decoder()
+        try:
+            while True:
+                frames = decoder.feed(data)
+                with self.__server.lock:
+                    for frame in frames:
+                        self.__incoming.put(frame, monotonic())
+                data = self.__commands.recv(4096)
+                if not data:
+                    break
+        except OSError:
+            pass
+        self.close()
+
+    def __read_acknowledgements(self):
+        pending = b''
+        try:
+            data = self.__telemetry.recv(1024)
+            while data:
+                pending += data
+                with self.__server.lock:
+                    pending = self.__acknowledge(pending, monotonic())
+                data = self.__telemetry.recv(1024)
+        except OSError:
+            pass
+        self.close()
+
+    def __acknowledge(self, pending, now) -> bytes:
+        """
+        :return: the incomplete part of the acknowledgements
+        """
+        if not self.__sequenced:
+            count = pending.count(Protocol.ACKNOWLEDGEMENT)
+            for _ in range(min(count, len(self.__in_flight))):
+                self.__in_flight.popleft()
+            return pending[pending.rfind(Protocol.ACKNOWLEDGEMENT) + len(Protocol.ACKNOWLEDGEMENT):] if count else pending
+
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            words = line.split()
+            if len(words) < 2 or words[0] != b'ACK':
+                continue
+            sequence = int(words[1])
+            while self.__in_flight and self.__in_flight[0] <= sequence:
+                self.__in_flight.popleft()
+            if len(words) > 2:
+                self.__echo = (float(words[2]), now)
+        return pending
+
+    def due_commands(self, now) -> list:
+        """
+        :return: the command frames that have made it through the injected latency, without their timestamps
+        """
+        frames = self.__incoming.pop_due(now)
+        for frame in frames:
+            stamp = frame.pop(LatencyMonitor.TIMESTAMP_KEY, None)
+            if stamp is not None:
+                self.__applied = stamp
+        return frames
+
+    def emit(self, telemetry, now) -> None:
+        """
+        Queues a telemetry frame, unless the window of the client is full, or the frame is lost on the way
+
+        :param telemetry: the telemetry of the car
+        :param now: the current time
+
+        :return: None
+        """
+        if len(self.__in_flight) >= self.__window:
+            return
+        frame = dict(telemetry)
+        if self.__sequenced:
+            self.__sequence += 1
+            frame[Protocol.SEQUENCE_KEY] = self.__sequence
+        if self.__timed:
+            frame[LatencyMonitor.TIMESTAMP_KEY] = now
+            if self.__echo is not None:
+                frame[LatencyMonitor.ECHO_KEY], frame[LatencyMonitor.RECEIVED_KEY] = self.__echo
+            if self.__applied is not None:
+                frame[LatencyMonitor.APPLIED_KEY] = self.__applied
+        if self.__server.random.random() < self.__server.loss:
+            # The sequence number is used up, so the client sees the gap
+            return
+        self.__in_flight.append(self.__sequence)
+        self.__outgoing.put(self.__codec.encode(frame), now)
+
+    def send_due(self, now) -> None:
+        data = b''.join(self.__outgoing.pop_due(now))
+        if not data:
+            return
+        try:
+            self.__telemetry.sendall(data)
+        except OSError:
+            self.close()
+
+    def next_due(self):
+        """
+        :return: the time the next delayed frame is due at in either direction, None if there is none
+        """
+        due = [time for time in (self.__outgoing.next_due(), self.__incoming.next_due()) if time is not None]
+        return min(due) if due else None
+
+    def close(self) -> None:
+        self.active = False
+        for connection in (self.__commands, self.__telemetry):
+            try:
+                connection.shutdown(SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+
+
+class CarServer:
+    """
+    Simulated controller of one car, serving one client at a time, with the same handshake, and capabilities
+    as the firmware, see Protocol. A new client replaces the current one, like a reconnecting Channel does.
+    | The model is stepped RATE times a second, whether a client is connected, or not, and the client gets
+    | a telemetry frame on every step, delayed by the latency, and the jitter, and lost with the given probability.
+    | Command frames, and datagrams of the drive lane are delayed, and lost the same way.
+
+    .. attribute:: model
+        The CarModel of the car
+
+    .. attribute:: commands
+        The message table received from the client
+
+    .. attribute:: lock
+        Lock guarding the model, the commands, and the sessions
+
+    .. attribute:: port
+        The port the car listens on, None on a LoopbackTransport
+
+    :var: RATE
+    :var: WINDOW
+    :var: POLL
+    :var: HANDSHAKE_TIMEOUT
+    """
+
+    RATE = 20.0
+    WINDOW = 8
+    POLL = 0.1
+    HANDSHAKE_TIMEOUT = 2.0
+
+    def __init__(self, listener, password, model=None, rate=RATE, latency=0.0, jitter=0.0, loss=0.0,
+                 legacy=False, window=WINDOW, udp=True, seed=None):
+        """
+        :param listener: listening socket, or LoopbackTransport to accept the clients on
+        :param password: password of the car
+        :param model: CarModel to drive, a new one if None
+        :param rate: telemetry frames per second
+        :param latency: seconds to delay the frames by in both directions
+        :param jitter: seconds the delay varies by
+        :param loss: probability of losing a telemetry frame, or a datagram
+        :param legacy: whether to answer like older firmware, with a bare GRANTED
+        :param window: the number of telemetry frames in flight offered to the clients
+        :param udp: whether to offer a drive lane, if the listener is a TCP socket
+        :param seed: seed of the randomness, so runs can be repeated
+        """
+        self.model = model if model is not None else CarModel(seed)
+        self.commands = dict()
+        self.lock = Lock()
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.window = window
+        self.random = Random(seed)
+        self.__listener = listener
+        self.__digest = sha256(password.encode()).digest()
+        self.__legacy = legacy
+        self.__token = token_hex(4)
+        self.__session = None
+        self.__stopped = Event()
+        self.__drive_socket = None
+        self.__drive_sequence = None
+        self.__drive = DelayLine(latency, jitter, self.random)
+        self.port = None if isinstance(listener, LoopbackTransport) else listener.getsockname()[1]
+
+        if udp and not legacy and not isinstance(listener, LoopbackTransport):
+            self.__drive_socket = socket(AF_INET, SOCK_DGRAM)
+            self.__drive_socket.bind((listener.getsockname()[0], 0))
+            self.__drive_socket.settimeout(self.POLL)
+        if not isinstance(listener, LoopbackTransport):
+            listener.settimeout(self.POLL)
+
+        self.threads = [Thread(target=self.__accept_clients, daemon=True), Thread(target=self.__run, daemon=True)]
+        if self.__drive_socket is not None:
+            self.threads.append(Thread(target=self.__receive_drive, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def capabilities(self) -> str:
+        if self.__legacy:
+            return ''
+        capabilities = [
+            BinaryCodec.NAME, Protocol.DELTA_CAPABILITY, '%s=%d' % (Protocol.SEQUENCE_CAPABILITY, self.window),
+            Protocol.TIME_CAPABILITY, '%s=%s' % (Protocol.TOKEN_CAPABILITY, self.__token)
+        ]
+        if self.__drive_socket is not None:
+            capabilities.append('%s=%d' % (Protocol.UDP_CAPABILITY, self.__drive_socket.getsockname()[1]))
+        return ' '.join(capabilities)
+
+    def __accept(self):
+        """
+        :return: the command, and the telemetry connection of the next client, None if the server is stopped
+        """
+        if isinstance(self.__listener, LoopbackTransport):
+            while not self.__stopped.is_set():
+                try:
+                    return self.__listener.accept(self.POLL)
+                except Empty:
+                    pass
+            return None
+
+        connections = []
+        while len(connections) < 2:
+            if self.__stopped.is_set():
+                for connection in connections:
+                    connection.close()
+                return None
+            try:
+                connections.append(self.__listener.accept()[0])
+            except timeout:
+                pass
+        return tuple(connections)
+
+    def __accept_clients(self):
+        while True:
+            connections = self.__accept()
+            if connections is None:
+                break
+            try:
+                self.__handshake(*connections)
+            except (OSError, ValueError):
+                for connection in connections:
+                    connection.close()
+
+    def __handshake(self, commands, telemetry):
+        commands.settimeout(self.HANDSHAKE_TIMEOUT)
+        credentials = commands.recv(1024)
+        resumption = b'RESUME %s\n' % self.__token.encode()
+        if credentials not in (self.__digest, resumption) or (self.__legacy and credentials == resumption):
+            telemetry.sendall(b'REJECTED')
+            raise ValueError('rejected')
+
+        capabilities = self.capabilities()
+        chosen = None
+        data = b''
+        if capabilities:
+            telemetry.sendall(('%s %s\n' % (Protocol.GRANTED, capabilities)).encode())
+            while b'\n' not in data:
+                received = commands.recv(1024)
+                if not received:
+                    raise ValueError('closed during the handshake')
+                data += received
+            line, data = data.split(b'\n', 1)
+            chosen = line.decode().split()[1:]
+        else:
+            telemetry.sendall(Protocol.GRANTED.encode())
+        commands.settimeout(None)
+
+        with self.lock:
+            if self.__session is not None:
+                self.__session.close()
+            self.__session = Session(self, commands, telemetry, chosen, data)
+
+    def __receive_drive(self):
+        datagram = Protocol.DRIVE_DATAGRAM
+        while not self.__stopped.is_set():
+            try:
+                data = self.__drive_socket.recv(64)
+            except timeout:
+                continue
+            except OSError:
+                break
+            if len(data) != datagram.size or self.random.random() < self.loss:
+                continue
+            with self.lock:
+                self.__drive.put(datagram.unpack(data), monotonic())
+
+    def __apply_drive(self, now):
+        for sequence, bits in self.__drive.pop_due(now):
+            if self.__drive_sequence is not None and sequence <= self.__drive_sequence:
+                continue
+            self.__drive_sequence = sequence
+            for key, bit in Protocol.DRIVE_BITS.items():
+                self.commands[key] = bool(bits & bit)
+
+    def __run(self):
+        period = 1 / self.rate
+        last = next_step = monotonic()
+        while not self.__stopped.is_set():
+            now = monotonic()
+            with self.lock:
+                session = self.__session
+                if session is not None and not session.active:
+                    # The last commands of a client count, even if it disconnected before they were due
+                    for frame in session.due_commands(float('inf')):
+                        self.commands.update(frame)
+                    session = self.__session = None
+                    self.__drive_sequence = None
+                if session is not None:
+                    for frame in session.due_commands(now):
+                        self.commands.update(frame)
+                self.__apply_drive(now)
+
+                if now >= next_step:
+                    self.model.step(self.commands, now - last)
+                    last = now
+                    next_step = max(next_step + period, now)
+                    if session is not None:
+                        session.emit(self.model.telemetry(), now)
+                if session is not None:
+                    session.send_due(now)
+                due = [time for time in (session and session.next_due(), self.__drive.next_due()) if time]
+            self.__stopped.wait(max(0.0, min(due + [next_step]) - monotonic()))
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        for thread in self.threads:
+            thread.join()
+        with self.lock:
+            if self.__session is not None:
+                self.__session.close()
+        if self.__drive_socket is not None:
+            self.__drive_socket.close()
+        if not isinstance(self.__listener, LoopbackTransport):
+            self.__listener.close()
+
+
+class Simulator:
+    """
+    Serves any number of simulated cars, the i-th one on port + i, like the connect dialogs address them
+
+    .. attribute:: cars
+        The CarServer of each car
+    """
+
+    def __init__(self, cars=1, host='127.0.0.1', port=8000, password='69420', **options):
+        """
+        :param cars: the number of cars
+        :param host: address to listen on
+        :param port: port of the first car, 0 picks a free port for every car
+        :param password: password of the cars
+        :param options: passed to every CarServer, seeds are offset by the index of the car
+        """
+        self.cars = []
+        seed = options.pop('seed', None)
+        for index in range(cars):
+            listener = socket(AF_INET, SOCK_STREAM)
+            listener.bind((host, port + index if port else 0))
+            listener.listen(8)
+            self.cars.append(CarServer(listener, password, seed=None if seed is None else seed + index, **options))
+
+    def ports(self) -> list:
+        return [car.port for car in self.cars]
+
+    def stop(self) -> None:
+        for car in self.cars:
+            car.stop()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Simulates RC cars, speaking the protocol of their controller')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port of the first car, the others follow it')
+    parser.add_argument('--cars', type=int, default=1, help='number of cars to simulate')
+    parser.add_argument('--password', default='69420')
+    parser.add_argument('--rate', type=float, default=CarServer.RATE, help='telemetry frames per second')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of delay in both directions')
+    parser.add_argument('--jitter', type=float, default=0.0, help='seconds the delay varies by')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability of losing a frame, or a datagram')
+    parser.add_argument('--window', type=int, default=CarServer.WINDOW, help='telemetry frames in flight')
+    parser.add_argument('--legacy', action='store_true', help='answer like older firmware, without capabilities')
+    parser.add_argument('--no-udp', dest='udp', action='store_false', help='do not offer a drive lane')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the randomness, for repeatable runs')
+    arguments = parser.parse_args(argv)
+
+    simulator = Simulator(
+        arguments.cars, arguments.host, arguments.port, arguments.password, rate=arguments.rate,
+        latency=arguments.latency, jitter=arguments.jitter, loss=arguments.loss, window=arguments.window,
+        legacy=arguments.legacy, udp=arguments.udp, seed=arguments.seed
+    )
+    print('Simulating %d car(s) on %s:%d-%d' % (
+        arguments.cars, arguments.host, arguments.port, arguments.port + arguments.cars - 1
+    ))
+    try:
+        Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+from threading import Lock
+
+
+class Subscriptions:
+    """
+    Registry of the callbacks interested in changes of the state of the car.
+    | Callbacks are called with a dictionary of the changed keys, and their new values, and only if any of the keys
+    | they subscribed to has actually changed. The registry is replaced as a whole on every change,
+    | so notifying needs no lock.
+    | Callbacks subscribed to the frames are called with every batch of telemetry frames instead, changed or not,
+    | e.g. to sample a key at the rate the controller sends it.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__entries = dict()
+        self.__frame_entries = dict()
+        self.__next_token = 0
+
+    def subscribe(self, keys, callback, dispatch=None) -> int:
+        """
+        Subscribes a callback to the changes of some keys
+
+        :param keys: the keys to watch, None watches every key
+        :param callback: called with a dictionary of the changed keys, and their new values
+        :param dispatch: called with the callback, and its argument instead of calling the callback directly,
+                         so it can be handed to another thread, e.g. the main loop of the UI
+
+        :return: token for unsubscribe
+        """
+        with self.__lock:
+            token = self.__next_token
+            self.__next_token += 1
+            entries = dict(self.__entries)
+            entries[token] = (frozenset(keys) if keys is not None else None, callback, dispatch)
+            self.__entries = entries
+        return token
+
+    def subscribe_frames(self, callback) -> int:
+        """
+        Subscribes a callback to every telemetry frame, on the thread receiving them
+
+        :param callback: called with the frames of each batch, and the time they were received at
+
+        :return: token for unsubscribe
+        """
+        with self.__lock:
+            token = self.__next_token
+            self.__next_token += 1
+            frame_entries = dict(self.__frame_entries)
+            frame_entries[token] = callback
+            self.__frame_entries = frame_entries
+        return token
+
+    def unsubscribe(self, token) -> None:
+        with self.__lock:
+            entries = dict(self.__entries)
+            entries.pop(token, None)
+            self.__entries = entries
+            frame_entries = dict(self.__frame_entries)
+            frame_entries.pop(token, None)
+            self.__frame_entries = frame_entries
+
+    @staticmethod
+    def diff(old, new) -> dict:
+        """
+        :param old: the previous TelemetrySnapshot
+        :param new: the current TelemetrySnapshot
+
+        :return: the keys that differ between the snapshots, with their new values
+        """
+        changes = {key: value for key, value in new.items() if old[key] != value}
+        for key, value in old.items():
+            if key not in new and value is not False:
+                changes[key] = False
+        return changes
+
+    def notify(self, changes) -> None:
+        """
+        Calls the callbacks interested in some of the changes
+
+        :param changes: dictionary of the changed keys, and their new values
+
+        :return: None
+        """
+        if not changes:
+            return
+        for keys, callback, dispatch in self.__entries.values():
+            if keys is None:
+                relevant = changes
+            else:
+                relevant = {key: value for key, value in changes.items() if key in keys}
+            if not relevant:
+                continue
+            if dispatch is None:
+                callback(relevant)
+            else:
+                dispatch(callback, relevant)
+
+    def notify_frames(self, frames, received) -> None:
+        """
+        :param frames: the telemetry frames of a batch, as returned by Protocol.decode
+        :param received: the time the frames were received at, see Protocol.received
+
+        :return: None
+        """
+        for callback in self.__frame_entries.values():
+            callback(frames, received)
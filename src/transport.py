@@ -0,0 +1,196 @@
+import socket as sockets
+from socket import socket, socketpair, AF_INET, SOCK_STREAM, SOCK_DGRAM, SOL_SOCKET, IPPROTO_TCP
+from queue import Queue
+
+
+def tune(connection, buffer_size) -> None:
+    """
+    Sizes the kernel buffers of a connection
+
+    :param connection: the socket to tune
+    :param buffer_size: bytes of the send, and of the receive buffer, None leaves the defaults
+
+    :return: None
+    """
+    if buffer_size is not None:
+        connection.setsockopt(SOL_SOCKET, sockets.SO_SNDBUF, buffer_size)
+        connection.setsockopt(SOL_SOCKET, sockets.SO_RCVBUF, buffer_size)
+
+
+class TcpTransport:
+    """
+    Opens the connections to the controller over TCP, tuned for small, latency sensitive frames.
+    | Nagle's algorithm is disabled, so a command frame is sent right away, instead of waiting for the
+    | acknowledgement of the previous one. Keepalive probes detect a dead link within about
+    | KEEPALIVE_IDLE + KEEPALIVE_INTERVAL * KEEPALIVE_COUNT seconds, even while nothing is being sent.
+    | The protocol pairs a command, and a telemetry connection in the order they are accepted,
+    | so the two can not be multiplexed onto one, until the firmware supports it.
+
+    .. attribute:: datagrams
+        Whether the transport can carry the drive lane
+
+    :var: CONNECT_TIMEOUT
+    :var: BUFFER_SIZE
+    :var: KEEPALIVE_IDLE
+    :var: KEEPALIVE_INTERVAL
+    :var: KEEPALIVE_COUNT
+    """
+
+    CONNECT_TIMEOUT = 5.0
+    BUFFER_SIZE = 64 * 1024
+    KEEPALIVE_IDLE = 2
+    KEEPALIVE_INTERVAL = 1
+    KEEPALIVE_COUNT = 3
+
+    datagrams = True
+
+    def __init__(self, host, port, connect_timeout=CONNECT_TIMEOUT, read_timeout=None, buffer_size=BUFFER_SIZE):
+        """
+        :param host: IP address of the controller
+        :param port: port of the controller
+        :param connect_timeout: seconds to wait for a connection, None waits as long as the system does
+        :param read_timeout: seconds of silence after which the connection is considered lost, None never
+        :param buffer_size: bytes of the kernel buffers of the connections, None leaves the defaults
+        """
+        self.host = host
+        self.port = int(port)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.buffer_size = buffer_size
+
+    def connect(self) -> socket:
+        """
+        :return: a new, tuned connection to the controller
+        """
+        connection = socket(AF_INET, SOCK_STREAM)
+        try:
+            connection.setsockopt(IPPROTO_TCP, sockets.TCP_NODELAY, 1)
+            connection.setsockopt(SOL_SOCKET, sockets.SO_KEEPALIVE, 1)
+            for option, value in (
+                ('TCP_KEEPIDLE', self.KEEPALIVE_IDLE),
+                ('TCP_KEEPINTVL', self.KEEPALIVE_INTERVAL),
+                ('TCP_KEEPCNT', self.KEEPALIVE_COUNT),
+            ):
+                if hasattr(sockets, option):
+                    connection.setsockopt(IPPROTO_TCP, getattr(sockets, option), value)
+            tune(connection, self.buffer_size)
+            connection.settimeout(self.connect_timeout)
+            connection.connect((self.host, self.port))
+            connection.settimeout(self.read_timeout)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+
+    def open(self) -> tuple:
+        """
+        :return: the command, and the telemetry connection, in the order the controller expects them
+        """
+        sending = self.connect()
+        try:
+            return sending, self.connect()
+        except OSError:
+            sending.close()
+            raise
+
+    def datagram(self, port):
+        """
+        :param port: the port of the drive lane on the controller
+
+        :return: a socket connected to the drive lane
+        """
+        connection = socket(AF_INET, SOCK_DGRAM)
+        connection.connect((self.host, port))
+        return connection
+
+
+class UnixTransport:
+    """
+    Opens the connections to a controller listening on a Unix domain socket, e.g. a simulator on the same machine.
+    | There is no drive lane, the drive keys go with the rest of the commands.
+
+    .. attribute:: datagrams
+        Whether the transport can carry the drive lane
+    """
+
+    datagrams = False
+
+    def __init__(self, path, connect_timeout=TcpTransport.CONNECT_TIMEOUT, read_timeout=None,
+                 buffer_size=TcpTransport.BUFFER_SIZE):
+        """
+        :param path: path of the socket of the controller
+        :param connect_timeout: seconds to wait for a connection, None waits as long as the system does
+        :param read_timeout: seconds of silence after which the connection is considered lost, None never
+        :param buffer_size: bytes of the kernel buffers of the connections, None leaves the defaults
+        """
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.buffer_size = buffer_size
+
+    def connect(self) -> socket:
+        # AF_UNIX is missing on some platforms, so it is only looked up when needed
+        connection = socket(sockets.AF_UNIX, SOCK_STREAM)
+        try:
+            tune(connection, self.buffer_size)
+            connection.settimeout(self.connect_timeout)
+            connection.connect(self.path)
+            connection.settimeout(self.read_timeout)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+
+    def open(self) -> tuple:
+        sending = self.connect()
+        try:
+            return sending, self.connect()
+        except OSError:
+            sending.close()
+            raise
+
+    def datagram(self, port):
+        return None
+
+
+class LoopbackTransport:
+    """
+    Connects a Channel to a controller running in the same process, over socket pairs, with no network involved.
+    | Every open makes a new pair of connections, and hands the other ends of them to accept, so the controller
+    | side is served exactly like a real one, e.g. by a simulator, or by a test.
+
+    .. attribute:: datagrams
+        Whether the transport can carry the drive lane
+    """
+
+    datagrams = False
+
+    def __init__(self, buffer_size=TcpTransport.BUFFER_SIZE):
+        """
+        :param buffer_size: bytes of the kernel buffers of the connections, None leaves the defaults
+        """
+        self.buffer_size = buffer_size
+        self.__accepted = Queue()
+
+    def open(self) -> tuple:
+        sending, commands = socketpair()
+        receiving, telemetry = socketpair()
+        for connection in (sending, commands, receiving, telemetry):
+            tune(connection, self.buffer_size)
+        self.__accepted.put((commands, telemetry))
+        return sending, receiving
+
+    def accept(self, timeout=None) -> tuple:
+        """
+        Waits for the next Channel to open the transport
+
+        :param timeout: seconds to wait at most, None waits as long as it takes
+
+        :return: the command, and the telemetry connection, as seen by the controller
+
+        :raises queue.Empty: if nothing opened the transport in time
+        """
+        return self.__accepted.get(timeout=timeout)
+
+    def datagram(self, port):
+        return None
@@ -0,0 +1,126 @@
+from math import inf
+from protocol import Keys
+
+
+class ViewModel(Keys):
+    """
+    What the user interfaces show of the state of the car, without any widget, so Tk, and Qt share it.
+    | A state of the car is turned into a view: the value of every element of the dashboard, keyed by the key
+    | of the telemetry it shows. The switches, and the line sensor show whether they are active, the gauges show
+    | their value, and its level. Each render returns only the elements that differ from the previous one,
+    | so a frontend applying them does no widget work at all, while the car is steady.
+
+    .. note:: Levels
+        | A distance below DISTANCE_DANGER, a time to collision below TTC_DANGER, or a speed above SPEED_DANGER
+        | is DANGER, a distance below DISTANCE_WARNING, a time to collision below TTC_WARNING, or a speed above
+        | SPEED_WARNING is WARNING, anything else is NORMAL, and so is a distance of False, while the sensor sees
+        | nothing. Given a CollisionPredictor, the level of the distance follows its filtered distance, and its time
+        | to collision, so a single noisy reading does not change it, and closing in fast warns early.
+        | Once a distance is at a level, it takes thresholds HYSTERESIS farther to leave it, so a distance
+        | hovering around one does not make the warning flicker.
+
+    .. attribute:: view
+        The elements, and their values, as of the last render
+
+    .. attribute:: predictor
+        The CollisionPredictor fed with the distance, None leaves the level to the raw distance
+
+    :var: DISTANCE_WARNING
+    :var: DISTANCE_DANGER
+    :var: TTC_WARNING
+    :var: TTC_DANGER
+    :var: HYSTERESIS
+    :var: SPEED_WARNING
+    :var: SPEED_DANGER
+    """
+
+    NORMAL = 'normal'
+    WARNING = 'warning'
+    DANGER = 'danger'
+
+    DISTANCE_WARNING = 25
+    DISTANCE_DANGER = 10
+    TTC_WARNING = 2.0
+    TTC_DANGER = 1.0
+    HYSTERESIS = 0.2
+    SPEED_WARNING = 20
+    SPEED_DANGER = 30
+
+    SWITCHES = (
+        Keys.FORWARD, Keys.BACKWARD, Keys.LEFT, Keys.RIGHT, Keys.REVERSE,
+        Keys.LIGHTS, Keys.HAZARD_WARNING, Keys.R_INDICATOR, Keys.L_INDICATOR, Keys.LINE
+    )
+    GAUGES = (Keys.DISTANCE, Keys.SPEED)
+
+    def __init__(self, predictor=None):
+        """
+        :param predictor: CollisionPredictor fed with the distance of the channel shown
+        """
+        self.view = dict()
+        self.predictor = predictor
+
+    @classmethod
+    def distance_level(cls, distance, time_to_collision=inf, previous=None) -> str:
+        """
+        :param distance: the distance reported by the car, False if nothing is in range
+        :param time_to_collision: seconds until the car reaches what is ahead at the current closing speed
+        :param previous: the level shown so far, None if there is none
+
+        :return: NORMAL, WARNING, or DANGER
+        """
+        if distance is False:
+            return cls.NORMAL
+        danger = 1 + cls.HYSTERESIS if previous == cls.DANGER else 1
+        warning = 1 + cls.HYSTERESIS if previous in (cls.WARNING, cls.DANGER) else 1
+        if distance < cls.DISTANCE_DANGER * danger or time_to_collision < cls.TTC_DANGER * danger:
+            return cls.DANGER
+        if distance < cls.DISTANCE_WARNING * warning or time_to_collision < cls.TTC_WARNING * warning:
+            return cls.WARNING
+        return cls.NORMAL
+
+    @classmethod
+    def speed_level(cls, speed) -> str:
+        """
+        :param speed: the speed reported by the car
+
+        :return: NORMAL, WARNING, or DANGER
+        """
+        if speed > cls.SPEED_DANGER:
+            return cls.DANGER
+        return cls.WARNING if speed > cls.SPEED_WARNING else cls.NORMAL
+
+    def present(self, state) -> dict:
+        """
+        :param state: TelemetrySnapshot to show
+
+        :return: the value of every element, True, or False for the switches, and (value, level) for the gauges,
+                 the value of the distance is the reported one, even if its level comes from the predictor
+        """
+        view = {key: bool(state[key]) for key in self.SWITCHES}
+        distance, speed = state[self.DISTANCE], state[self.SPEED]
+        previous = self.view[self.DISTANCE][1] if self.DISTANCE in self.view else None
+        if self.predictor is None:
+            level = self.distance_level(distance, previous=previous)
+        else:
+            filtered, _, time_to_collision = self.predictor.predict()
+            level = self.distance_level(filtered, time_to_collision, previous)
+        view[self.DISTANCE] = (distance, level)
+        view[self.SPEED] = (speed, self.speed_level(speed))
+        return view
+
+    def render(self, state) -> dict:
+        """
+        Turns a state into the changes of the view, and remembers it as the one rendered
+
+        :param state: TelemetrySnapshot to show
+
+        :return: the elements that differ from the last render, with their new values, every element after reset
+        """
+        view = self.present(state)
+        changes = {key: value for key, value in view.items() if self.view.get(key) != value}
+        self.view = view
+        return changes
+
+    def reset(self) -> None:
+        """Forgets the last render, e.g. when the widgets are recreated, so the next one returns every element"""
+        self.view = dict()
@@ -0,0 +1,600 @@
+"""
+Performance benchmarks of Channel, and of both user interfaces, against a stand-in car on a LoopbackTransport.
+
+Run with ``python test/benchmarks.py --output benchmark.json``. Given the results of an earlier run with
+``--baseline``, it exits with 1 if any result got worse by more than the tolerance, so CI can flag regressions.
+Baselines only make sense from the same machine.
+"""
+import sys
+import os
+import json
+import platform
+from argparse import ArgumentParser
+from socket import SHUT_RDWR
+from threading import Thread, Event, Lock
+from time import perf_counter, monotonic, sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from axes import Axis, DriveAxes, AxisStreamer  # noqa: E402
+from channel import Channel  # noqa: E402
+from codec import JsonCodec, BinaryCodec, CODECS  # noqa: E402
+from connector import Connector, PendingChannel  # noqa: E402
+from keymap import Keymap, KeyDispatcher, Macro, MacroPlayer, MODIFIERS  # noqa: E402
+from latency import LatencyHistogram  # noqa: E402
+from protocol import Protocol, TelemetrySnapshot  # noqa: E402
+from transport import LoopbackTransport  # noqa: E402
+from view_model import ViewModel  # noqa: E402
+
+PASSWORD = 'secret'
+MARKER = 'bench'
+
+
+class Feeder:
+    """
+    Stand-in car, which records the command frames it receives, and streams whatever telemetry it is given,
+    without waiting for the acknowledgements, so the client is the only bottleneck
+
+    .. attribute:: arrivals
+        The command frames received so far, with the time they arrived at
+
+    .. attribute:: acknowledged
+        The last sequence number acknowledged by the client
+    """
+
+    def __init__(self, capabilities='BIN1 DELTA SEQ=64'):
+        self.transport = LoopbackTransport()
+        self.capabilities = capabilities
+        self.arrivals = []
+        self.acknowledged = 0
+        self.codec = JsonCodec
+        self.sequence = 0
+        self.__ready = Event()
+        Thread(target=self.__serve, daemon=True).start()
+
+    def __serve(self):
+        self.commands, self.telemetry = self.transport.accept()
+        self.commands.recv(1024)
+        self.telemetry.sendall(('GRANTED %s\n' % self.capabilities).encode())
+        data = b''
+        while b'\n' not in data:
+            data += self.commands.recv(1024)
+        line, data = data.split(b'\n', 1)
+        self.codec = CODECS[BinaryCodec.NAME] if BinaryCodec.NAME in line.decode().split() else JsonCodec
+        self.__ready.set()
+        Thread(target=self.__read_acknowledgements, daemon=True).start()
+
+        decoder = self.codec.decoder()
+        try:
+            while True:
+                arrived = perf_counter()
+                self.arrivals.extend((arrived, frame) for frame in decoder.feed(data))
+                data = self.commands.recv(65536)
+                if not data:
+                    break
+        except OSError:
+            pass
+        # Like the firmware, which ends the session when the client closes its command connection
+        for connection in (self.telemetry, self.commands):
+            connection.shutdown(SHUT_RDWR)
+            connection.close()
+
+    def __read_acknowledgements(self):
+        pending = b''
+        try:
+            data = self.telemetry.recv(4096)
+            while data:
+                *lines, pending = (pending + data).split(b'\n')
+                for line in lines:
+                    words = line.split()
+                    if words[:1] == [b'ACK']:
+                        self.acknowledged = int(words[1])
+                data = self.telemetry.recv(4096)
+        except OSError:
+            pass
+
+    def connect(self, **options) -> Channel:
+        channel = Channel(None, None, PASSWORD, transport=self.transport, **options)
+        self.wait_ready()
+        return channel
+
+    def wait_ready(self, timeout=None) -> bool:
+        """
+        :return: whether the client has agreed on the capabilities, so telemetry can be sent
+        """
+        return self.__ready.wait(timeout)
+
+    def encode(self, table) -> bytes:
+        self.sequence += 1
+        return self.codec.encode(dict(table, seq=self.sequence))
+
+    def send(self, data) -> None:
+        self.telemetry.sendall(data)
+
+
+def telemetry_frames(count) -> list:
+    return [
+        {Channel.DISTANCE: 20 + index % 200 / 2, Channel.SPEED: index % 40 / 4, Channel.LINE: index % 7 == 0}
+        for index in range(count)
+    ]
+
+
+def result(value, unit, higher_is_better) -> dict:
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def bench_set_value(quick) -> dict:
+    """Cost of set_value on the caller's thread, the rate it sustains, and the time until the car has the change"""
+    results = dict()
+    for name, tick in (('coalesced', Channel.TICK), ('synchronous', None)):
+        feeder = Feeder()
+        channel = feeder.connect(tick=tick, udp=False)
+        calls = 2000 if quick else 20000
+
+        start = perf_counter()
+        for index in range(calls):
+            channel.set_value(MARKER, index)
+        channel.flush()
+        elapsed = perf_counter() - start
+        results['set_value.%s.throughput' % name] = result(calls / elapsed, 'calls/s', True)
+
+        # Paced changes, so the latency is not dominated by the queue of the burst above
+        sent = dict()
+        for index in range(calls, calls + (100 if quick else 500)):
+            sent[index] = perf_counter()
+            channel.set_value(MARKER, index)
+            sleep(0.001)
+        channel.flush()
+        sleep(0.05)
+        histogram = LatencyHistogram()
+        for arrived, frame in list(feeder.arrivals):
+            if frame.get(MARKER) in sent:
+                histogram.record(arrived - sent[frame[MARKER]])
+        results['set_value.%s.latency_p50' % name] = result(histogram.percentile(50) * 1e3, 'ms', False)
+        results['set_value.%s.latency_p99' % name] = result(histogram.percentile(99) * 1e3, 'ms', False)
+        channel.deactivate()
+    return results
+
+
+def bench_decode(quick) -> dict:
+    """Frames per second through Protocol.decode, and apply, with more and more frames arriving per wakeup"""
+    results = dict()
+    frames = telemetry_frames(2000 if quick else 20000)
+    for codec in (JsonCodec, BinaryCodec):
+        for batch in (1, 10, 100):
+            protocol = Protocol(binary=codec is BinaryCodec)
+            protocol.read_answer(b'GRANTED BIN1 SEQ=64\n')
+            protocol.agree()
+            chunks = [
+                b''.join(codec.encode(dict(frame, seq=index + offset + 1))
+                         for offset, frame in enumerate(frames[index:index + batch]))
+                for index in range(0, len(frames), batch)
+            ]
+            start = perf_counter()
+            for chunk in chunks:
+                decoded = protocol.decode(chunk)
+                protocol.apply(decoded)
+                protocol.acknowledgement(decoded)
+            elapsed = perf_counter() - start
+            results['decode.%s.batch%d' % (codec.NAME, batch)] = result(len(frames) / elapsed, 'frames/s', True)
+    return results
+
+
+def bench_telemetry_rates(quick) -> dict:
+    """The share of the telemetry a Channel keeps up with, as the frame rate of the car rises"""
+    results = dict()
+    duration = 0.3 if quick else 2.0
+    for rate in (100, 1000, 10000, 50000):
+        # Acknowledged frame by frame, so the count is exact
+        feeder = Feeder('BIN1 DELTA SEQ=2')
+        channel = feeder.connect(udp=False)
+        frames = [feeder.encode(frame) for frame in telemetry_frames(int(rate * duration))]
+        start = perf_counter()
+        for index, frame in enumerate(frames):
+            delay = start + index / rate - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            feeder.send(frame)
+        deadline = perf_counter() + 1.0
+        # Everything sent is in the socket by now, the client only has to catch up
+        while feeder.acknowledged < len(frames) and perf_counter() < deadline:
+            sleep(0.001)
+        elapsed = perf_counter() - start
+        results['telemetry.rate%d.received' % rate] = result(feeder.acknowledged / elapsed, 'frames/s', True)
+        results['telemetry.rate%d.snapshots' % rate] = result(channel.snapshot().version / elapsed, 'snapshots/s', True)
+        channel.deactivate()
+    return results
+
+
+def bench_contention(quick) -> dict:
+    """Throughput of the receiving thread, while UI readers, and a writer use the Channel at the same time"""
+    results = dict()
+    duration = 0.3 if quick else 2.0
+    for readers in (0, 1, 4):
+        feeder = Feeder()
+        channel = feeder.connect(udp=False)
+        stopped = Event()
+        counts = []
+        counts_lock = Lock()
+
+        def read():
+            count = 0
+            keys = [Channel.DISTANCE, Channel.SPEED, Channel.LINE]
+            while not stopped.is_set():
+                channel.get_values(keys)
+                count += 1
+            with counts_lock:
+                counts.append(count)
+
+        def write():
+            count = 0
+            while not stopped.is_set():
+                channel.set_value(MARKER, count)
+                count += 1
+                sleep(0.0005)
+
+        threads = [Thread(target=read) for _ in range(readers)] + [Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        start = perf_counter()
+        sent = 0
+        while perf_counter() - start < duration:
+            feeder.send(b''.join(feeder.encode({Channel.SPEED: sent + index}) for index in range(32)))
+            sent += 32
+        received = feeder.acknowledged
+        elapsed = perf_counter() - start
+        stopped.set()
+        for thread in threads:
+            thread.join()
+        results['contention.readers%d.received' % readers] = result(received / elapsed, 'frames/s', True)
+        if readers:
+            results['contention.readers%d.reads' % readers] = result(sum(counts) / elapsed, 'reads/s', True)
+        channel.deactivate()
+    return results
+
+
+def bench_view_model(quick) -> dict:
+    """States per second through ViewModel.render, with the telemetry changing every frame, and steady"""
+    frames = telemetry_frames(2000 if quick else 20000)
+    changing = [TelemetrySnapshot(index + 1, frame) for index, frame in enumerate(frames)]
+    steady = [TelemetrySnapshot(index + 1, frames[0]) for index in range(len(frames))]
+    results = dict()
+    for name, states in (('changing', changing), ('steady', steady)):
+        view_model = ViewModel()
+        changes = 0
+        start = perf_counter()
+        for state in states:
+            changes += len(view_model.render(state))
+        elapsed = perf_counter() - start
+        results['view_model.%s.renders' % name] = result(len(states) / elapsed, 'states/s', True)
+        results['view_model.%s.changes' % name] = result(changes / len(states), 'changes/state', False)
+    return results
+
+
+def bench_plot(quick) -> dict:
+    """Samples per second through RingBuffer.append, and the cost of decimating a full minute of 500 Hz telemetry"""
+    try:
+        from ring_buffer import RingBuffer, decimate
+    except ImportError as error:
+        return {'plot.append': {'skipped': str(error)}}
+
+    rate, span, columns = 500, 60.0, 470
+    buffer = RingBuffer(int(span * rate))
+    samples = int(span * rate) * (1 if quick else 4)
+    start = perf_counter()
+    for index in range(samples):
+        buffer.append(index / rate, index % 400)
+    elapsed = perf_counter() - start
+    histogram = LatencyHistogram()
+    end = samples / rate
+    for _ in range(20 if quick else 200):
+        start = perf_counter()
+        times, values = buffer.window(end - span)
+        decimate(times, values, end - span, end, columns)
+        histogram.record(perf_counter() - start)
+    return {
+        'plot.append': result(samples / elapsed, 'samples/s', True),
+        'plot.decimate_p50': result(histogram.percentile(50) * 1e6, 'us', False),
+    }
+
+
+def bench_filters(quick) -> dict:
+    """Samples per second through CollisionPredictor, and how often the distance warning flickers with, and without"""
+    try:
+        import numpy as np
+        from filters import CollisionPredictor
+    except ImportError as error:
+        return {'filters.predict': {'skipped': str(error)}}
+
+    random = np.random.default_rng(1)
+    rate, count = 100, 2000 if quick else 20000
+    times = np.arange(count) / rate
+    # Driving back, and forth in front of a wall, with the noise of an ultrasonic sensor
+    distances = 60 + 45 * np.sin(times / 3) + random.normal(0, 3, count)
+    predictor = CollisionPredictor()
+    start = perf_counter()
+    for index in range(0, count, 8):
+        predictor.process(times[index:index + 8], distances[index:index + 8])
+    elapsed = perf_counter() - start
+    filtered, _, time_to_collision = CollisionPredictor().process(times, distances)
+
+    def flickers(levels):
+        return sum(1 for previous, level in zip(levels, levels[1:]) if level != previous) * 1000 / count
+
+    raw = [ViewModel.distance_level(distance) for distance in distances]
+    predicted = [ViewModel.NORMAL]
+    for distance, ttc in zip(filtered, time_to_collision):
+        predicted.append(ViewModel.distance_level(distance, ttc, predicted[-1]))
+    return {
+        'filters.predict': result(count / elapsed, 'samples/s', True),
+        'filters.raw_level_changes': result(flickers(raw), 'per 1000 samples', False),
+        'filters.predicted_level_changes': result(flickers(predicted), 'per 1000 samples', False),
+    }
+
+
+def bench_axes(quick) -> dict:
+    """Polls per second of AxisStreamer, and the values it sends while driving, with, and without quantization"""
+    seconds = 60 if quick else 600
+    rate = AxisStreamer.RATE
+    polls = int(seconds * rate)
+    # Tapping, and holding the drive keys, half a second to two seconds each, in a repeatable pattern
+    presses = [(index * 1.3, DriveAxes.FORWARD if index % 3 else DriveAxes.LEFT, 0.5 + index % 4 * 0.5)
+               for index in range(int(seconds / 1.3))]
+
+    def drive(quantum):
+        axes = DriveAxes(Axis(exponent=2.0), Axis())
+        streamer = AxisStreamer(axes, quantum)
+        sent = 0
+        pending = list(presses)
+        held = []
+        start = perf_counter()
+        for index in range(polls):
+            now = index / rate
+            while pending and pending[0][0] <= now:
+                pressed, key, duration = pending.pop(0)
+                axes.press(key)
+                held.append((pressed + duration, key))
+            for release in [entry for entry in held if entry[0] <= now]:
+                axes.release(release[1])
+                held.remove(release)
+            sent += len(streamer.poll(now))
+        return sent, perf_counter() - start
+
+    quantized, elapsed = drive(AxisStreamer.QUANTUM)
+    unquantized, _ = drive(1e-9)
+    return {
+        'axes.poll': result(polls / elapsed, 'polls/s', True),
+        'axes.values_sent': result(quantized / seconds, 'values/s', False),
+        'axes.unquantized_values': result(unquantized / seconds, 'values/s', False),
+    }
+
+
+def bench_keymap(quick) -> dict:
+    """Key events per second through KeyDispatcher, and how late MacroPlayer plays the events of a macro"""
+    keys = KeyDispatcher(Keymap(), PendingChannel(PendingChannel.CONNECTED), DriveAxes())
+    chords = [('w', 0), ('d', MODIFIERS['ctrl']), ('l', 0), ('Left', 0), ('x', 0)]
+    count = 20000 if quick else 200000
+    start = perf_counter()
+    for index in range(count // 2):
+        name, modifiers = chords[index % len(chords)]
+        keys.press(name, modifiers)
+        keys.release(name, modifiers)
+    elapsed = perf_counter() - start
+
+    events = 100 if quick else 1000
+    macro = Macro([(index * 0.005, Macro.PRESS if index % 2 == 0 else Macro.RELEASE, 'w') for index in range(events)])
+    player = MacroPlayer(macro, KeyDispatcher(Keymap(), PendingChannel(PendingChannel.CONNECTED)))
+    player.wait()
+    histogram = LatencyHistogram()
+    for lateness in player.lateness:
+        histogram.record(lateness)
+    return {
+        'keymap.dispatch': result(count / elapsed, 'events/s', True),
+        'keymap.playback_lateness_p50': result(histogram.percentile(50) * 1000, 'ms', False),
+        'keymap.playback_lateness_p99': result(histogram.percentile(99) * 1000, 'ms', False),
+    }
+
+
+def bench_ui_frames(window_update, channel, feeder, frames) -> dict:
+    """
+    Times window_update once for every new telemetry frame, leaving out the time the frames take to arrive
+
+    :return: the histogram of the times
+    """
+    histogram = LatencyHistogram()
+    for frame in frames:
+        version = channel.snapshot().version
+        feeder.send(feeder.encode(frame))
+        deadline = monotonic() + 1.0
+        while channel.snapshot().version == version and monotonic() < deadline:
+            sleep(0)
+        start = perf_counter()
+        window_update()
+        histogram.record(perf_counter() - start)
+    return histogram
+
+
+def bench_tk(quick) -> dict:
+    """Per-frame cost of __upadte_widgets of the Tkinter MainWindow"""
+    try:
+        from tkinter import TclError
+        from main_window import MainWindow
+    except ImportError as error:
+        return {'ui.tk.frame': {'skipped': str(error)}}
+
+    feeder = Feeder()
+    channel = feeder.connect(udp=False)
+    try:
+        window = MainWindow(channel, run=False)
+    except TclError as error:
+        channel.deactivate()
+        return {'ui.tk.frame': {'skipped': str(error)}}
+
+    histogram = bench_ui_frames(
+        window._MainWindow__upadte_widgets, channel, feeder, telemetry_frames(200 if quick else 2000)
+    )
+    channel.deactivate()
+    window.window.destroy()
+    return {
+        'ui.tk.frame_p50': result(histogram.percentile(50) * 1e6, 'us', False),
+        'ui.tk.frame_p99': result(histogram.percentile(99) * 1e6, 'us', False),
+    }
+
+
+def bench_qt(quick) -> dict:
+    """Per-frame cost of update_widgets, and painting the dashboard of the Qt MainWindow, on the offscreen platform"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from main_window_qt import MainWindow
+    except ImportError as error:
+        return {'ui.qt.frame': {'skipped': str(error)}}
+
+    application = QApplication.instance() or QApplication([])
+    feeder = Feeder()
+    channel = feeder.connect(udp=False)
+    window = MainWindow(channel)
+    window.resize(500, 500)
+    window.show()
+
+    def update():
+        window.update_widgets()
+        # Paints right away, instead of with the next frame of the dashboard
+        window.dashboard.render_pending()
+        application.processEvents()
+
+    histogram = bench_ui_frames(update, channel, feeder, telemetry_frames(200 if quick else 2000))
+    channel.deactivate()
+    window.close()
+    return {
+        'ui.qt.frame_p50': result(histogram.percentile(50) * 1e6, 'us', False),
+        'ui.qt.frame_p99': result(histogram.percentile(99) * 1e6, 'us', False),
+    }
+
+
+def bench_startup(quick) -> dict:
+    """Time until a Connector has authenticated, and until the first telemetry frame has been published"""
+    connected = []
+    first_frames = []
+    for _ in range(5 if quick else 50):
+        feeder = Feeder()
+        done = Event()
+
+        def changed(connector):
+            if connector.state == Connector.CONNECTED and connector.first_frame_after is None:
+                # The car streams its telemetry as soon as the session starts
+                feeder.wait_ready(1.0)
+                feeder.send(feeder.encode(telemetry_frames(1)[0]))
+            elif connector.first_frame_after is not None or connector.state != Connector.CONNECTED:
+                done.set()
+
+        connector = Connector(
+            lambda timeout: Channel(None, None, PASSWORD, transport=feeder.transport, handshake_timeout=timeout),
+            changed
+        )
+        done.wait(5.0)
+        connected.append(connector.connected_after)
+        first_frames.append(connector.first_frame_after)
+        if connector.channel is not None:
+            connector.channel.deactivate()
+    connected.sort()
+    first_frames.sort()
+    return {
+        'startup.connected_ms': result(connected[len(connected) // 2] * 1e3, 'ms', False),
+        'startup.first_frame_ms': result(first_frames[len(first_frames) // 2] * 1e3, 'ms', False),
+    }
+
+
+BENCHMARKS = {
+    'set_value': bench_set_value,
+    'decode': bench_decode,
+    'telemetry': bench_telemetry_rates,
+    'contention': bench_contention,
+    'view_model': bench_view_model,
+    'plot': bench_plot,
+    'filters': bench_filters,
+    'axes': bench_axes,
+    'keymap': bench_keymap,
+    'tk': bench_tk,
+    'qt': bench_qt,
+    'startup': bench_startup,
+}
+
+
+def run(names=None, quick=False) -> dict:
+    """
+    :param names: names of the benchmarks to run from BENCHMARKS, None runs all of them
+    :param quick: whether to run fewer iterations, e.g. to check that the benchmarks still work
+
+    :return: the results, with some details of the machine, ready to be stored as JSON
+    """
+    results = dict()
+    for name in names or BENCHMARKS:
+        results.update(BENCHMARKS[name](quick))
+    return {
+        'meta': {
+            'time': time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance) -> list:
+    """
+    :param current: results of run
+    :param baseline: earlier results of run
+    :param tolerance: the relative change allowed in the worse direction, e.g. 0.25
+
+    :return: a line of description for each result that regressed
+    """
+    regressions = []
+    for name, entry in current['results'].items():
+        previous = baseline['results'].get(name)
+        if 'value' not in entry or not previous or 'value' not in previous or not previous['value']:
+            continue
+        change = (entry['value'] - previous['value']) / previous['value']
+        if not entry['higher_is_better']:
+            change = -change
+        if change < -tolerance:
+            regressions.append('%s: %.4g %s, was %.4g %s' % (
+                name, entry['value'], entry['unit'], previous['value'], previous['unit']
+            ))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help='run fewer iterations')
+    parser.add_argument('--output', help='file to store the results in, as JSON')
+    parser.add_argument('--baseline', help='results of an earlier run, to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative regression allowed')
+    arguments = parser.parse_args(argv)
+    unknown = [name for name in arguments.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(unknown))
+
+    results = run(arguments.names, arguments.quick)
+    for name, entry in sorted(results['results'].items()):
+        if 'value' in entry:
+            print('%-40s %14.4g %s' % (name, entry['value'], entry['unit']))
+        else:
+            print('%-40s skipped: %s' % (name, entry['skipped']))
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), arguments.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
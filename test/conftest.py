@@ -0,0 +1,5 @@
+import sys
+import os
+
+# The modules in src import each other as top level modules, the same way as when the applications are run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
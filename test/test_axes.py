@@ -0,0 +1,100 @@
+import unittest
+from time import sleep
+
+from axes import Axis, DriveAxes, AxisStreamer
+from channel import Channel
+from simulator import CarModel
+from test_channel import FakeCar
+from test_simulator import wait_for
+
+
+class TestAxis(unittest.TestCase):
+
+    def test_ramps_to_the_target(self):
+        axis = Axis(rise=2.0, fall=4.0)
+        axis.target = 1.0
+        axis.advance(0.25)
+        self.assertAlmostEqual(axis.value, 0.5)
+        axis.advance(1.0)
+        self.assertEqual(axis.value, 1.0)
+        axis.target = 0.0
+        axis.advance(0.125)
+        self.assertAlmostEqual(axis.value, 0.5)
+
+    def test_crossing_the_center_falls_then_rises(self):
+        axis = Axis(rise=2.0, fall=4.0)
+        axis.position = 0.5
+        axis.target = -1.0
+        # 0.125 s back to the center, and 0.125 s on to the other side
+        axis.advance(0.25)
+        self.assertAlmostEqual(axis.position, -0.25)
+
+    def test_exponent_shapes_the_value(self):
+        axis = Axis(exponent=2.0)
+        axis.position = -0.5
+        self.assertAlmostEqual(axis.value, -0.25)
+
+    def test_infinite_rates_follow_at_once(self):
+        axis = Axis(rise=float('inf'), fall=float('inf'))
+        axis.target = -0.7
+        axis.advance(0.001)
+        self.assertEqual(axis.value, -0.7)
+
+
+class TestDriveAxes(unittest.TestCase):
+
+    def test_keys_and_other_sources_set_the_targets(self):
+        axes = DriveAxes(Axis(rise=10.0), Axis(rise=10.0))
+        axes.advance(0.0)
+        axes.press(DriveAxes.FORWARD)
+        axes.press(DriveAxes.RIGHT)
+        axes.press(DriveAxes.HORN)
+        self.assertEqual(axes.advance(1.0), {DriveAxes.THROTTLE: 1.0, DriveAxes.STEERING: -1.0})
+        axes.press(DriveAxes.BACKWARD)
+        axes.release(DriveAxes.RIGHT)
+        self.assertEqual(axes.advance(2.0), {DriveAxes.THROTTLE: 0.0, DriveAxes.STEERING: 0.0})
+        axes.set(throttle=3, steering=0.25)
+        self.assertEqual(axes.advance(3.0), {DriveAxes.THROTTLE: 1.0, DriveAxes.STEERING: 0.25})
+        axes.release_all()
+        self.assertEqual(axes.advance(4.0), {DriveAxes.THROTTLE: 0.0, DriveAxes.STEERING: 0.0})
+
+
+class TestAxisStreamer(unittest.TestCase):
+
+    def test_only_changed_steps_are_returned(self):
+        axes = DriveAxes(Axis(rise=1.0))
+        streamer = AxisStreamer(axes, quantum=0.1)
+        self.assertEqual(streamer.poll(0.0), {DriveAxes.THROTTLE: 0.0, DriveAxes.STEERING: 0.0})
+        axes.press(DriveAxes.FORWARD)
+        self.assertEqual(streamer.poll(0.02), dict())
+        self.assertEqual(streamer.poll(0.33), {DriveAxes.THROTTLE: 0.3})
+        self.assertEqual(streamer.poll(0.34), dict())
+        self.assertEqual(streamer.poll(5.0), {DriveAxes.THROTTLE: 1.0})
+        self.assertEqual(streamer.poll(6.0), dict())
+        streamer.reset()
+        self.assertEqual(streamer.poll(6.0), {DriveAxes.THROTTLE: 1.0, DriveAxes.STEERING: 0.0})
+
+    def test_channel_streams_the_axes(self):
+        car = FakeCar()
+        axes = DriveAxes()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, axes=axes, axis_rate=100)
+        self.addCleanup(channel.deactivate)
+        axes.press(Channel.FORWARD)
+        self.assertTrue(wait_for(lambda: car.frames and car.frames[-1].get(Channel.THROTTLE) == 1.0))
+        self.assertLessEqual(len(car.frames), 1 + 1 / AxisStreamer.QUANTUM)
+        sent = len(car.frames)
+        sleep(0.2)
+        self.assertEqual(len(car.frames), sent)
+
+
+class TestProportionalModel(unittest.TestCase):
+
+    def test_half_throttle_drives_at_half_speed(self):
+        model = CarModel(obstacles=[])
+        for _ in range(40):
+            model.step({Channel.THROTTLE: 0.5, Channel.FORWARD: True}, 0.05)
+        self.assertAlmostEqual(model.speed, CarModel.MAX_SPEED / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+import benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_quick_run(self):
+        results = benchmarks.run(['decode', 'telemetry'], quick=True)
+        self.assertTrue(results['meta']['quick'])
+        for entry in results['results'].values():
+            self.assertGreater(entry['value'], 0)
+
+    def test_regressions_are_flagged(self):
+        baseline = {'results': {
+            'throughput': benchmarks.result(100.0, 'calls/s', True),
+            'latency': benchmarks.result(1.0, 'ms', False),
+            'ui': {'skipped': 'no display'},
+        }}
+        current = {'results': {
+            'throughput': benchmarks.result(80.0, 'calls/s', True),
+            'latency': benchmarks.result(1.5, 'ms', False),
+            'ui': {'skipped': 'no display'},
+        }}
+        regressions = benchmarks.compare(current, baseline, 0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('latency'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,163 @@
 import unittest
+from socket import socket, AF_INET, SOCK_STREAM, SOCK_DGRAM, SHUT_RDWR, IPPROTO_TCP, TCP_NODELAY, SOL_SOCKET, SO_KEEPALIVE
+from threading import Thread
+from hashlib import sha256
+from time import sleep, time, monotonic
+
+import asyncio
+from channel import Channel
+from async_channel import AsyncChannel
+from protocol import Protocol, TelemetrySnapshot
+from subscriptions import Subscriptions
+from framing import JsonFrameDecoder
+from codec import JsonCodec, BinaryCodec, CODECS
+from latency import LatencyHistogram, LatencyMonitor
+from transport import TcpTransport, LoopbackTransport
+
+
+class FakeCar:
+    """
+    Minimal stand-in for the controller, accepting one Channel on localhost, or on a LoopbackTransport
+
+    .. attribute:: frames
+        The command frames received so far, decoded
+
+    .. attribute:: chosen
+        The words of the USE line sent by the Channel, if the car offered any capabilities
+    """
+
+    PASSWORD = 'secret'
+    TOKEN = 'f00d'
+
+    def __init__(self, capabilities='', udp=False, loopback=False):
+        self.frames = []
+        self.credentials = []
+        self.capabilities = capabilities
+        if udp:
+            self.datagrams = socket(AF_INET, SOCK_DGRAM)
+            self.datagrams.bind(('127.0.0.1', 0))
+            self.datagrams.settimeout(2)
+            self.capabilities = (capabilities + ' UDP=%d' % self.datagrams.getsockname()[1]).strip()
+        self.chosen = None
+        self.codec = JsonCodec
+        if loopback:
+            self.transport = LoopbackTransport()
+            self.port = None
+        else:
+            self.transport = None
+            self.server = socket(AF_INET, SOCK_STREAM)
+            self.server.bind(('127.0.0.1', 0))
+            self.server.listen(2)
+            self.port = self.server.getsockname()[1]
+        self.thread = Thread(target=self.__serve, daemon=True)
+        self.thread.start()
+
+    def __serve(self):
+        while True:
+            if self.transport is not None:
+                self.commands, self.telemetry = self.transport.accept()
+            else:
+                self.commands, _ = self.server.accept()
+                self.telemetry, _ = self.server.accept()
+            self.__serve_session()
+
+    def __serve_session(self):
+        credentials = self.commands.recv(1024)
+        self.credentials.append(credentials)
+        granted = credentials in (sha256(self.PASSWORD.encode()).digest(), b'RESUME %s\n' % self.TOKEN.encode())
+        if not granted:
+            self.telemetry.sendall(b'REJECTED')
+        elif self.capabilities:
+            self.telemetry.sendall(('GRANTED ' + self.capabilities + '\n').encode())
+        else:
+            self.telemetry.sendall(b'GRANTED')
+
+        data = b''
+        if granted and self.capabilities:
+            while b'\n' not in data:
+                data += self.commands.recv(1024)
+            line, data = data.split(b'\n', 1)
+            self.chosen = line.decode().split()
+            self.codec = CODECS[BinaryCodec.NAME] if BinaryCodec.NAME in self.chosen else JsonCodec
+
+        decoder = self.codec.decoder()
+        self.frames.extend(decoder.feed(data))
+        try:
+            data = self.commands.recv(1024)
+            while data:
+                self.frames.extend(decoder.feed(data))
+                data = self.commands.recv(1024)
+        except OSError:
+            pass
+        self.telemetry.close()
+        self.commands.close()
+
+    def drop(self):
+        """Drops the connections of the current session, as if the link was lost"""
+        self.telemetry.shutdown(SHUT_RDWR)
+        self.commands.shutdown(SHUT_RDWR)
+
+    def send_telemetry(self, table):
+        self.telemetry.sendall(self.codec.encode(table))
+        self.telemetry.recv(1024)
+
+    def send_raw(self, data, acknowledgements):
+        self.telemetry.sendall(data)
+        received = b''
+        while len(received) < len(b'Done.') * acknowledgements:
+            received += self.telemetry.recv(1024)
+        return received
+
+    def wait_for_chosen(self, timeout=2.0):
+        for _ in range(int(timeout / 0.01)):
+            if self.chosen is not None:
+                break
+            sleep(0.01)
+        return self.chosen
+
+    def wait_for_frames(self, count, timeout=2.0):
+        for _ in range(int(timeout / 0.01)):
+            if len(self.frames) >= count:
+                break
+            sleep(0.01)
+        return self.frames
+
+
+class FailingReplayTransport:
+    """Opens the connections of a TcpTransport, but the first reconnect loses its connection on the replay"""
+
+    def __init__(self, port):
+        self.transport = TcpTransport('127.0.0.1', port)
+        self.opened = 0
+
+    def open(self):
+        sending, receiving = self.transport.open()
+        self.opened += 1
+        if self.opened == 2:
+            # The credentials, and the choice of capabilities go through, the replay does not
+            sending = FailingSocket(sending, 2)
+        return sending, receiving
+
+    def datagram(self, port):
+        return self.transport.datagram(port)
+
+
+class FailingSocket:
+    """Socket that is closed, as if the connection was lost, after a number of sendall calls"""
+
+    def __init__(self, connection, calls):
+        self.connection = connection
+        self.calls = calls
+
+    def sendall(self, data):
+        if not self.calls:
+            self.connection.close()
+            raise ConnectionResetError('lost')
+        self.calls -= 1
+        self.connection.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
 
 
 class MyTestCase(unittest.TestCase):
@@ -6,5 +165,562 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(True, True)
 
 
+class TestCommandFrames(unittest.TestCase):
+
+    def connect(self, **kwargs):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=None, **kwargs)
+        self.addCleanup(channel.deactivate)
+        return car, channel
+
+    def test_full_frames_by_default(self):
+        car, channel = self.connect()
+        channel.set_value(Channel.LIGHTS, True)
+        channel.set_value(Channel.FORWARD, True)
+        self.assertEqual(
+            car.wait_for_frames(2),
+            [{Channel.LIGHTS: True}, {Channel.LIGHTS: True, Channel.FORWARD: True}]
+        )
+
+    def test_delta_frames_carry_only_changes(self):
+        car, channel = self.connect(delta=True)
+        channel.set_value(Channel.LIGHTS, True)
+        channel.set_value(Channel.FORWARD, True)
+        channel.set_value(Channel.FORWARD, True)
+        channel.set_value(Channel.FORWARD, False)
+        self.assertEqual(
+            car.wait_for_frames(3),
+            [{Channel.LIGHTS: True}, {Channel.FORWARD: True}, {Channel.FORWARD: False}]
+        )
+
+    def test_delta_mode_resyncs_periodically(self):
+        car, channel = self.connect(delta=True)
+        channel.set_value(Channel.LIGHTS, True)
+        for index in range(Protocol.RESYNC_INTERVAL + 1):
+            channel.set_value(Channel.FORWARD, index % 2 == 0)
+        frames = car.wait_for_frames(Protocol.RESYNC_INTERVAL + 2)
+        self.assertEqual(frames[-2], {Channel.FORWARD: False})
+        self.assertEqual(frames[-1], {Channel.LIGHTS: True, Channel.FORWARD: True})
+
+    def test_changes_after_a_stale_report_are_sent(self):
+        car, channel = self.connect(delta=True)
+        channel.set_value(Channel.FORWARD, True)
+        car.wait_for_frames(1)
+        car.send_telemetry({Channel.FORWARD: False, Channel.LIGHTS: True})
+        channel.set_value(Channel.FORWARD, False)
+        channel.set_value(Channel.HORN, True)
+        self.assertEqual(
+            car.wait_for_frames(3),
+            [{Channel.FORWARD: True}, {Channel.FORWARD: False}, {Channel.HORN: True}]
+        )
+
+    def test_set_values(self):
+        car, channel = self.connect()
+        channel.set_values([Channel.LIGHTS, Channel.HORN], [True, False])
+        self.assertEqual(car.wait_for_frames(1), [{Channel.LIGHTS: True, Channel.HORN: False}])
+
+
+class TestWriter(unittest.TestCase):
+
+    def test_changes_within_a_tick_share_a_frame(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, delta=True, tick=0.05)
+        self.addCleanup(channel.deactivate)
+        channel.set_value(Channel.FORWARD, True)
+        channel.set_value(Channel.LEFT, True)
+        channel.set_value(Channel.LEFT, False)
+        self.assertTrue(channel.flush(timeout=2))
+        self.assertEqual(car.wait_for_frames(1), [{Channel.FORWARD: True, Channel.LEFT: False}])
+
+    def test_set_value_does_not_wait_for_the_socket(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=0.5)
+        self.addCleanup(channel.deactivate)
+        start = time()
+        channel.set_value(Channel.HORN, True)
+        self.assertLess(time() - start, 0.1)
+        self.assertEqual(car.frames, [])
+        channel.flush(timeout=2)
+        self.assertEqual(car.wait_for_frames(1), [{Channel.HORN: True}])
+
+    def test_telemetry_does_not_overwrite_pending_changes(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=0.5)
+        self.addCleanup(channel.deactivate)
+        channel.set_value(Channel.FORWARD, True)
+        car.send_telemetry({Channel.FORWARD: False})
+        self.assertTrue(channel.flush(timeout=2))
+        self.assertEqual(car.wait_for_frames(1), [{Channel.FORWARD: True}])
+        self.assertFalse(channel.get_value(Channel.FORWARD))
+
+    def test_deactivate_sends_pending_changes(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=0.05)
+        channel.set_value(Channel.DISTANCE_KEEPING, False)
+        channel.deactivate()
+        self.assertEqual(car.wait_for_frames(1), [{Channel.DISTANCE_KEEPING: False}])
+
+
+class TestNegotiation(unittest.TestCase):
+
+    def connect(self, capabilities, **kwargs):
+        car = FakeCar(capabilities)
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=None, **kwargs)
+        self.addCleanup(channel.deactivate)
+        return car, channel
+
+    def test_legacy_firmware_uses_json(self):
+        car, channel = self.connect('')
+        channel.set_value(Channel.LIGHTS, True)
+        self.assertIs(channel.codec, JsonCodec)
+        self.assertEqual(car.wait_for_frames(1), [{Channel.LIGHTS: True}])
+        self.assertIsNone(car.chosen)
+
+    def test_binary_and_delta_are_agreed_on(self):
+        car, channel = self.connect('BIN1 DELTA')
+        channel.set_value(Channel.LIGHTS, True)
+        channel.set_value(Channel.FORWARD, True)
+        self.assertIs(channel.codec, BinaryCodec)
+        self.assertEqual(car.wait_for_frames(2), [{Channel.LIGHTS: True}, {Channel.FORWARD: True}])
+        self.assertEqual(car.chosen, ['USE', 'BIN1', 'DELTA'])
+
+    def test_binary_can_be_declined(self):
+        car, channel = self.connect('BIN1', binary=False, delta=False)
+        channel.set_value(Channel.LIGHTS, True)
+        self.assertEqual(car.wait_for_frames(1), [{Channel.LIGHTS: True}])
+        self.assertEqual(car.chosen, ['USE'])
+
+    def test_binary_telemetry(self):
+        car, channel = self.connect('BIN1')
+        car.send_telemetry({Channel.DISTANCE: 12.3, Channel.SPEED: 4, Channel.LINE: True})
+        self.assertEqual(channel.get_values([Channel.DISTANCE, Channel.SPEED, Channel.LINE]), [12.3, 4, True])
+
+
+class TestAsyncChannel(unittest.TestCase):
+
+    def test_commands_and_telemetry(self):
+        car = FakeCar('BIN1 DELTA')
+
+        async def drive():
+            channel = await AsyncChannel.connect('127.0.0.1', car.port, FakeCar.PASSWORD)
+            telemetry = channel.telemetry()
+            first_frame = asyncio.ensure_future(telemetry.__anext__())
+            await asyncio.sleep(0)
+
+            await channel.set_value(Channel.LIGHTS, True)
+            await channel.set_values([Channel.LIGHTS, Channel.FORWARD], [True, True])
+            await asyncio.get_event_loop().run_in_executor(None, car.send_telemetry, {Channel.SPEED: 3})
+            frame = await first_frame
+            await telemetry.aclose()
+            await channel.deactivate()
+            return channel, frame
+
+        channel, frame = asyncio.run(drive())
+        self.assertIs(channel.codec, BinaryCodec)
+        self.assertEqual(frame, {Channel.SPEED: 3})
+        self.assertEqual(channel.get_value(Channel.SPEED), 3)
+        self.assertEqual(car.wait_for_frames(2), [{Channel.LIGHTS: True}, {Channel.FORWARD: True}])
+
+    def test_telemetry_before_the_first_step_is_kept(self):
+        car = FakeCar()
+
+        async def drive():
+            channel = await AsyncChannel.connect('127.0.0.1', car.port, FakeCar.PASSWORD)
+            telemetry = channel.telemetry()
+            await asyncio.get_event_loop().run_in_executor(None, car.send_telemetry, {Channel.SPEED: 5})
+            frame = await asyncio.wait_for(telemetry.__anext__(), 2.0)
+            await telemetry.aclose()
+            await channel.deactivate()
+            return frame
+
+        self.assertEqual(asyncio.run(drive()), {Channel.SPEED: 5})
+
+    def test_rejected_connections_are_closed(self):
+        car = FakeCar()
+
+        async def drive():
+            rejected = await AsyncChannel.connect('127.0.0.1', car.port, 'wrong')
+            # The car serves one session at a time, so this one is only answered once the rejected one is closed
+            channel = await AsyncChannel.connect('127.0.0.1', car.port, FakeCar.PASSWORD, handshake_timeout=2.0)
+            await channel.deactivate()
+            return rejected.granted, channel.granted
+
+        self.assertEqual(asyncio.run(drive()), (False, True))
+
+    def test_handshake_times_out(self):
+        server = socket(AF_INET, SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.listen(2)
+        connect = AsyncChannel.connect('127.0.0.1', server.getsockname()[1], FakeCar.PASSWORD, handshake_timeout=0.2)
+        with self.assertRaises(OSError):
+            asyncio.run(connect)
+
+
+class TestSequencedTelemetry(unittest.TestCase):
+
+    def sequenced_protocol(self, window):
+        protocol = Protocol()
+        protocol.read_answer(('GRANTED SEQ=%d\n' % window).encode())
+        self.assertEqual(protocol.agree(), b'USE SEQ\n')
+        return protocol
+
+    def test_cumulative_acknowledgements(self):
+        protocol = self.sequenced_protocol(4)
+        frames = protocol.decode(b'{"seq": 0, "speed": 1}\n')
+        self.assertEqual(frames, [{'speed': 1}])
+        self.assertEqual(protocol.acknowledgement(frames), b'')
+        frames = protocol.decode(b'{"seq": 1, "speed": 2}\n{"seq": 2, "speed": 3}\n')
+        self.assertEqual(protocol.acknowledgement(frames), b'ACK 2\n')
+
+    def test_lost_frames_are_counted(self):
+        protocol = self.sequenced_protocol(8)
+        protocol.decode(b'{"seq": 0}{"seq": 1}{"seq": 4}')
+        self.assertEqual(protocol.lost_frames, 2)
+
+    def test_binary_sequence_numbers(self):
+        frame = {'seq': 7, Channel.LINE: True}
+        self.assertEqual(BinaryCodec.decoder().feed(BinaryCodec.encode(frame)), [frame])
+
+    def test_window_of_frames_in_flight(self):
+        car = FakeCar('SEQ=4')
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD)
+        self.addCleanup(channel.deactivate)
+        car.wait_for_chosen()
+        car.telemetry.sendall(b''.join(JsonCodec.encode({'seq': index, Channel.SPEED: index}) for index in range(4)))
+        received = b''
+        while not received.endswith(b'ACK 3\n'):
+            received += car.telemetry.recv(1024)
+        self.assertNotIn(b'Done.', received)
+        self.assertEqual(channel.get_value(Channel.SPEED), 3)
+
+
+class TestDriveLane(unittest.TestCase):
+
+    def receive_drive_state(self, car):
+        return Protocol.DRIVE_DATAGRAM.unpack(car.datagrams.recv(64))
+
+    def test_drive_keys_go_on_the_drive_lane(self):
+        car = FakeCar('DELTA', udp=True)
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=0.01)
+        self.addCleanup(channel.deactivate)
+        self.assertIn('UDP', car.wait_for_chosen())
+
+        channel.set_value(Channel.FORWARD, True)
+        channel.set_value(Channel.LIGHTS, True)
+        first_sequence, bits = self.receive_drive_state(car)
+        self.assertEqual(bits, Protocol.DRIVE_BITS[Channel.FORWARD])
+
+        # Repeated while the key is held
+        sequence, bits = self.receive_drive_state(car)
+        self.assertGreater(sequence, first_sequence)
+        self.assertEqual(bits, Protocol.DRIVE_BITS[Channel.FORWARD])
+
+        channel.set_value(Channel.FORWARD, False)
+        car.datagrams.settimeout(0.3)
+        released = []
+        try:
+            while True:
+                released.append(self.receive_drive_state(car)[1])
+        except OSError:
+            pass
+        self.assertEqual(released[-Protocol.DRIVE_REPEATS:], [0] * Protocol.DRIVE_REPEATS)
+        self.assertEqual(released.count(0), Protocol.DRIVE_REPEATS)
+
+        channel.flush(timeout=2)
+        self.assertEqual(car.wait_for_frames(1), [{Channel.LIGHTS: True}])
+
+    def test_repetitions_stop_after_release(self):
+        protocol = Protocol(udp=True)
+        protocol.read_answer(b'GRANTED UDP=9000\n')
+        self.assertEqual(protocol.agree(), b'USE UDP\n')
+        self.assertTrue(protocol.set_value(Channel.LEFT, False))
+        self.assertFalse(protocol.set_value(Channel.HORN, True))
+        datagrams = []
+        while protocol.drive_refresh_needed():
+            datagrams.append(protocol.drive_datagram())
+        self.assertEqual(len(datagrams), Protocol.DRIVE_REPEATS)
+
+
+class TestReconnect(unittest.TestCase):
+
+    def wait_for(self, condition):
+        for _ in range(300):
+            if condition():
+                return True
+            sleep(0.01)
+        return False
+
+    def test_session_is_resumed_and_replayed(self):
+        car = FakeCar('DELTA TOKEN=' + FakeCar.TOKEN)
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD)
+        self.addCleanup(channel.deactivate)
+        statuses = []
+        channel.subscribe([Channel.STATUS], lambda changes: statuses.append(changes[Channel.STATUS]))
+        channel.set_values([Channel.LIGHTS, Channel.FORWARD], [True, True])
+        self.assertEqual(len(car.wait_for_frames(1)), 1)
+
+        car.drop()
+        self.assertTrue(self.wait_for(lambda: len(car.frames) >= 2))
+        self.assertEqual(car.credentials[-1], b'RESUME f00d\n')
+        self.assertEqual(car.frames[-1], {Channel.LIGHTS: True, Channel.FORWARD: True})
+        self.assertTrue(self.wait_for(lambda: channel.status == Channel.CONNECTED))
+        self.assertEqual(statuses, [Channel.RECONNECTING, Channel.CONNECTED])
+
+    def test_password_is_used_without_token(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, tick=None)
+        self.addCleanup(channel.deactivate)
+        channel.set_value(Channel.HORN, True)
+        car.wait_for_frames(1)
+        car.drop()
+        self.assertTrue(self.wait_for(lambda: len(car.frames) >= 2))
+        self.assertEqual(car.credentials, [sha256(FakeCar.PASSWORD.encode()).digest()] * 2)
+        self.assertEqual(car.frames[-1], {Channel.HORN: True})
+
+    def test_no_reconnect_when_disabled(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD, reconnect=False)
+        self.addCleanup(channel.deactivate)
+        car.drop()
+        channel.answer_thread.join(timeout=2)
+        self.assertFalse(channel.answer_thread.is_alive())
+
+    def test_failed_replay_reconnects_again(self):
+        car = FakeCar()
+        transport = FailingReplayTransport(car.port)
+        channel = Channel(None, None, FakeCar.PASSWORD, tick=None, transport=transport)
+        self.addCleanup(channel.deactivate)
+        channel.set_value(Channel.HORN, True)
+        car.wait_for_frames(1)
+        car.drop()
+        self.assertTrue(self.wait_for(lambda: len(car.frames) >= 2))
+        self.assertEqual(transport.opened, 3)
+        self.assertEqual(car.frames[-1], {Channel.HORN: True})
+        self.assertTrue(channel.answer_thread.is_alive())
+
+
+class TestTransport(unittest.TestCase):
+
+    def test_tcp_connections_are_tuned(self):
+        server = socket(AF_INET, SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        connection = TcpTransport('127.0.0.1', server.getsockname()[1], read_timeout=0.5).connect()
+        self.addCleanup(connection.close)
+        self.assertTrue(connection.getsockopt(IPPROTO_TCP, TCP_NODELAY))
+        self.assertTrue(connection.getsockopt(SOL_SOCKET, SO_KEEPALIVE))
+        self.assertEqual(connection.gettimeout(), 0.5)
+
+    def test_loopback_session(self):
+        car = FakeCar('DELTA SEQ=1', loopback=True)
+        channel = Channel(None, None, FakeCar.PASSWORD, transport=car.transport)
+        self.addCleanup(channel.deactivate)
+        self.assertEqual(car.wait_for_chosen(), ['USE', 'DELTA', 'SEQ'])
+        channel.set_value(Channel.LIGHTS, True)
+        self.assertEqual(car.wait_for_frames(1), [{Channel.LIGHTS: True}])
+        car.send_telemetry({'seq': 1, Channel.SPEED: 3})
+        self.assertEqual(channel.get_value(Channel.SPEED), 3)
+
+    def test_loopback_reconnect(self):
+        car = FakeCar('TOKEN=%s' % FakeCar.TOKEN, loopback=True)
+        channel = Channel(None, None, FakeCar.PASSWORD, transport=car.transport)
+        self.addCleanup(channel.deactivate)
+        channel.set_value(Channel.LIGHTS, True)
+        car.wait_for_frames(1)
+        car.drop()
+        self.assertEqual(car.wait_for_frames(2)[-1], {Channel.LIGHTS: True})
+        self.assertEqual(car.credentials[-1], b'RESUME %s\n' % FakeCar.TOKEN.encode())
+
+
+class TestBinaryCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        frame = {Channel.FORWARD: True, Channel.LIGHTS: False, Channel.DISTANCE: 42.5, 'unknown': [1, 2]}
+        self.assertEqual(BinaryCodec.decoder().feed(BinaryCodec.encode(frame)), [frame])
+
+    def test_flags_only_frame_is_small(self):
+        frame = {key: True for key in BinaryCodec.FLAGS}
+        self.assertEqual(len(BinaryCodec.encode(frame)), BinaryCodec.HEADER.size)
+
+    def test_split_frames(self):
+        data = BinaryCodec.encode({Channel.SPEED: 1}) + BinaryCodec.encode({Channel.HORN: True})
+        decoder = BinaryCodec.decoder()
+        self.assertEqual(decoder.feed(data[:5]), [])
+        self.assertEqual(decoder.feed(data[5:-1]), [{Channel.SPEED: 1}])
+        self.assertEqual(decoder.feed(data[-1:]), [{Channel.HORN: True}])
+
+    def test_corrupt_extra_is_dropped(self):
+        data = BinaryCodec.encode({Channel.SPEED: 1, 'unknown': 2}).replace(b'2}', b'2]')
+        data += BinaryCodec.HEADER.pack(BinaryCodec.KIND_STATE, 0, 0, 0, 3) + b'[3]'
+        data += BinaryCodec.encode({Channel.HORN: True})
+        self.assertEqual(BinaryCodec.decoder().feed(data), [{Channel.SPEED: 1}, {}, {Channel.HORN: True}])
+
+
+class TestTelemetrySnapshot(unittest.TestCase):
+
+    def test_snapshot_is_immutable(self):
+        snapshot = TelemetrySnapshot(3, {Channel.SPEED: 2})
+        with self.assertRaises(AttributeError):
+            snapshot.version = 4
+        with self.assertRaises(AttributeError):
+            snapshot.extra = True
+        self.assertEqual(snapshot[Channel.SPEED], 2)
+        self.assertIs(snapshot[Channel.LINE], False)
+
+    def test_one_snapshot_per_batch(self):
+        protocol = Protocol()
+        first = protocol.snapshot
+        protocol.apply(protocol.decode(b'{"speed": 1}{"speed": 2, "line": true}'))
+        self.assertEqual(protocol.snapshot.version, first.version + 1)
+        self.assertEqual(protocol.snapshot.get_values([Channel.SPEED, Channel.LINE]), [2, True])
+        self.assertEqual(first[Channel.SPEED], False)
+        protocol.apply([])
+        self.assertEqual(protocol.snapshot.version, first.version + 1)
+
+
+class TestSubscriptions(unittest.TestCase):
+
+    def test_diff(self):
+        old = TelemetrySnapshot(1, {Channel.SPEED: 2, Channel.LINE: True, Channel.LIGHTS: False})
+        new = TelemetrySnapshot(2, {Channel.SPEED: 3, Channel.LIGHTS: False})
+        self.assertEqual(Subscriptions.diff(old, new), {Channel.SPEED: 3, Channel.LINE: False})
+
+    def test_only_watched_changes_are_delivered(self):
+        subscriptions = Subscriptions()
+        received = []
+        dispatched = []
+        subscriptions.subscribe([Channel.SPEED], received.append)
+        token = subscriptions.subscribe(None, received.append, lambda callback, changes: dispatched.append(changes))
+        subscriptions.notify({Channel.LINE: True})
+        subscriptions.unsubscribe(token)
+        subscriptions.notify({Channel.LINE: False, Channel.SPEED: 4})
+        self.assertEqual(received, [{Channel.SPEED: 4}])
+        self.assertEqual(dispatched, [{Channel.LINE: True}])
+
+    def test_channel_notifies_on_change_only(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD)
+        self.addCleanup(channel.deactivate)
+        received = []
+        channel.subscribe([Channel.SPEED, Channel.LINE], received.append)
+        car.send_telemetry({Channel.SPEED: 1, Channel.DISTANCE: 40})
+        car.send_telemetry({Channel.SPEED: 1, Channel.DISTANCE: 30})
+        car.send_telemetry({Channel.SPEED: 1, Channel.LINE: True})
+        for _ in range(200):
+            if len(received) >= 2:
+                break
+            sleep(0.01)
+        self.assertEqual(received, [{Channel.SPEED: 1}, {Channel.LINE: True}])
+
+
+    def test_every_frame_is_delivered(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD)
+        self.addCleanup(channel.deactivate)
+        batches = []
+        channel.subscribe_frames(lambda frames, received: batches.append((frames, received)))
+        before = monotonic()
+        car.send_raw(b'{"speed": 5}\n{"speed": 5}\n{"speed": 5, "line": true}\n', 3)
+        for _ in range(200):
+            if sum(len(frames) for frames, _ in batches) >= 3:
+                break
+            sleep(0.01)
+        self.assertEqual([frame for frames, _ in batches for frame in frames],
+                         [{Channel.SPEED: 5}, {Channel.SPEED: 5}, {Channel.SPEED: 5, Channel.LINE: True}])
+        self.assertTrue(all(before <= received <= monotonic() for _, received in batches))
+
+
+class TestLatency(unittest.TestCase):
+
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        for millisecond in range(1, 101):
+            histogram.record(millisecond / 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.percentile(50), 0.050, delta=0.050 * 0.016)
+        self.assertAlmostEqual(histogram.percentile(99), 0.099, delta=0.099 * 0.016)
+        self.assertLessEqual(histogram.percentile(100), histogram.max)
+        self.assertEqual(LatencyHistogram().percentile(50), 0.0)
+
+    def test_offset_and_round_trip(self):
+        now = [10.0]
+        monitor = LatencyMonitor(lambda: now[0])
+        # Acknowledged at 10.0 by the client, received at 110.02 by the controller,
+        # answered at 110.03, and received at 10.05: 0.04 on the wire, and the controller is 100.0 ahead
+        frame = {'ts': 110.03, 'echo': 10.0, 'rx': 110.02, 'speed': 3}
+        monitor.observe(frame, 10.05)
+        self.assertEqual(frame, {'speed': 3})
+        self.assertAlmostEqual(monitor.offset, 100.0)
+        self.assertAlmostEqual(monitor.rtt.max, 0.04, places=6)
+        self.assertAlmostEqual(monitor.age('speed', 10.05), 0.02)
+        self.assertIsNone(monitor.age('line'))
+        monitor.resynchronize()
+        self.assertIsNone(monitor.offset)
+
+    def test_time_is_negotiated_with_sequencing(self):
+        protocol = Protocol(binary=False)
+        protocol.read_answer(b'GRANTED TIME\n')
+        self.assertEqual(protocol.agree(), b'USE\n')
+        protocol = Protocol(binary=False)
+        protocol.read_answer(b'GRANTED SEQ=1 TIME\n')
+        self.assertEqual(protocol.agree(), b'USE SEQ TIME\n')
+        protocol.set_value(Channel.LIGHTS, True)
+        self.assertIn('ts', JsonCodec.decoder().feed(protocol.command_frame())[0])
+        frames = protocol.decode(b'{"seq": 1, "ts": 5.0, "speed": 2}\n')
+        self.assertEqual(frames, [{'speed': 2}])
+        self.assertRegex(protocol.acknowledgement(frames), rb'^ACK 1 \d+\.\d{6}\n$')
+        self.assertIsNotNone(protocol.latency.age('speed'))
+
+
+class TestJsonFrameDecoder(unittest.TestCase):
+
+    def test_joined_frames(self):
+        decoder = JsonFrameDecoder()
+        self.assertEqual(decoder.feed(b'{"speed": 1}\n{"speed": 2}{"speed": 3}'), [{'speed': 1}, {'speed': 2}, {'speed': 3}])
+
+    def test_split_frames(self):
+        decoder = JsonFrameDecoder()
+        self.assertEqual(decoder.feed(b'{"speed": 1}\n{"spe'), [{'speed': 1}])
+        self.assertEqual(decoder.feed(b'ed": 2'), [])
+        self.assertEqual(decoder.feed(b'}\n'), [{'speed': 2}])
+
+    def test_split_multibyte_character(self):
+        decoder = JsonFrameDecoder()
+        data = '{"name": "\u00e9"}'.encode()
+        self.assertEqual(decoder.feed(data[:-3]), [])
+        self.assertEqual(decoder.feed(data[-3:]), [{'name': '\u00e9'}])
+
+    def test_corrupt_frame_is_dropped(self):
+        decoder = JsonFrameDecoder()
+        self.assertEqual(decoder.feed(b'{"speed": }\n{"speed": 2}\n'), [{'speed': 2}])
+
+    def test_memoryview_input(self):
+        decoder = JsonFrameDecoder()
+        buffer = bytearray(b'{"line": true}xxxx')
+        self.assertEqual(decoder.feed(memoryview(buffer)[:14]), [{'line': True}])
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_frames_in_one_segment(self):
+        car = FakeCar()
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD)
+        self.addCleanup(channel.deactivate)
+        acknowledgements = car.send_raw(b'{"speed": 5}\n{"speed": 7, "line": true}\n', 2)
+        self.assertEqual(acknowledgements, b'Done.Done.')
+        self.assertEqual(channel.get_values([Channel.SPEED, Channel.LINE]), [7, True])
+
+    def test_corrupt_binary_frame_is_survived(self):
+        car = FakeCar('BIN1')
+        channel = Channel('127.0.0.1', car.port, FakeCar.PASSWORD)
+        self.addCleanup(channel.deactivate)
+        car.wait_for_chosen()
+        corrupt = BinaryCodec.encode({Channel.SPEED: 5, 'unknown': 1}).replace(b'1}', b'1]')
+        car.send_raw(corrupt + BinaryCodec.encode({Channel.LINE: True}), 2)
+        self.assertEqual(channel.get_values([Channel.SPEED, Channel.LINE]), [0, True])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+from socket import socket, AF_INET, SOCK_STREAM
+from time import sleep, monotonic
+
+from channel_manager import ChannelManager
+from codec import BinaryCodec
+from simulator import CarServer, Simulator
+from transport import LoopbackTransport
+
+
+def wait_for(condition, timeout=3.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+class TestChannelManager(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = ChannelManager()
+        self.addCleanup(self.manager.close)
+
+    def test_many_cars_on_one_thread(self):
+        simulator = Simulator(12, port=0, password='secret', rate=50, seed=1)
+        self.addCleanup(simulator.stop)
+        channels = [self.manager.connect('127.0.0.1', port, 'secret') for port in simulator.ports()]
+        self.assertTrue(all(channel.granted for channel in channels))
+        self.assertTrue(all(channel.codec is BinaryCodec for channel in channels))
+        self.assertTrue(all(wait_for(lambda: channel.snapshot().version > 0) for channel in channels))
+
+        channels[7].set_value(channels[7].FORWARD, True)
+        self.assertTrue(wait_for(lambda: simulator.cars[7].model.speed > 0))
+        self.assertTrue(wait_for(lambda: channels[7].get_value(channels[7].SPEED) > 0))
+        self.assertEqual(simulator.cars[6].model.speed, 0.0)
+
+    def test_connect_all_runs_the_handshakes_in_parallel(self):
+        simulator = Simulator(2, port=0, password='secret', rate=50, seed=1)
+        self.addCleanup(simulator.stop)
+        # Accepts, but never answers, so its handshake takes the whole timeout
+        silent = socket(AF_INET, SOCK_STREAM)
+        self.addCleanup(silent.close)
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(2)
+        addresses = [('127.0.0.1', port) for port in simulator.ports()]
+        addresses.insert(1, silent.getsockname())
+
+        start = monotonic()
+        results = self.manager.connect_all(addresses, 'secret', handshake_timeout=0.5)
+        self.assertLess(monotonic() - start, 1.0)
+        self.assertIsInstance(results[1], OSError)
+        self.assertTrue(results[0].granted and results[2].granted)
+        self.assertEqual(self.manager.channels, [results[0], results[2]])
+
+    def test_rejected_password(self):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        channel = self.manager.connect(None, None, 'wrong', transport=transport)
+        self.assertFalse(channel.granted)
+
+    def test_reconnects_after_a_drop(self):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        channel = self.manager.connect(None, None, 'secret', transport=transport)
+        statuses = []
+        channel.subscribe([channel.STATUS], lambda changes: statuses.append(changes[channel.STATUS]))
+        self.assertTrue(wait_for(lambda: channel.snapshot().version > 0))
+        # The status of the first connection may be published after the subscription
+        del statuses[:]
+
+        car.stop()
+        self.assertTrue(wait_for(lambda: channel.status == channel.RECONNECTING))
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        self.assertTrue(wait_for(lambda: channel.status == channel.CONNECTED))
+        channel.set_value(channel.FORWARD, True)
+        self.assertTrue(wait_for(lambda: car.model.speed > 0))
+        self.assertEqual(statuses[:2], [channel.RECONNECTING, channel.CONNECTED])
+
+    def test_drop_while_readable_and_writable(self):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        channel = self.manager.connect(None, None, 'secret', transport=transport)
+        self.assertTrue(wait_for(lambda: channel.snapshot().version > 0))
+
+        car.stop()
+        # Both events of the connection in one batch of the selector, the first one finding it lost
+        self.manager.call_soon(lambda: [
+            channel.handle_readable(), channel.handle_writable(), channel.handle_readable()
+        ])
+        self.assertTrue(wait_for(lambda: channel.status == channel.RECONNECTING))
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        self.assertTrue(wait_for(lambda: channel.status == channel.CONNECTED))
+        self.assertTrue(self.manager.thread.is_alive())
+
+    def test_a_failing_car_does_not_stop_the_others(self):
+        simulator = Simulator(2, port=0, password='secret', rate=50, seed=1)
+        self.addCleanup(simulator.stop)
+        failing, channel = [self.manager.connect('127.0.0.1', port, 'secret') for port in simulator.ports()]
+        statuses = []
+        failing.subscribe([failing.STATUS], lambda changes: statuses.append(changes[failing.STATUS]))
+
+        def fail(_):
+            raise RuntimeError('subscriber failed')
+        with redirect_stderr(StringIO()):
+            failing.subscribe([failing.SPEED, failing.DISTANCE], fail)
+            self.assertTrue(wait_for(lambda: failing.RECONNECTING in statuses))
+            version = channel.snapshot().version
+            self.assertTrue(wait_for(lambda: channel.snapshot().version > version))
+        self.assertTrue(self.manager.thread.is_alive())
+        self.assertEqual(channel.status, channel.CONNECTED)
+
+    def test_deactivate_while_reconnecting(self):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        channel = self.manager.connect(None, None, 'secret', transport=transport)
+        self.assertTrue(wait_for(lambda: channel.snapshot().version > 0))
+        statuses = []
+        channel.subscribe([channel.STATUS], lambda changes: statuses.append(changes[channel.STATUS]))
+
+        car.stop()
+        self.assertTrue(wait_for(lambda: channel.status == channel.RECONNECTING))
+        channel.deactivate(timeout=1.0)
+        # The reconnect scheduled before succeeds, and closes the car once more
+        car = CarServer(transport, 'secret', rate=50, seed=1)
+        self.addCleanup(car.stop)
+        sleep(0.5)
+        self.assertEqual(statuses.count(channel.DISCONNECTED), 1)
+        self.assertEqual(channel.status, channel.DISCONNECTED)
+
+    def test_handshake_times_out(self):
+        # Nothing serves the transport, so nothing answers
+        transport = LoopbackTransport()
+        start = monotonic()
+        with self.assertRaises(OSError):
+            self.manager.connect(None, None, 'secret', transport=transport, handshake_timeout=0.2)
+        self.assertLess(monotonic() - start, 2.0)
+
+    def test_close_disconnects_every_car(self):
+        simulator = Simulator(3, port=0, password='secret', rate=50, seed=1)
+        self.addCleanup(simulator.stop)
+        channels = [self.manager.connect('127.0.0.1', port, 'secret') for port in simulator.ports()]
+        self.manager.close()
+        self.assertFalse(self.manager.thread.is_alive())
+        self.assertTrue(all(channel.status == channel.DISCONNECTED for channel in channels))
+
+
+if __name__ == '__main__':
+    unittest.main()
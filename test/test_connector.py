@@ -0,0 +1,131 @@
+import unittest
+from socket import socket, AF_INET, SOCK_STREAM
+from threading import Event
+from time import perf_counter
+
+from channel import Channel
+from connector import Connector, PendingChannel
+from simulator import CarServer
+from transport import LoopbackTransport, TcpTransport
+
+
+class Outcome:
+    """Records the states a Connector goes through, and waits for the one a test expects"""
+
+    def __init__(self):
+        self.states = []
+        self.changed = Event()
+
+    def __call__(self, connector):
+        self.states.append(connector.state)
+        self.changed.set()
+
+    def wait(self, condition, timeout=3.0):
+        deadline = perf_counter() + timeout
+        while not condition() and perf_counter() < deadline:
+            self.changed.wait(0.01)
+            self.changed.clear()
+        return condition()
+
+
+class SilentCar:
+    """Accepts connections, and never answers, like a wrong host that happens to listen on the port"""
+
+    def __init__(self):
+        self.server = socket(AF_INET, SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(2)
+        self.port = self.server.getsockname()[1]
+
+    def close(self):
+        self.server.close()
+
+
+class TestConnector(unittest.TestCase):
+
+    def connect(self, password='secret', **options):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=100, seed=1)
+        self.addCleanup(car.stop)
+        outcome = Outcome()
+        connector = Connector(
+            lambda timeout: Channel(None, None, password, transport=transport, handshake_timeout=timeout),
+            outcome, **options
+        )
+        self.addCleanup(lambda: connector.channel is not None and connector.channel.deactivate())
+        return connector, outcome
+
+    def test_connected_and_first_frame(self):
+        connector, outcome = self.connect()
+        self.assertTrue(outcome.wait(lambda: connector.first_frame_after is not None))
+        self.assertEqual(outcome.states, [Connector.CONNECTED, Connector.CONNECTED])
+        self.assertTrue(connector.channel.granted)
+        self.assertLessEqual(connector.connected_after, connector.first_frame_after)
+        self.assertIn('first frame after', connector.describe())
+
+    def test_rejected(self):
+        connector, outcome = self.connect(password='wrong')
+        self.assertTrue(outcome.wait(lambda: connector.state != Connector.CONNECTING))
+        self.assertEqual(connector.state, Connector.REJECTED)
+        self.assertEqual(connector.pending.status, Connector.REJECTED)
+        self.assertIsNone(connector.channel)
+
+    def test_failed(self):
+        car = SilentCar()
+        car.close()
+        outcome = Outcome()
+        connector = Connector(Connector.tcp('127.0.0.1', car.port, 'secret'), outcome)
+        self.assertTrue(outcome.wait(lambda: connector.state != Connector.CONNECTING))
+        self.assertEqual(connector.state, Connector.FAILED)
+        self.assertTrue(connector.error)
+
+    def test_silent_host_times_out(self):
+        car = SilentCar()
+        self.addCleanup(car.close)
+        outcome = Outcome()
+        connector = Connector(Connector.tcp('127.0.0.1', car.port, 'secret'), outcome, timeout=0.2)
+        self.assertTrue(outcome.wait(lambda: connector.state != Connector.CONNECTING))
+        self.assertEqual(connector.state, Connector.TIMED_OUT)
+        # The handshake gives up within the timeout too, so nothing is left behind
+        connector.thread.join(2.0)
+        self.assertFalse(connector.thread.is_alive())
+        self.assertEqual(outcome.states, [Connector.TIMED_OUT])
+
+    def test_cancel(self):
+        car = SilentCar()
+        self.addCleanup(car.close)
+        outcome = Outcome()
+        connector = Connector(Connector.tcp('127.0.0.1', car.port, 'secret'), outcome, timeout=0.5)
+        connector.cancel()
+        self.assertEqual(connector.state, Connector.CANCELLED)
+        self.assertEqual(connector.describe(), 'Cancelled')
+        connector.thread.join(2.0)
+        self.assertEqual(outcome.states, [Connector.CANCELLED])
+
+    def test_handshake_timeout(self):
+        car = SilentCar()
+        self.addCleanup(car.close)
+        start = perf_counter()
+        with self.assertRaises(OSError):
+            Channel('127.0.0.1', car.port, 'secret', transport=TcpTransport('127.0.0.1', car.port),
+                    handshake_timeout=0.1)
+        self.assertLess(perf_counter() - start, 1.0)
+
+
+class TestPendingChannel(unittest.TestCase):
+
+    def test_stands_in_for_a_channel(self):
+        channel = PendingChannel(Connector.CONNECTING)
+        statuses = []
+        channel.subscribe([channel.STATUS], lambda changes: statuses.append(changes[channel.STATUS]))
+        channel.set_value(channel.FORWARD, True)
+        self.assertIs(channel.get_value(channel.FORWARD), False)
+        self.assertEqual(channel.snapshot().version, 0)
+        channel.set_status(Connector.FAILED)
+        self.assertEqual(statuses, [Connector.FAILED])
+        self.assertTrue(channel.flush())
+        channel.deactivate()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+from math import inf
+
+from protocol import TelemetrySnapshot
+from view_model import ViewModel
+
+try:
+    import numpy as np
+    from filters import ExponentialFilter, KalmanFilter, MedianFilter, FilterPipeline, CollisionPredictor
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestFilters(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.default_rng(7)
+        self.samples = 100 + random.normal(0, 5, 600)
+        self.samples[[100, 101, 350]] = np.nan
+        self.samples[200] = 3
+
+    def filters(self):
+        return [
+            lambda: ExponentialFilter(0.3),
+            lambda: KalmanFilter(4.0, 25.0),
+            lambda: MedianFilter(5),
+            lambda: FilterPipeline(MedianFilter(5), KalmanFilter(4.0, 25.0)),
+        ]
+
+    def test_batches_match_single_samples(self):
+        for make in self.filters():
+            batched = make().process(self.samples)
+            single = make()
+            one_by_one = np.concatenate([single.process(self.samples[index:index + 1])
+                                         for index in range(len(self.samples))])
+            np.testing.assert_allclose(batched, one_by_one, equal_nan=True)
+
+    def test_exponential_filter_matches_the_recurrence(self):
+        expected, output = [], None
+        for sample in self.samples[:100]:
+            output = sample if output is None else output + 0.3 * (sample - output)
+            expected.append(output)
+        np.testing.assert_allclose(ExponentialFilter(0.3).process(self.samples[:100]), expected)
+
+    def test_gaps_pass_through(self):
+        for make in self.filters():
+            output = make().process(self.samples)
+            self.assertTrue(np.isnan(output[100]) and np.isnan(output[350]))
+            self.assertEqual(output[102], self.samples[102])
+
+    def test_noise_is_reduced(self):
+        for make in self.filters():
+            output = make().process(self.samples)
+            self.assertLess(np.std(output[110:190]), np.std(self.samples[110:190]) / 2)
+
+    def test_median_drops_spikes(self):
+        self.assertGreater(MedianFilter(5).process(self.samples)[200], 80)
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestCollisionPredictor(unittest.TestCase):
+
+    def test_time_to_collision(self):
+        random = np.random.default_rng(3)
+        times = np.arange(400) / 100
+        distances = 300 - 40 * times + random.normal(0, 3, len(times))
+        _, closing, time_to_collision = CollisionPredictor().process(times, distances)
+        self.assertAlmostEqual(closing[100:].mean(), 40, delta=2)
+        errors = time_to_collision[100:] - (300 - 40 * times[100:]) / 40
+        self.assertLess(abs(np.median(errors)), 0.3)
+
+    def test_batches_match_single_samples(self):
+        random = np.random.default_rng(2)
+        times = np.arange(500) / 100
+        distances = 200 - 30 * times + random.normal(0, 3, len(times))
+        distances[[100, 101, 300]] = np.nan
+        batched = CollisionPredictor().process(times, distances)
+        predictor = CollisionPredictor()
+        parts = [predictor.process(times[index:index + 7], distances[index:index + 7])
+                 for index in range(0, len(times), 7)]
+        for whole, chunked in zip(batched, zip(*parts)):
+            np.testing.assert_allclose(whole, np.concatenate(chunked), equal_nan=True)
+
+    def test_standing_still_never_collides(self):
+        predictor = CollisionPredictor()
+        predictor.process(np.arange(100) / 100, np.full(100, 15.0))
+        distance, closing, time_to_collision = predictor.prediction
+        self.assertAlmostEqual(distance, 15.0)
+        self.assertAlmostEqual(closing, 0.0)
+        self.assertEqual(time_to_collision, inf)
+
+    def test_feed_is_processed_by_predict(self):
+        predictor = CollisionPredictor()
+        predictor.feed([{'distance': distance, 'speed': 3} for distance in (50.0, 50.0, False)], 1.0)
+        predictor.feed([{'speed': 4}], 1.1)
+        self.assertEqual(predictor.prediction, (False, 0.0, inf))
+        predictor.feed([{'distance': 42.0}], 1.2)
+        self.assertEqual(predictor.predict()[0], 42.0)
+
+    def test_view_model_warns_on_closing_in(self):
+        predictor = CollisionPredictor()
+        view_model = ViewModel(predictor)
+        # 40 cm/s towards an obstacle 70 cm away is under TTC_WARNING, though the distance is not under 25 cm
+        predictor.process(np.arange(100) / 100, 110 - 40 * np.arange(100) / 100)
+        state = TelemetrySnapshot(1, {ViewModel.DISTANCE: 70.4})
+        self.assertEqual(view_model.render(state)[ViewModel.DISTANCE], (70.4, ViewModel.WARNING))
+
+
+    def test_warning_clears_while_the_distance_holds_steady(self):
+        predictor = CollisionPredictor()
+        view_model = ViewModel(predictor)
+        for index in range(100):
+            predictor.feed([{ViewModel.DISTANCE: 110 - 40 * index / 100}], index / 100)
+        state = TelemetrySnapshot(1, {ViewModel.DISTANCE: 70.4})
+        self.assertEqual(view_model.render(state)[ViewModel.DISTANCE], (70.4, ViewModel.WARNING))
+
+        # The car stopped, the same distance keeps arriving, and nothing changes but the time
+        for index in range(100, 300):
+            predictor.feed([{ViewModel.DISTANCE: 70.4}], index / 100)
+        self.assertEqual(view_model.render(state)[ViewModel.DISTANCE], (70.4, ViewModel.NORMAL))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import json
+import tempfile
+import unittest
+from os import path
+from time import sleep
+
+from axes import DriveAxes
+from keymap import Keymap, KeyDispatcher, Macro, MacroPlayer, MODIFIERS, MOMENTARY, TOGGLE, COMMAND, CANCEL
+from protocol import Keys
+
+CTRL = MODIFIERS['ctrl']
+SHIFT = MODIFIERS['shift']
+
+
+class Car:
+    """Stand-in for a channel, which reports back whatever is set, and remembers the order it was set in"""
+
+    def __init__(self):
+        self.values = dict()
+        self.log = []
+
+    def set_value(self, key, value):
+        self.values[key] = value
+        self.log.append((key, value))
+
+    def get_value(self, key):
+        return self.values.get(key, False)
+
+
+class TestKeymap(unittest.TestCase):
+
+    def test_default_bindings(self):
+        keymap = Keymap()
+        self.assertEqual(keymap.lookup('w'), (MOMENTARY, Keys.FORWARD))
+        self.assertEqual(keymap.lookup('Up'), (MOMENTARY, Keys.FORWARD))
+        self.assertEqual(keymap.lookup('d'), (MOMENTARY, Keys.RIGHT))
+        self.assertEqual(keymap.lookup('d', CTRL), (TOGGLE, Keys.DISTANCE_KEEPING))
+        self.assertEqual(keymap.lookup('c', SHIFT), (TOGGLE, Keys.CHANGE_DIRECTION))
+        self.assertEqual(keymap.lookup('Escape'), (COMMAND, CANCEL))
+        self.assertIsNone(keymap.lookup('c'))
+
+    def test_modifiers_keep_driving_only(self):
+        keymap = Keymap()
+        self.assertEqual(keymap.lookup('w', CTRL), (MOMENTARY, Keys.FORWARD))
+        self.assertIsNone(keymap.lookup('q', CTRL))
+
+    def test_invalid_bindings(self):
+        for bindings in ({'w': ('hold', Keys.FORWARD)}, {'w': (MOMENTARY, 'warp')}, {'meta+w': (TOGGLE, Keys.HORN)}):
+            with self.assertRaises(ValueError):
+                Keymap(bindings)
+
+    def test_load_changes_the_defaults(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        keymap_path = path.join(directory.name, 'keymap.json')
+        with open(keymap_path, 'w') as file:
+            json.dump({'i': ['momentary', 'forward'], 'w': None, 'ctrl+shift+h': ['toggle', 'horn']}, file)
+        keymap = Keymap.load(keymap_path)
+        self.assertEqual(keymap.lookup('i'), (MOMENTARY, Keys.FORWARD))
+        self.assertIsNone(keymap.lookup('w'))
+        self.assertEqual(keymap.lookup('h', CTRL | SHIFT), (TOGGLE, Keys.HORN))
+        self.assertEqual(keymap.lookup('s'), (MOMENTARY, Keys.BACKWARD))
+
+
+class TestKeyDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.car = Car()
+        self.axes = DriveAxes()
+        self.cancelled = []
+        self.keys = KeyDispatcher(Keymap(), self.car, self.axes, {CANCEL: lambda: self.cancelled.append(True)})
+
+    def test_momentary_keys_are_held(self):
+        self.assertTrue(self.keys.press('w'))
+        self.assertTrue(self.keys.press('w'))
+        self.assertEqual(self.car.log, [(Keys.FORWARD, True)])
+        self.assertEqual(self.axes.throttle.target, 1.0)
+        # Released whatever is held by then
+        self.assertTrue(self.keys.release('w', CTRL))
+        self.assertEqual(self.car.log[-1], (Keys.FORWARD, False))
+        self.assertEqual(self.axes.throttle.target, 0.0)
+
+    def test_toggles_and_commands(self):
+        self.keys.press('l')
+        self.keys.release('l')
+        self.keys.press('d', CTRL)
+        self.keys.release('d')
+        self.keys.press('l')
+        self.keys.press('Escape')
+        self.assertFalse(self.keys.press('x'))
+        self.assertEqual(self.car.values, {Keys.LIGHTS: False, Keys.DISTANCE_KEEPING: True})
+        self.assertEqual(self.cancelled, [True])
+
+    def test_release_all(self):
+        self.keys.press('w')
+        self.keys.press('a')
+        self.keys.release_all()
+        self.assertEqual(self.car.values, {Keys.FORWARD: False, Keys.LEFT: False})
+
+
+class TestMacro(unittest.TestCase):
+
+    def record(self):
+        keys = KeyDispatcher(Keymap(), Car(), commands={CANCEL: lambda: None})
+        keys.start_recording()
+        keys.press('w')
+        sleep(0.05)
+        keys.press('Escape')
+        keys.press('d', CTRL)
+        keys.release('d', CTRL)
+        sleep(0.05)
+        keys.release('w')
+        return keys.stop_recording()
+
+    def test_only_bound_keys_are_recorded(self):
+        macro = self.record()
+        self.assertEqual([event[1:] for event in macro.events], [
+            (Macro.PRESS, 'w'), (Macro.PRESS, 'ctrl+d'), (Macro.RELEASE, 'ctrl+d'), (Macro.RELEASE, 'w')
+        ])
+        self.assertAlmostEqual(macro.duration, 0.1, delta=0.05)
+
+    def test_save_and_load(self):
+        macro = self.record()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        macro_path = path.join(directory.name, 'macro.json')
+        macro.save(macro_path)
+        self.assertEqual(Macro.load(macro_path).events, macro.events)
+
+    def test_playback_is_on_time(self):
+        macro = Macro([(0.02 * index, Macro.PRESS if index % 2 == 0 else Macro.RELEASE, 'w') for index in range(10)])
+        car = Car()
+        player = MacroPlayer(macro, KeyDispatcher(Keymap(), car))
+        self.assertTrue(player.wait(2.0))
+        self.assertEqual(car.log, [(Keys.FORWARD, index % 2 == 0) for index in range(10)])
+        self.assertEqual(len(player.lateness), 10)
+        # The odd late event is the scheduler of the system, most are played within a fraction of a millisecond
+        self.assertLess(sorted(player.lateness)[5], 0.001)
+        self.assertLess(max(player.lateness), 0.05)
+
+    def test_play_replays_the_last_recording(self):
+        car = Car()
+        keys = KeyDispatcher(Keymap(), car)
+        self.assertIsNone(keys.play())
+        keys.toggle_recording()
+        keys.press('h')
+        keys.release('h')
+        keys.toggle_recording()
+        self.assertTrue(keys.play().wait(2.0))
+        self.assertEqual(car.log, [(Keys.HAZARD_WARNING, True), (Keys.HAZARD_WARNING, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import threading
+import unittest
+from socket import socket, AF_INET, SOCK_STREAM
+from time import perf_counter
+
+from axes import DriveAxes
+from codec import BinaryCodec
+from simulator import Simulator
+
+try:
+    from PyQt5.QtCore import QCoreApplication, QEventLoop
+    from PyQt5.QtWidgets import QApplication
+    from qt_channel import QtChannel
+except ImportError:
+    QtChannel = None
+
+
+@unittest.skipIf(QtChannel is None, 'PyQt5 is not installed')
+class TestQtChannel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A QApplication, as the widgets tested in the same process need one
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        cls.application = QApplication.instance() or QApplication([])
+
+    def process_until(self, condition, timeout=3.0):
+        deadline = perf_counter() + timeout
+        while not condition() and perf_counter() < deadline:
+            QCoreApplication.processEvents(QEventLoop.AllEvents, 10)
+        return condition()
+
+    def connect(self, password='secret', port=None, **options):
+        if port is None:
+            simulator = Simulator(1, port=0, password='secret', rate=100, seed=1)
+            self.addCleanup(simulator.stop)
+            self.car = simulator.cars[0]
+            port = simulator.ports()[0]
+        channel = QtChannel('127.0.0.1', port, password, handshake_timeout=1.0, **options)
+        self.addCleanup(channel.deactivate)
+        outcomes = []
+        channel.ready.connect(outcomes.append)
+        self.assertTrue(self.process_until(lambda: outcomes))
+        return channel, outcomes
+
+    def test_session_on_the_event_loop(self):
+        channel, outcomes = self.connect()
+        self.assertEqual(outcomes, [True])
+        self.assertIs(channel.codec, BinaryCodec)
+        threads = []
+        channel.subscribe(None, lambda changes: threads.append(threading.get_ident()))
+        self.assertTrue(self.process_until(lambda: channel.snapshot().version > 0 and threads))
+        self.assertEqual(set(threads), {threading.get_ident()})
+        self.assertIsNotNone(channel.first_frame_after)
+
+        channel.set_value(channel.FORWARD, True)
+        self.assertTrue(self.process_until(lambda: channel.get_value(channel.SPEED) > 0))
+        self.assertGreater(self.car.model.speed, 0)
+        channel.deactivate()
+        self.assertEqual(channel.status, channel.DISCONNECTED)
+
+    def test_axes_are_streamed(self):
+        axes = DriveAxes()
+        channel, outcomes = self.connect(axes=axes)
+        axes.set(throttle=0.5)
+        self.assertTrue(self.process_until(lambda: self.car.commands.get(channel.THROTTLE) == 0.5))
+        self.assertTrue(self.process_until(lambda: channel.get_value(channel.SPEED) > 0))
+
+    def test_rejected(self):
+        channel, outcomes = self.connect(password='wrong')
+        self.assertEqual(outcomes, [False])
+        self.assertFalse(channel.granted)
+        self.assertEqual(channel.status, channel.DISCONNECTED)
+
+    def test_unreachable(self):
+        server = socket(AF_INET, SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        server.close()
+        channel, outcomes = self.connect(port=port)
+        self.assertEqual(outcomes, [False])
+        self.assertTrue(channel.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from os import path
+
+import rc_controller
+from simulator import Simulator
+from test_simulator import wait_for
+
+
+class TestRcController(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = Simulator(1, port=0, password='secret', rate=50, seed=1)
+        self.addCleanup(self.simulator.stop)
+        self.car = self.simulator.cars[0]
+
+    def main(self, *arguments, password='secret'):
+        output = io.StringIO()
+        options = ['--host', '127.0.0.1', '--port', str(self.simulator.ports()[0]), '--password', password]
+        code = rc_controller.main(options + list(arguments), output)
+        return code, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_connect(self):
+        code, records = self.main('connect')
+        self.assertEqual(code, 0)
+        self.assertEqual(records, [{'event': 'connected', 'codec': 'BIN1', 'status': 'connected'}])
+
+    def test_rejected_password(self):
+        code, records = self.main('connect', password='wrong')
+        self.assertEqual(code, rc_controller.EXIT_FAILED)
+        self.assertEqual(records, [{'event': 'rejected'}])
+
+    def test_send(self):
+        code, records = self.main('send', 'lights=true')
+        self.assertEqual(code, 0)
+        self.assertEqual(records[-1]['values'], {'lights': True})
+        self.assertTrue(wait_for(lambda: self.car.commands.get('lights') is True))
+
+    def test_send_rejects_unknown_keys(self):
+        code, records = self.main('send', 'warp=9')
+        self.assertEqual(code, rc_controller.EXIT_FAILED)
+        self.assertEqual(records[-1]['event'], 'error')
+
+    def test_stream(self):
+        code, records = self.main('stream', '--keys', 'speed', 'line', '--count', '3', '--duration', '0.3')
+        self.assertEqual(code, 0)
+        self.assertTrue(any(record['values'].get('line') is True for record in records))
+        for record in records:
+            self.assertLessEqual(set(record['values']), {'speed', 'line'})
+
+    def test_run_releases_the_drive_keys(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        script = path.join(directory.name, 'maneuver.txt')
+        with open(script, 'w') as file:
+            file.write('# drive until moving\nforward=true\nuntil speed > 0 within 5\nwait 0.05\n')
+        code, records = self.main('run', script)
+        self.assertEqual(code, 0)
+        self.assertEqual([record['event'] for record in records], ['step', 'step', 'step', 'finished'])
+        self.assertTrue(wait_for(lambda: self.car.commands.get('forward') is False))
+
+    def test_run_times_out(self):
+        channel = rc_controller.connect(rc_controller.parse_arguments(
+            ['--host', '127.0.0.1', '--port', str(self.simulator.ports()[0]), '--password', 'secret', 'connect']
+        ))
+        self.addCleanup(channel.deactivate)
+        with self.assertRaises(rc_controller.ScriptError) as raised:
+            rc_controller.run_script(channel, ['forward=true', 'until speed < 0 within 0.1'], io.StringIO())
+        self.assertEqual(raised.exception.exit_code, rc_controller.EXIT_TIMED_OUT)
+        self.assertTrue(wait_for(lambda: self.car.commands.get('forward') is False))
+
+    def test_play_drives_and_stops(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        macro = path.join(directory.name, 'drive.json')
+        with open(macro, 'w') as file:
+            json.dump({'version': 1, 'events': [[0.0, 'press', 'w'], [0.5, 'release', 'w']]}, file)
+        code, records = self.main('play', macro)
+        self.assertEqual(code, 0)
+        self.assertEqual(records[-1]['event'], 'finished')
+        self.assertEqual(records[-1]['events'], 2)
+        self.assertGreater(self.car.model.y, 0)
+        self.assertTrue(wait_for(lambda: self.car.commands.get('throttle') == 0.0))
+        self.assertIs(self.car.commands.get('forward'), False)
+
+
+class TestImports(unittest.TestCase):
+
+    def test_no_user_interface_is_imported(self):
+        source = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'src')
+        loaded = subprocess.check_output([
+            sys.executable, '-c', 'import sys, rc_controller; print(" ".join(sorted(sys.modules)))'
+        ], cwd=source).decode().split()
+        for module in ('PyQt5', 'tkinter', 'numpy', 'main_window', 'main_window_qt'):
+            self.assertNotIn(module, loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from channel import Channel
+from recorder import FlightRecorder, FlightLog, Replay
+from simulator import CarServer
+from transport import LoopbackTransport
+
+
+def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+class TestFlightRecorder(unittest.TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'session.rcfr')
+
+    def test_records_span_segments(self):
+        recorder = FlightRecorder(self.path, segment_size=256)
+        for index in range(50):
+            recorder.telemetry([{Channel.SPEED: index, Channel.LINE: index % 2 == 0}])
+            recorder.command({Channel.FORWARD: True, 'extra': [index]})
+        recorder.close()
+        self.assertTrue(os.path.exists(FlightRecorder.segment_path(self.path, 3)))
+        self.assertLessEqual(os.path.getsize(FlightRecorder.segment_path(self.path, 0)), 256)
+
+        log = FlightLog(FlightRecorder.segment_path(self.path, 0))
+        self.assertEqual(len(log.records), 100)
+        self.assertEqual(log.records[-2][1:], (FlightRecorder.TELEMETRY, {Channel.SPEED: 49, Channel.LINE: False}))
+        self.assertEqual(log.records[-1][1:], (FlightRecorder.COMMAND, {Channel.FORWARD: True, 'extra': [49]}))
+        times = [seconds for seconds, _, _ in log.records]
+        self.assertEqual(times, sorted(times))
+
+    def test_frames_that_do_not_encode(self):
+        recorder = FlightRecorder(self.path)
+        recorder.telemetry([{Channel.SPEED: float('nan')}, {Channel.DISTANCE: 1e12}])
+        recorder.command({Channel.HORN: True, 'extra': object()})
+        recorder.command({Channel.HORN: False})
+        recorder.close()
+
+        records = [frame for _, _, frame in FlightLog(self.path).records]
+        self.assertEqual(records[1:], [{Channel.DISTANCE: 1e12}, {Channel.HORN: False}])
+        self.assertNotEqual(records[0][Channel.SPEED], records[0][Channel.SPEED])
+
+    def test_channel_records_the_session(self):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=200)
+        self.addCleanup(car.stop)
+        channel = Channel(None, None, 'secret', transport=transport, recorder=FlightRecorder(self.path))
+        channel.set_value(Channel.LIGHTS, True)
+        self.assertTrue(wait_for(lambda: channel.snapshot().version > 10))
+        channel.deactivate()
+
+        kinds = [kind for _, kind, _ in FlightLog(self.path).records]
+        self.assertEqual(kinds.count(FlightRecorder.COMMAND), 1)
+        self.assertGreater(kinds.count(FlightRecorder.TELEMETRY), 10)
+
+    def test_replay(self):
+        recorder = FlightRecorder(self.path)
+        for index in range(100):
+            recorder.telemetry([{Channel.SPEED: index}])
+        recorder.close()
+
+        replay = Replay(self.path, speed=None)
+        self.addCleanup(replay.stop)
+        channel = replay.connect()
+        self.addCleanup(channel.deactivate)
+        self.assertTrue(replay.finished.wait(2))
+        self.assertTrue(wait_for(lambda: channel.get_value(Channel.SPEED) == 99))
+
+        # Slow enough for the first frame to stay on
+        replay.speed = 1e-6
+        replay.seek(0)
+        self.assertTrue(wait_for(lambda: channel.get_value(Channel.SPEED) == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
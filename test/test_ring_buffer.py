@@ -0,0 +1,84 @@
+import os
+import unittest
+
+try:
+    import numpy as np
+    from ring_buffer import RingBuffer, decimate
+except ImportError:
+    np = None
+
+try:
+    from PyQt5.QtWidgets import QApplication
+    from plot_qt import TimeSeriesPlot
+except ImportError:
+    TimeSeriesPlot = None
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestRingBuffer(unittest.TestCase):
+
+    def test_window_is_chronological_after_wrapping(self):
+        buffer = RingBuffer(8)
+        for index in range(20):
+            buffer.append(index, index * 10)
+        self.assertEqual(len(buffer), 8)
+        times, values = buffer.window(0)
+        self.assertEqual(list(times), list(range(12, 20)))
+        self.assertEqual(list(values), [index * 10 for index in range(12, 20)])
+
+    def test_window_starts_with_the_last_sample_before_it(self):
+        buffer = RingBuffer(100)
+        for index in range(10):
+            buffer.append(index, index)
+        times, _ = buffer.window(6.5)
+        self.assertEqual(list(times), [6, 7, 8, 9])
+        buffer.clear()
+        self.assertEqual(len(buffer.window(0)[0]), 0)
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestDecimate(unittest.TestCase):
+
+    def test_columns_hold_the_extremes(self):
+        times = np.arange(1000) / 100
+        values = np.sin(times * 7) * 10
+        low, high = decimate(times, values, 0, 10, 10)
+        for column in range(10):
+            inside = values[column * 100:(column + 1) * 100]
+            entering = values[column * 100 - 1] if column else inside[0]
+            self.assertAlmostEqual(low[column], min(inside.min(), entering))
+            self.assertAlmostEqual(high[column], max(inside.max(), entering))
+
+    def test_empty_columns_hold_the_last_value(self):
+        low, high = decimate(np.array([1.0, 5.5]), np.array([3.0, 7.0]), 0, 10, 10)
+        self.assertTrue(np.isnan(low[0]))
+        self.assertEqual(list(low[1:]), [3, 3, 3, 3, 3, 7, 7, 7, 7])
+        self.assertEqual(list(high[1:]), [3, 3, 3, 3, 7, 7, 7, 7, 7])
+
+    def test_nan_samples_leave_gaps(self):
+        low, high = decimate(np.array([0.5, 1.5, 2.5]), np.array([4.0, np.nan, np.nan]), 0, 3, 3)
+        self.assertEqual(low[0], 4)
+        self.assertEqual(high[1], 4)
+        self.assertTrue(np.isnan(low[2]))
+
+
+@unittest.skipIf(TimeSeriesPlot is None, 'PyQt5, or NumPy is not installed')
+class TestTimeSeriesPlot(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        cls.application = QApplication.instance() or QApplication([])
+
+    def test_every_frame_is_a_sample(self):
+        plot = TimeSeriesPlot('speed', 'Speed', 'cm/s', 100)
+        self.addCleanup(plot.deleteLater)
+        plot.feed([{'speed': 4}, {'speed': 4}, {'line': True}, {'speed': 6}], 10.0)
+        times, values = plot.buffer.window(0)
+        self.assertEqual(list(times), [10.0] * 4)
+        self.assertEqual(values[[0, 1, 3]].tolist(), [4, 4, 6])
+        self.assertTrue(np.isnan(values[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
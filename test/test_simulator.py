@@ -0,0 +1,99 @@
+import unittest
+from random import Random
+from time import sleep
+
+from channel import Channel
+from codec import BinaryCodec, JsonCodec
+from simulator import CarModel, CarServer, DelayLine, Simulator
+from transport import LoopbackTransport
+
+
+def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+class TestCarModel(unittest.TestCase):
+
+    def test_distance_keeping_stops_before_the_obstacle(self):
+        model = CarModel(obstacles=[(CarModel.TRACK_RADIUS, 100.0, 10.0)])
+        self.assertAlmostEqual(model.distance(), 90.0)
+        for _ in range(200):
+            model.step({Channel.FORWARD: True, Channel.DISTANCE_KEEPING: True}, 0.05)
+        self.assertEqual(model.speed, 0.0)
+        self.assertAlmostEqual(model.distance(), CarModel.KEEP_DISTANCE, delta=1.0)
+
+    def test_never_drives_into_anything(self):
+        model = CarModel(obstacles=[(CarModel.TRACK_RADIUS, 100.0, 10.0)])
+        for _ in range(200):
+            model.step({Channel.FORWARD: True}, 0.05)
+        self.assertGreaterEqual(model.distance(), 0.0)
+        self.assertLess(model.y, 90.0)
+
+    def test_line_following_stays_on_the_line(self):
+        model = CarModel(obstacles=[])
+        on_line = 0
+        for _ in range(400):
+            model.step({Channel.FORWARD: True, Channel.LINE_FOLLOWING: True}, 0.05)
+            on_line += model.on_line()
+        self.assertGreater(on_line, 350)
+
+
+class TestDelayLine(unittest.TestCase):
+
+    def test_order_is_kept_despite_jitter(self):
+        line = DelayLine(0.1, 0.05, Random(1))
+        for index in range(50):
+            line.put(index, index * 0.001)
+        self.assertEqual(line.pop_due(0.04), [])
+        self.assertEqual(line.pop_due(1.0), list(range(50)))
+        self.assertIsNone(line.next_due())
+
+
+class TestCarServer(unittest.TestCase):
+
+    def serve(self, **options):
+        transport = LoopbackTransport()
+        car = CarServer(transport, 'secret', rate=100, seed=1, **options)
+        self.addCleanup(car.stop)
+        channel = Channel(None, None, 'secret', transport=transport)
+        self.addCleanup(channel.deactivate)
+        return car, channel
+
+    def test_negotiated_session(self):
+        car, channel = self.serve()
+        self.assertIs(channel.codec, BinaryCodec)
+        self.assertTrue(wait_for(lambda: channel.get_value(Channel.LINE) is True))
+        channel.set_value(Channel.FORWARD, True)
+        self.assertTrue(wait_for(lambda: channel.get_value(Channel.SPEED) > 0))
+        self.assertTrue(wait_for(lambda: channel.latency()['telemetry']['count'] > 0))
+
+    def test_legacy_session(self):
+        car, channel = self.serve(legacy=True)
+        self.assertIs(channel.codec, JsonCodec)
+        self.assertTrue(wait_for(lambda: channel.snapshot().version > 10))
+
+    def test_lost_frames_do_not_stall_the_window(self):
+        car, channel = self.serve(loss=0.5, latency=0.01, jitter=0.005)
+        self.assertTrue(wait_for(lambda: channel.snapshot().version > 20))
+
+
+class TestSimulator(unittest.TestCase):
+
+    def test_many_cars(self):
+        simulator = Simulator(3, port=0, password='secret', rate=50, seed=1)
+        self.addCleanup(simulator.stop)
+        channels = [Channel('127.0.0.1', port, 'secret') for port in simulator.ports()]
+        for channel in channels:
+            self.addCleanup(channel.deactivate)
+        channels[1].set_value(Channel.FORWARD, True)
+        self.assertTrue(wait_for(lambda: simulator.cars[1].model.speed > 0))
+        self.assertEqual(simulator.cars[0].model.speed, 0.0)
+        self.assertTrue(all(wait_for(lambda: channel.snapshot().version > 0) for channel in channels))
+
+
+if __name__ == '__main__':
+    unittest.main()
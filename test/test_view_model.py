@@ -0,0 +1,52 @@
+import unittest
+
+from protocol import TelemetrySnapshot
+from view_model import ViewModel
+
+
+class TestViewModel(unittest.TestCase):
+
+    def test_first_render_has_every_element(self):
+        changes = ViewModel().render(TelemetrySnapshot())
+        self.assertEqual(set(changes), set(ViewModel.SWITCHES) | set(ViewModel.GAUGES))
+        self.assertFalse(changes[ViewModel.LIGHTS])
+        self.assertEqual(changes[ViewModel.DISTANCE], (False, ViewModel.NORMAL))
+
+    def test_steady_state_renders_nothing(self):
+        view_model = ViewModel()
+        values = {ViewModel.SPEED: 12, ViewModel.DISTANCE: 40, ViewModel.LIGHTS: True}
+        view_model.render(TelemetrySnapshot(1, values))
+        self.assertEqual(view_model.render(TelemetrySnapshot(2, values)), dict())
+        # Keys no element shows do not change the view either
+        self.assertEqual(view_model.render(TelemetrySnapshot(3, dict(values, distance_keeping=True))), dict())
+
+    def test_only_changes_are_rendered(self):
+        view_model = ViewModel()
+        view_model.render(TelemetrySnapshot(1, {ViewModel.SPEED: 12, ViewModel.DISTANCE: 40}))
+        changes = view_model.render(TelemetrySnapshot(2, {ViewModel.SPEED: 25, ViewModel.DISTANCE: 40,
+                                                          ViewModel.FORWARD: True}))
+        self.assertEqual(changes, {ViewModel.SPEED: (25, ViewModel.WARNING), ViewModel.FORWARD: True})
+
+        view_model.reset()
+        self.assertEqual(len(view_model.render(TelemetrySnapshot(3))), len(view_model.view))
+
+    def test_levels(self):
+        self.assertEqual(ViewModel.distance_level(False), ViewModel.NORMAL)
+        self.assertEqual(ViewModel.distance_level(5), ViewModel.DANGER)
+        self.assertEqual(ViewModel.distance_level(10), ViewModel.WARNING)
+        self.assertEqual(ViewModel.distance_level(25), ViewModel.NORMAL)
+        self.assertEqual(ViewModel.speed_level(20), ViewModel.NORMAL)
+        self.assertEqual(ViewModel.speed_level(21), ViewModel.WARNING)
+        self.assertEqual(ViewModel.speed_level(31), ViewModel.DANGER)
+        self.assertEqual(ViewModel.distance_level(40, time_to_collision=0.5), ViewModel.DANGER)
+        self.assertEqual(ViewModel.distance_level(40, time_to_collision=1.5), ViewModel.WARNING)
+
+    def test_levels_are_left_with_hysteresis(self):
+        self.assertEqual(ViewModel.distance_level(27), ViewModel.NORMAL)
+        self.assertEqual(ViewModel.distance_level(27, previous=ViewModel.WARNING), ViewModel.WARNING)
+        self.assertEqual(ViewModel.distance_level(31, previous=ViewModel.WARNING), ViewModel.NORMAL)
+        self.assertEqual(ViewModel.distance_level(11, previous=ViewModel.DANGER), ViewModel.DANGER)
+
+
+if __name__ == '__main__':
+    unittest.main()